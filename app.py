@@ -1,22 +1,43 @@
-import io
-from datetime import date
-from urllib.request import urlopen
+import os
+import tempfile
+from datetime import date, timedelta
 
+import altair as alt
 import pandas as pd
 import streamlit as st
 
 from marcenaria.migrations import init_database
 from marcenaria.db_connector import test_db_connection, get_db_connection
 from marcenaria import data_access as da
-from marcenaria.config import ETAPAS_PRODUCAO, STATUS_ETAPA
+from marcenaria import cartoes
+from marcenaria import notificacoes
+from marcenaria import exportacao
+from marcenaria import pdf_orcamento
+from marcenaria import analytics
+from marcenaria import previsao
+from marcenaria import agenda
+from marcenaria import gantt
+from marcenaria import corte
+from marcenaria import materiais
+from marcenaria import catalogo
+from marcenaria import rotas
+from marcenaria.config import ETAPAS_PRODUCAO, ETAPAS_KANBAN_EXCLUIR, STATUS_ETAPA, LOGO_URL
+from marcenaria.formatacao import (
+    brl,
+    fmt_date_br,
+    fmt_dt_br,
+    brl_serie,
+    data_br_serie,
+)
 
 APP_TITLE = "Mamede Móveis Projetados | Sistema Interno"
-LOGO_URL = "https://i.ibb.co/FkXDym6H/logo-mamede.png"
 
 # Remove do Kanban
-ETAPAS_KANBAN_EXCLUIR = {"Expedição", "Transporte"}
 ETAPAS_PRODUCAO_UI = [e for e in ETAPAS_PRODUCAO if e not in ETAPAS_KANBAN_EXCLUIR]
 
+# Linha do tempo paginada
+TIMELINE_POR_PAGINA = 15
+
 st.set_page_config(page_title=APP_TITLE, layout="wide", initial_sidebar_state="expanded")
 
 # Força tema claro sempre
@@ -41,55 +62,27 @@ window.parent.postMessage({ type: "streamlit:setTheme", theme: theme }, "*");
 # =========================
 # HELPERS
 # =========================
-def _try_fetch_bytes(url: str, timeout: int = 10):
-    try:
-        with urlopen(url, timeout=timeout) as r:
-            return r.read()
-    except Exception:
-        return None
-
-
-def safe_float(x, default=0.0):
-    try:
-        return float(x)
-    except Exception:
-        return default
-
-
-def brl(v):
-    try:
-        return f"R$ {float(v):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    except Exception:
-        return "R$ 0,00"
-
-
-def fmt_date_br(x):
-    if x is None or x == "":
-        return ""
-    try:
-        dt = pd.to_datetime(x, errors="coerce")
-        if pd.isna(dt):
-            return str(x)
-        return dt.strftime("%d/%m/%Y")
-    except Exception:
-        return str(x)
+def now_ts_utc():
+    # timezone-aware sempre (evita erro com TIMESTAMPTZ)
+    return pd.Timestamp.now(tz="UTC")
 
 
-def fmt_dt_br(x):
-    if x is None or x == "":
-        return ""
-    try:
-        dt = pd.to_datetime(x, errors="coerce")
-        if pd.isna(dt):
-            return str(x)
-        return dt.strftime("%d/%m/%Y %H:%M")
-    except Exception:
-        return str(x)
+def versao_vista(chave: str, registro_id, atual):
+    """
+    Versão do registro quando ele foi carregado em `chave` (a tela/editor). Fica
+    guardada nos reruns seguintes até esquecer_versao ou até outro registro ser
+    carregado ali. Vai para as escritas do da.*.
+    """
+    k = f"_versao_{chave}"
+    guardada = st.session_state.get(k)
+    if guardada is None or guardada[0] != registro_id:
+        guardada = st.session_state[k] = (registro_id, atual)
+    return guardada[1]
 
 
-def now_ts_utc():
-    # timezone-aware sempre (evita erro com TIMESTAMPTZ)
-    return pd.Timestamp.now(tz="UTC")
+def esquecer_versao(chave: str):
+    # depois de gravar, ou de recarregar num conflito: o próximo render pega a versão do banco
+    st.session_state.pop(f"_versao_{chave}", None)
 
 
 def can(perfis):
@@ -400,96 +393,14 @@ def filter_by_month(rows, date_col="created_at"):
     return out
 
 
-# =========================
-# PDF ORÇAMENTO
-# =========================
-def gerar_pdf_orcamento_bytes(orcamento_id: int) -> bytes:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.units import mm
-    from reportlab.lib.utils import ImageReader
-
-    orc = da.obter_orcamento_por_id(int(orcamento_id))
-    if not orc:
-        raise ValueError("Orçamento não encontrado.")
-
-    itens = da.listar_orcamento_itens(int(orcamento_id)) or []
-    df_it = pd.DataFrame(itens) if itens else pd.DataFrame(columns=["descricao", "qtd", "unidade", "valor_unit"])
-
-    total = 0.0
-    for _, r in df_it.iterrows():
-        total += safe_float(r.get("qtd"), 0) * safe_float(r.get("valor_unit"), 0)
-
-    logo_bytes = _try_fetch_bytes(LOGO_URL, timeout=10)
-
-    buf = io.BytesIO()
-    c = canvas.Canvas(buf, pagesize=A4)
-    w, h = A4
-
-    c.setFillColorRGB(0.95, 0.95, 0.98)
-    c.rect(0, h - 42 * mm, w, 42 * mm, stroke=0, fill=1)
-
-    if logo_bytes:
-        try:
-            img = ImageReader(io.BytesIO(logo_bytes))
-            c.drawImage(img, 14 * mm, h - 34 * mm, width=28 * mm, height=28 * mm, mask="auto")
-        except Exception:
-            pass
-
-    c.setFillColorRGB(0.06, 0.09, 0.16)
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(46 * mm, h - 18 * mm, "ORÇAMENTO")
-    c.setFont("Helvetica", 10)
-    c.setFillColorRGB(0.25, 0.32, 0.42)
-    c.drawString(46 * mm, h - 26 * mm, f"Código: {orc.get('codigo', '-')}")
-    c.drawString(46 * mm, h - 32 * mm, f"Status: {orc.get('status', '-')}")
-    c.drawRightString(w - 14 * mm, h - 18 * mm, f"Cliente: {orc.get('cliente_nome','-')}")
-
-    y = h - 55 * mm
-    c.setFillColorRGB(0.08, 0.10, 0.14)
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(14 * mm, y, "Itens")
-    y -= 7 * mm
-
-    c.setFillColorRGB(0.95, 0.95, 0.96)
-    c.rect(14 * mm, y - 5 * mm, w - 28 * mm, 8 * mm, stroke=0, fill=1)
-    c.setFillColorRGB(0.08, 0.10, 0.14)
-    c.setFont("Helvetica-Bold", 9)
-    c.drawString(16 * mm, y, "Descrição")
-    c.drawRightString(w - 70 * mm, y, "Qtd")
-    c.drawRightString(w - 48 * mm, y, "Unid")
-    c.drawRightString(w - 14 * mm, y, "Vlr Unit")
-    y -= 8 * mm
-
-    c.setFont("Helvetica", 9)
-
-    if df_it.empty:
-        c.drawString(16 * mm, y, "Sem itens cadastrados.")
-        y -= 6 * mm
-    else:
-        for _, r in df_it.iterrows():
-            if y < 25 * mm:
-                c.showPage()
-                y = h - 20 * mm
-                c.setFont("Helvetica", 9)
-            c.drawString(16 * mm, y, str(r.get("descricao") or "")[:70])
-            c.drawRightString(w - 70 * mm, y, str(r.get("qtd") or 0))
-            c.drawRightString(w - 48 * mm, y, str(r.get("unidade") or "")[:8])
-            c.drawRightString(w - 14 * mm, y, brl(r.get("valor_unit") or 0))
-            y -= 6 * mm
-
-    y -= 4 * mm
-    c.setFillColorRGB(0.91, 0.76, 0.31)
-    c.setFont("Helvetica-Bold", 12)
-    c.drawRightString(w - 14 * mm, y, f"Total estimado: {brl(total)}")
-
-    c.setFillColorRGB(0.35, 0.42, 0.52)
-    c.setFont("Helvetica", 8)
-    c.drawString(14 * mm, 12 * mm, "Mamede Móveis Projetados. Orçamento gerado pelo sistema interno.")
-
-    c.showPage()
-    c.save()
-    return buf.getvalue()
+def filter_df_by_month(df: pd.DataFrame, date_col="created_at") -> pd.DataFrame:
+    # mesma regra do filter_by_month, para DataFrames (vetorizado)
+    month = st.session_state.get("flt_month", "Todos")
+    year = st.session_state.get("flt_year", None)
+    if month == "Todos" or not year or df.empty:
+        return df
+    dt = pd.to_datetime(df[date_col], errors="coerce")
+    return df[(dt.dt.month == int(month)) & (dt.dt.year == int(year))]
 
 
 # =========================
@@ -518,12 +429,9 @@ def excluir_orcamento_db(orcamento_id: int):
 # =========================
 # HISTÓRICO ETAPAS + ANALYTICS
 # =========================
-def fetch_hist_for_pedidos(pedido_ids: list[int]):
-    if not pedido_ids:
-        return []
-
-    placeholders = ",".join(["%s"] * len(pedido_ids))
-    sql = f"""
+def fetch_hist_for_pedidos(pedido_ids: list[int]) -> pd.DataFrame:
+    # leitura colunar: o DataFrame sai direto das colunas, sem dict por linha
+    return da.fetch_dataframe("""
         SELECT
             e.id,
             e.pedido_id,
@@ -537,16 +445,15 @@ def fetch_hist_for_pedidos(pedido_ids: list[int]):
             e.created_at
         FROM bd_marcenaria.producao_etapas e
         LEFT JOIN bd_marcenaria.funcionarios f ON f.id = e.responsavel_id
-        WHERE e.pedido_id IN ({placeholders})
+        WHERE e.pedido_id = ANY(%s)
         ORDER BY e.pedido_id ASC, COALESCE(e.inicio_em, e.created_at) ASC, e.id ASC
-    """
+    """, ([int(i) for i in (pedido_ids or [])],))
 
-    with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, pedido_ids)
-            cols = [d[0] for d in cur.description]
-            rows = cur.fetchall() or []
-            return [dict(zip(cols, r)) for r in rows]
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_hist_pedido(pedido_id: int):
+    # acessor por pedido (com cache) para a linha do tempo sob demanda
+    return fetch_hist_for_pedidos([int(pedido_id)])
 
 
 def _nice_days(d):
@@ -562,18 +469,17 @@ def _nice_days(d):
     return f"{int(round(d))}d"
 
 
-def compute_etapa_stats(pedidos_rows: list[dict]):
+def compute_etapa_stats(pedido_ids: list[int]):
     """
     CORREÇÃO: tudo UTC timezone-aware, fim_eff - ini_eff não quebra.
     """
     agora = now_ts_utc()
 
-    ids = [int(p.get("id")) for p in (pedidos_rows or []) if p.get("id") is not None]
-    hist = fetch_hist_for_pedidos(ids)
-    if not hist:
+    if not len(pedido_ids):
+        return {}, {}
+    df = fetch_hist_for_pedidos(pedido_ids)
+    if df.empty:
         return {}, {}
-
-    df = pd.DataFrame(hist)
 
     for c in ["inicio_em", "fim_em", "created_at"]:
         if c in df.columns:
@@ -587,6 +493,8 @@ def compute_etapa_stats(pedidos_rows: list[dict]):
     df["dur_days"] = df["dur_days"].clip(lower=0)
     df["is_open"] = df["fim_em"].isna()
 
+    # percentis vêm do histórico geral (12 meses), não só dos pedidos filtrados
+    limiares = analytics.limiares_por_etapa(fetch_percentis_etapas())
     stats = {}
     for etapa, g in df.groupby("etapa"):
         g_closed = g[~g["is_open"]]
@@ -600,6 +508,7 @@ def compute_etapa_stats(pedidos_rows: list[dict]):
             "avg_all": avg_all,
             "open_days_sum": open_days_sum,
             "open_count": open_count,
+            **limiares.get(etapa, {}),
         }
 
     pedido_current = {}
@@ -614,7 +523,40 @@ def compute_etapa_stats(pedidos_rows: list[dict]):
     return stats, pedido_current
 
 
-def semaforo_class(days_open: float | None, avg_days: float | None):
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_percentis_etapas(meses: int = 12):
+    return analytics.percentis_etapas(meses)
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def fetch_previsoes(marcador):
+    # `marcador` (da.marcador_producao) muda a cada movimentação: recalcula só aí
+    return previsao.prever_entregas()
+
+
+def previsao_badge(prev: dict | None):
+    if not prev or pd.isna(prev.get("dias_p50")):
+        return "", "Sem previsão"
+    txt = f"Previsão {fmt_date_br(prev['data_p50'])} (p90 {fmt_date_br(prev['data_p90'])})"
+    risco = prev.get("prob_atraso")
+    if risco is None or pd.isna(risco):
+        return "", txt
+    txt += f" • risco de atraso {risco:.0%}"
+    if risco < 0.2:
+        return "ok", txt
+    if risco < 0.5:
+        return "warn", txt
+    return "bad", txt
+
+
+def semaforo_class(days_open: float | None, avg_days: float | None, p75: float | None = None, p90: float | None = None):
+    # com amostra suficiente: até p75 no ritmo, até p90 atenção, acima gargalo
+    if days_open is not None and p75 and p90:
+        if days_open <= p75:
+            return "sem-green", "🟢 No ritmo"
+        if days_open <= p90:
+            return "sem-yellow", "🟡 Atenção"
+        return "sem-red", "🔴 Gargalo"
     if days_open is None or avg_days is None or avg_days <= 0:
         return "sem-gray", "⚪ Sem base"
     if days_open <= avg_days:
@@ -642,6 +584,9 @@ def render_gargalos_panel(stats: dict):
                 "Dias acumulados em andamento": round(s["open_days_sum"], 2),
                 "Média fechados (dias)": None if s["avg_closed"] is None else round(s["avg_closed"], 2),
                 "Média geral (dias)": None if s["avg_all"] is None else round(s["avg_all"], 2),
+                "p50 (dias)": None if s.get("p50") is None else round(s["p50"], 2),
+                "p75 (dias)": None if s.get("p75") is None else round(s["p75"], 2),
+                "p90 (dias)": None if s.get("p90") is None else round(s["p90"], 2),
             }
         )
 
@@ -655,15 +600,83 @@ def render_gargalos_panel(stats: dict):
         st.dataframe(show, use_container_width=True, hide_index=True)
 
     with c2:
-        st.markdown("**📌 Médias por etapa**")
-        show2 = df.sort_values("Etapa")[["Etapa", "Média fechados (dias)", "Média geral (dias)"]]
+        st.markdown("**📌 Tempo por etapa**")
+        show2 = df.sort_values("Etapa")[["Etapa", "p50 (dias)", "p75 (dias)", "p90 (dias)", "Média fechados (dias)"]]
         st.dataframe(show2, use_container_width=True, hide_index=True)
 
-    st.caption("Semáforo usa média dos eventos fechados; se não tiver, usa média geral.")
+    st.caption(
+        f"Semáforo: até o p75 da etapa no ritmo, até o p90 atenção, acima disso gargalo "
+        f"(etapas fechadas nos últimos 12 meses, mínimo {analytics.MIN_AMOSTRAS}). "
+        "Sem amostra suficiente, usa a média: até 1,5× atenção."
+    )
+    render_percentis_detalhe()
+    st.markdown("</div>", unsafe_allow_html=True)
+
+
+def render_percentis_detalhe():
+    perc = fetch_percentis_etapas()
+    if perc.empty:
+        return
+
+    cols = {"n": "Amostras", "p50": "p50", "p75": "p75", "p90": "p90", "p95": "p95"}
+    with st.expander("📐 Percentis por responsável e por mês (dias)"):
+        t1, t2 = st.tabs(["Por responsável", "Por mês"])
+        with t1:
+            r = perc[perc["dimensao"] == "responsavel"].copy()
+            r["Responsável"] = r["responsavel_nome"].fillna("(sem responsável)")
+            r = r.rename(columns={"etapa": "Etapa", **cols})
+            st.dataframe(
+                r[["Etapa", "Responsável", *cols.values()]].round(2),
+                use_container_width=True, hide_index=True,
+            )
+        with t2:
+            m = perc[perc["dimensao"] == "mes"].copy()
+            m["Mês"] = m["mes"].dt.strftime("%m/%Y")
+            m = m.sort_values(["etapa", "mes"]).rename(columns={"etapa": "Etapa", **cols})
+            st.dataframe(
+                m[["Etapa", "Mês", *cols.values()]].round(2),
+                use_container_width=True, hide_index=True,
+            )
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_serie_mensal(meses: int = 24):
+    return da.serie_mensal(meses)
+
+
+def render_tendencia_mensal(meses: int = 24):
+    st.markdown('<div class="cardx" style="margin-top:14px;">', unsafe_allow_html=True)
+    st.subheader(f"📈 Tendência dos últimos {meses} meses")
+
+    df = fetch_serie_mensal(meses)
+    if df.empty or not df[["orcamentos", "pedidos", "entregues"]].to_numpy().any():
+        st.info("Sem movimento no período.")
+        st.markdown("</div>", unsafe_allow_html=True)
+        return
+
+    df = df.set_index(df["mes"].dt.strftime("%m/%Y").rename("Mês"))
+
+    c1, c2 = st.columns(2)
+    with c1:
+        st.markdown("**🧾 Criados por mês**")
+        st.bar_chart(df[["orcamentos", "pedidos"]].rename(columns={"orcamentos": "Orçamentos", "pedidos": "Pedidos"}), stack=False)
+    with c2:
+        st.markdown("**💰 Valor por mês (R$)**")
+        st.line_chart(df[["valor_orcamentos", "valor_pedidos"]].rename(columns={"valor_orcamentos": "Orçamentos", "valor_pedidos": "Pedidos"}))
+
+    c3, c4 = st.columns(2)
+    with c3:
+        st.markdown("**🚚 Pedidos entregues**")
+        st.bar_chart(df[["entregues"]].rename(columns={"entregues": "Entregues"}))
+    with c4:
+        st.markdown("**⏱️ Lead time médio (dias, criação → entrega)**")
+        st.line_chart(df[["lead_time_dias"]].rename(columns={"lead_time_dias": "Lead time"}))
+
+    st.caption(f"Entregue = {ETAPAS_PRODUCAO[-1]} marcada como Concluído (ou pedido com status Entregue). Atualiza a cada 5 minutos.")
     st.markdown("</div>", unsafe_allow_html=True)
 
 
-def render_timeline_pedidos(rows, etapa_stats: dict, pedido_current: dict):
+def render_timeline_pedidos(rows, etapa_stats: dict, pedido_current: dict, q_lista=None):
     st.markdown('<div class="cardx" style="margin-top:14px;">', unsafe_allow_html=True)
     st.subheader("⏳ Linha do tempo dos pedidos (andamento e prazo de entrega)")
 
@@ -682,38 +695,41 @@ def render_timeline_pedidos(rows, etapa_stats: dict, pedido_current: dict):
     )
 
     base_rows = rows
-    if q:
-        ql = q.strip().lower()
-
-        def _match(r):
-            base = " ".join(
-                [
-                    str(r.get("codigo", "")),
-                    str(r.get("cliente_nome", "")),
-                    str(r.get("etapa_atual", "")),
-                    str(r.get("status_etapa", "")),
-                    str(r.get("responsavel_nome", "")),
-                ]
-            ).lower()
-            return ql in base
-
-        base_rows = [r for r in rows if _match(r)]
+    if q and q.strip():
+        # filtro resolvido no banco, com os mesmos filtros da lista (busca e mês)
+        month = st.session_state.get("flt_month", "Todos")
+        year = st.session_state.get("flt_year")
+        mes, ano = (int(month), int(year)) if month != "Todos" and year else (None, None)
+        base_rows = da.buscar_pedidos(q, q_lista=q_lista, mes=mes, ano=ano)
 
     if not base_rows:
         st.info("Nada encontrado nesse filtro.")
         st.markdown("</div>", unsafe_allow_html=True)
         return
 
-    def _sort_key(r):
-        return pd.to_datetime(r.get("updated_at") or r.get("created_at"), errors="coerce")
+    # ordenação vetorizada (antes era um pd.to_datetime por linha no sorted)
+    ordem = pd.to_datetime(
+        pd.Series([r.get("updated_at") or r.get("created_at") for r in base_rows]),
+        errors="coerce",
+        utc=True,
+    )
+    posicoes = ordem.sort_values(ascending=False, na_position="last").index.tolist()
+    base_rows = [base_rows[i] for i in posicoes]
+
+    total_pag = max(1, -(-len(base_rows) // TIMELINE_POR_PAGINA))
+    paginas = list(range(1, total_pag + 1))
+    pag_atual = st.session_state.get("tl_pagina", 1)
+    if pag_atual not in paginas:
+        pag_atual = 1
+    pag = st.selectbox("Página", paginas, index=paginas.index(pag_atual), key="tl_pag_sel")
+    st.session_state.tl_pagina = pag
 
-    base_rows = sorted(base_rows, key=_sort_key, reverse=True)[:60]
+    ini = (pag - 1) * TIMELINE_POR_PAGINA
+    pagina_rows = base_rows[ini:ini + TIMELINE_POR_PAGINA]
 
-    ids = [int(p.get("id")) for p in base_rows if p.get("id") is not None]
-    hist_all = fetch_hist_for_pedidos(ids)
-    dfh = pd.DataFrame(hist_all) if hist_all else pd.DataFrame()
+    previsoes = fetch_previsoes(da.marcador_producao())
 
-    for p in base_rows:
+    for p in pagina_rows:
         pid = int(p.get("id"))
         cod = p.get("codigo", "")
         cliente = p.get("cliente_nome", "")
@@ -750,44 +766,50 @@ def render_timeline_pedidos(rows, etapa_stats: dict, pedido_current: dict):
         if cur_info:
             etapa_open = cur_info.get("etapa")
             days_open = cur_info.get("days_open", 0.0)
-            avg = None
-            if etapa_open in etapa_stats:
-                avg = etapa_stats[etapa_open].get("avg_closed") or etapa_stats[etapa_open].get("avg_all")
-            sem_cls, sem_txt = semaforo_class(days_open, avg)
-            sem_detail = f"{_nice_days(days_open)} na etapa. Média {_nice_days(avg) if avg else '-'}."
+            s_et = etapa_stats.get(etapa_open, {})
+            avg = s_et.get("avg_closed") or s_et.get("avg_all")
+            p75, p90 = s_et.get("p75"), s_et.get("p90")
+            sem_cls, sem_txt = semaforo_class(days_open, avg, p75, p90)
+            if p75 and p90:
+                sem_detail = f"{_nice_days(days_open)} na etapa. p75 {_nice_days(p75)} · p90 {_nice_days(p90)}."
+            else:
+                sem_detail = f"{_nice_days(days_open)} na etapa. Média {_nice_days(avg) if avg else '-'}."
+
+        prev_badge, prev_txt = previsao_badge(previsoes.loc[pid].to_dict() if pid in previsoes.index else None)
 
         st.markdown(
-            f"""
-            <div class="cardx" style="margin:12px 0;">
-              <div style="display:flex;justify-content:space-between;gap:12px;align-items:flex-start;flex-wrap:wrap;">
-                <div>
-                  <div style="font-weight:1000;font-size:1.05rem;">📦 {cod}</div>
-                  <div class="muted">{cliente}</div>
-                  <div class="muted">Etapa <b>{etapa_atual}</b> • Status <b>{status_et}</b> • Total <b>{total}</b></div>
-                </div>
-                <div style="display:flex;gap:8px;flex-wrap:wrap;align-items:center;">
-                  <span class="kbadge">🗓️ Criado <b>{fmt_date_br(created) if not pd.isna(created) else ""}</b></span>
-                  <span class="kbadge">🔄 Atualizado <b>{fmt_date_br(updated) if not pd.isna(updated) else ""}</b></span>
-                  <span class="kbadge {prazo_badge}">🚚 {prazo_txt}</span>
-                  <span class="kbadge">⏱️ Andamento <b>{dias_andamento if dias_andamento is not None else "-"} dia(s)</b></span>
-                  <span class="sem-pill {sem_cls}">🚦 {sem_txt}</span>
-                </div>
-              </div>
-              <div class="muted" style="margin-top:8px;">{sem_detail}</div>
-            </div>
-            """,
+            cartoes.timeline_card_html(
+                {
+                    "codigo": cod,
+                    "cliente": cliente,
+                    "etapa": etapa_atual,
+                    "status": status_et,
+                    "total": total,
+                    "criado": fmt_date_br(created) if not pd.isna(created) else "",
+                    "atualizado": fmt_date_br(updated) if not pd.isna(updated) else "",
+                    "prazo_badge": prazo_badge,
+                    "prazo": prazo_txt,
+                    "andamento": dias_andamento if dias_andamento is not None else "-",
+                    "sem_cls": sem_cls,
+                    "sem_txt": sem_txt,
+                    "sem_detail": sem_detail,
+                    "prev_badge": prev_badge,
+                    "previsao": prev_txt,
+                }
+            ),
             unsafe_allow_html=True,
         )
 
-        if dfh.empty:
-            st.divider()
+        # histórico só é buscado quando o usuário abre este pedido
+        if not st.toggle("🧾 Ver linha do tempo detalhada", key=f"tl_open_{pid}"):
             continue
 
-        dfp = dfh[dfh["pedido_id"] == pid].copy()
-        if dfp.empty:
-            st.divider()
+        hist = fetch_hist_pedido(pid)
+        if hist.empty:
+            st.caption("Sem movimentações registradas para este pedido.")
             continue
 
+        dfp = hist.copy()
         for c in ["inicio_em", "fim_em", "created_at"]:
             if c in dfp.columns:
                 dfp[c] = pd.to_datetime(dfp[c], errors="coerce", utc=True)
@@ -797,50 +819,145 @@ def render_timeline_pedidos(rows, etapa_stats: dict, pedido_current: dict):
         dfp = dfp[~dfp["ini_eff"].isna()].copy()
         dfp["dur_days"] = (dfp["fim_eff"] - dfp["ini_eff"]).dt.total_seconds() / 86400.0
         dfp["dur_days"] = dfp["dur_days"].clip(lower=0)
-        dfp["is_open"] = dfp["fim_em"].isna()
-
-        with st.expander("🧾 Ver linha do tempo detalhada", expanded=False):
-            dfp = dfp.sort_values(["ini_eff", "id"])
-            for _, r in dfp.iterrows():
-                etapa = r.get("etapa") or "-"
-                status = r.get("status") or "-"
-                resp = r.get("responsavel_nome") or "Não definido"
-                ini = r.get("ini_eff")
-                fim = r.get("fim_em")
-                dur = float(r.get("dur_days") or 0.0)
-                dur_txt = _nice_days(dur)
-                obs = (r.get("observacoes") or "").strip()
-                obs_txt = obs if obs else "Sem observações."
-
-                st.markdown(
-                    f"""
-                    <div class="tl-row">
-                      <div><div class="tl-dot"></div></div>
-                      <div class="tl-box">
-                        <div style="display:flex;gap:8px;flex-wrap:wrap;align-items:center;">
-                          <span class="kbadge">🧱 <b>{etapa}</b></span>
-                          <span class="kbadge">📌 <b>{status}</b></span>
-                          <span class="kbadge">👤 <b>{resp}</b></span>
-                          <span class="kbadge">⏱️ <b>{dur_txt}</b></span>
-                          <span class="kbadge">{'🟣 Em andamento' if pd.isna(fim) else '✅ Finalizado'}</span>
-                        </div>
-                        <div class="muted" style="margin-top:6px;">
-                          Início <b>{fmt_dt_br(ini)}</b>
-                          {" • Fim <b>" + fmt_dt_br(fim) + "</b>" if not pd.isna(fim) else " • <b>Em andamento</b>"}
-                        </div>
-                        <div class="muted" style="margin-top:4px;">📝 {obs_txt}</div>
-                      </div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
 
-        st.divider()
+        dfp = dfp.sort_values(["ini_eff", "id"])
+        linhas = []
+        for r in dfp.to_dict("records"):
+            fim = r.get("fim_em")
+            obs = (r.get("observacoes") or "").strip()
+            linhas.append(
+                {
+                    "etapa": r.get("etapa") or "-",
+                    "status": r.get("status") or "-",
+                    "responsavel": r.get("responsavel_nome") or "Não definido",
+                    "duracao": _nice_days(float(r.get("dur_days") or 0.0)),
+                    "inicio": fmt_dt_br(r.get("ini_eff")),
+                    "fim": "" if pd.isna(fim) else fmt_dt_br(fim),
+                    "obs": obs if obs else "Sem observações.",
+                }
+            )
+        st.markdown(cartoes.timeline_historico_html(linhas), unsafe_allow_html=True)
 
-    st.caption("Mostrando até 60 pedidos para manter o sistema rápido.")
+    st.caption(f"Página {pag} de {total_pag} • {len(base_rows)} pedido(s) no filtro.")
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+# =========================
+# EXPORTAÇÃO (CSV/XLSX em streaming)
+# =========================
+def descartar_temporario(chave: str):
+    """Apaga o arquivo temporário guardado em st.session_state[chave] (antes de gerar outro)."""
+    arq = st.session_state.pop(chave, None)
+    if arq and os.path.exists(arq["caminho"]):
+        os.remove(arq["caminho"])
+
+
+def ler_temporario(caminho: str):
+    """
+    data= do download_button: o arquivo só é lido quando o usuário clica (fora do
+    rerun) e é apagado em seguida. Download de uso único; para baixar de novo, gere outro.
+    """
+    def ler():
+        with open(caminho, "rb") as f:
+            dados = f.read()
+        os.remove(caminho)
+        return dados
+
+    return ler
+
+
+def render_exportacao(tipo: str):
+    """Expander de exportação: gera o arquivo em disco por lotes e oferece o download."""
+    rotulo = "pedidos" if tipo == "pedidos" else "orçamentos"
+    with st.expander(f"⬇️ Exportar {rotulo} com itens e clientes", expanded=False):
+        hoje = date.today()
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            de = st.date_input("De", value=date(hoje.year, 1, 1), format="DD/MM/YYYY", key=f"exp_de_{tipo}")
+        with c2:
+            ate = st.date_input("Até", value=hoje, format="DD/MM/YYYY", key=f"exp_ate_{tipo}")
+        with c3:
+            formato = st.radio("Formato", exportacao.FORMATOS, horizontal=True, key=f"exp_fmt_{tipo}")
+
+        chave = f"exp_arquivo_{tipo}"
+        if st.button("Gerar arquivo", key=f"exp_btn_{tipo}", use_container_width=True, disabled=de > ate):
+            # um arquivo por sessão/tipo: apaga o anterior antes de gerar outro
+            descartar_temporario(chave)
+
+            fd, caminho = tempfile.mkstemp(prefix=f"{tipo}_", suffix=f".{formato}")
+            os.close(fd)
+            barra = st.progress(0.0, text="Exportando...")
+
+            def _progresso(feitas, total):
+                barra.progress(min(1.0, feitas / total) if total else 1.0, text=f"{feitas} de {total} linha(s)")
+
+            try:
+                n = exportacao.exportar(tipo, caminho, de, ate, formato=formato, progresso=_progresso)
+                st.session_state[chave] = {
+                    "caminho": caminho,
+                    "nome": f"{tipo}_{de:%Y%m%d}_{ate:%Y%m%d}.{formato}",
+                    "linhas": n,
+                }
+            except Exception as e:
+                os.remove(caminho)
+                st.error(f"Falha ao exportar: {e}")
+
+        arq = st.session_state.get(chave)
+        if arq and os.path.exists(arq["caminho"]):
+            st.download_button(
+                f"📥 Baixar {arq['nome']} ({arq['linhas']} linha(s))",
+                data=ler_temporario(arq["caminho"]),
+                file_name=arq["nome"],
+                mime="text/csv" if arq["nome"].endswith(".csv") else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True,
+                key=f"exp_dl_{tipo}",
+                # o arquivo é apagado por ler_temporario; aqui só some o botão
+                on_click=st.session_state.pop,
+                args=(chave, None),
+            )
+
+
+def render_pdfs_em_lote(orcamento_ids: list):
+    """PDFs de vários orçamentos num ZIP, renderizados em paralelo (pdf_orcamento)."""
+    with st.expander("🗂️ PDFs em lote (ZIP)", expanded=False):
+        sel = st.multiselect(
+            "Orçamentos (padrão: todos do filtro)",
+            orcamento_ids,
+            default=orcamento_ids,
+            key="zip_orc_sel",
+        )
+        chave = "zip_orc_arquivo"
+        if st.button(f"Gerar ZIP com {len(sel)} PDF(s)", key="zip_orc_btn", use_container_width=True, disabled=not sel):
+            descartar_temporario(chave)
+
+            fd, caminho = tempfile.mkstemp(prefix="orcamentos_", suffix=".zip")
+            os.close(fd)
+            barra = st.progress(0.0, text="Gerando PDFs...")
+
+            def _progresso(feitos, total):
+                barra.progress(min(1.0, feitos / total) if total else 1.0, text=f"{feitos} de {total} PDF(s)")
+
+            try:
+                n = pdf_orcamento.gerar_zip_orcamentos(sel, caminho, progresso=_progresso)
+                st.session_state[chave] = {"caminho": caminho, "pdfs": n}
+            except Exception as e:
+                os.remove(caminho)
+                st.error(f"Falha ao gerar os PDFs: {e}")
+
+        arq = st.session_state.get(chave)
+        if arq and os.path.exists(arq["caminho"]):
+            st.download_button(
+                f"📥 Baixar ZIP ({arq['pdfs']} PDF(s))",
+                data=ler_temporario(arq["caminho"]),
+                file_name="orcamentos.zip",
+                mime="application/zip",
+                use_container_width=True,
+                key="zip_orc_dl",
+                on_click=st.session_state.pop,
+                args=(chave, None),
+            )
+
+
 # =========================
 # LOGIN
 # =========================
@@ -914,12 +1031,20 @@ def page_clientes():
                 email = st.text_input("E-mail", placeholder="Ex: contato@dominio.com")
 
             endereco = st.text_area("Endereço", placeholder="Rua, número, bairro, cidade", height=80)
+            coordenadas = st.text_input(
+                "Localização (lat, lon)",
+                placeholder="Ex: -3.7319, -38.5267",
+                help="Clique com o botão direito no local no Google Maps e copie as coordenadas. Usado na rota de montagem.",
+            )
             observacoes = st.text_area("Observações", placeholder="Detalhes importantes do cliente", height=80)
 
             ok = st.form_submit_button("Salvar", use_container_width=True)
             if ok:
+                coord = rotas.ler_coordenada(coordenadas) if coordenadas.strip() else None
                 if not nome.strip():
                     st.error("Nome é obrigatório.")
+                elif coordenadas.strip() and coord is None:
+                    st.error("Localização inválida. Use latitude, longitude (ex: -3.7319, -38.5267).")
                 else:
                     da.criar_cliente(
                         {
@@ -931,6 +1056,8 @@ def page_clientes():
                             "email": email.strip(),
                             "endereco": endereco.strip(),
                             "observacoes": observacoes.strip(),
+                            "latitude": coord[0] if coord else None,
+                            "longitude": coord[1] if coord else None,
                         }
                     )
                     st.success("Cliente cadastrado.")
@@ -950,12 +1077,49 @@ def page_clientes():
             df = pd.DataFrame(rows)
             cols = [c for c in ["id", "nome", "cpf_cnpj", "whatsapp", "email", "ativo", "created_at"] if c in df.columns]
             if "created_at" in cols:
-                df["created_at"] = df["created_at"].apply(fmt_date_br)
+                df["created_at"] = data_br_serie(df["created_at"])
             st.dataframe(df[cols], use_container_width=True, hide_index=True)
         else:
             st.info("Sem clientes ainda.")
         st.markdown("</div>", unsafe_allow_html=True)
 
+        with st.expander("📍 Localização dos clientes", expanded=False):
+            por_id = {int(r["id"]): r for r in rows or []}
+            cid = st.selectbox(
+                "Cliente",
+                list(por_id),
+                index=None,
+                format_func=lambda i: por_id[i]["nome"] + (" 📍" if por_id[i].get("latitude") is not None else ""),
+                key="cli_loc_sel",
+            )
+            cli = por_id.get(cid)
+            if cli:
+                atual = f"{cli['latitude']}, {cli['longitude']}" if cli.get("latitude") is not None else ""
+                loc = st.text_input("Localização (lat, lon)", value=atual, key=f"cli_loc_{cli['id']}")
+                if st.button("💾 Salvar localização", key="cli_loc_sv", use_container_width=True):
+                    coord = rotas.ler_coordenada(loc) if loc.strip() else (None, None)
+                    if coord is None:
+                        st.error("Localização inválida. Use latitude, longitude (ex: -3.7319, -38.5267).")
+                    else:
+                        da.atualizar_cliente(int(cli["id"]), {"latitude": coord[0], "longitude": coord[1]})
+                        st.success("Localização salva.")
+                        st.rerun()
+
+            st.caption("Importar várias de uma vez: CSV com latitude, longitude e id, cpf_cnpj ou nome do cliente.")
+            arq = st.file_uploader("CSV de coordenadas", type=["csv"], key="cli_loc_csv")
+            if arq is not None and st.button("⬆️ Importar coordenadas", key="cli_loc_imp", use_container_width=True):
+                linhas = rotas.ler_csv_coordenadas(arq.getvalue())
+                if not linhas:
+                    st.error("Nenhuma linha válida (precisa de latitude, longitude e id, cpf_cnpj ou nome).")
+                else:
+                    atualizados, faltaram, ambiguas = da.atualizar_coordenadas_clientes(linhas)
+                    st.success(f"{atualizados} cliente(s) atualizados." + (f" {faltaram} linha(s) sem cliente correspondente." if faltaram else ""))
+                    if ambiguas:
+                        st.warning(
+                            f"{len(ambiguas)} linha(s) batem com mais de um cliente e não foram gravadas "
+                            f"(use id ou cpf_cnpj): {', '.join(ambiguas[:10])}" + ("…" if len(ambiguas) > 10 else "")
+                        )
+
 
 def page_funcionarios():
     render_topbar("👷 Funcionários", "Cadastro e consulta")
@@ -973,6 +1137,10 @@ def page_funcionarios():
             with c2:
                 telefone = st.text_input("Telefone", placeholder="Ex: (88) 9xxxx-xxxx")
                 data_adm = st.date_input("Data de admissão", value=None)
+            capacidade = st.number_input(
+                "Etapas em paralelo", min_value=1, max_value=10, value=1, step=1,
+                help="Quantas etapas a pessoa consegue tocar ao mesmo tempo na agenda sugerida da Produção.",
+            )
 
             ok = st.form_submit_button("Salvar", use_container_width=True)
             if ok:
@@ -985,6 +1153,7 @@ def page_funcionarios():
                             "funcao": funcao.strip(),
                             "telefone": telefone.strip(),
                             "data_admissao": data_adm,
+                            "capacidade": int(capacidade),
                         }
                     )
                     st.success("Funcionário cadastrado.")
@@ -1002,9 +1171,9 @@ def page_funcionarios():
         rows = da.listar_funcionarios(ativo_only=ativo_only, q=q.strip() if q else None)
         if rows:
             df = pd.DataFrame(rows)
-            cols = [c for c in ["id", "nome", "funcao", "telefone", "ativo", "created_at"] if c in df.columns]
+            cols = [c for c in ["id", "nome", "funcao", "telefone", "capacidade", "ativo", "created_at"] if c in df.columns]
             if "created_at" in cols:
-                df["created_at"] = df["created_at"].apply(fmt_date_br)
+                df["created_at"] = data_br_serie(df["created_at"])
             st.dataframe(df[cols], use_container_width=True, hide_index=True)
         else:
             st.info("Sem funcionários ainda.")
@@ -1014,19 +1183,16 @@ def page_funcionarios():
 def page_vendas():
     render_topbar("📊 Dashboard", "KPIs e gargalos por etapa")
 
-    orcs_all = da.listar_orcamentos() or []
-    peds_all = da.listar_pedidos() or []
-
-    orcs = filter_by_month(orcs_all, date_col="created_at")
-    peds = filter_by_month(peds_all, date_col="created_at")
+    orcs = filter_df_by_month(da.listar_orcamentos(colunar=True), date_col="created_at")
+    peds = filter_df_by_month(da.listar_pedidos(colunar=True), date_col="created_at")
 
     total_orc = len(orcs)
     total_ped = len(peds)
 
-    total_ped_valor = sum(safe_float(p.get("total"), 0) for p in peds)
-    total_orc_valor = sum(safe_float(o.get("total_estimado"), 0) for o in orcs)
+    total_ped_valor = float(peds["total"].sum()) if total_ped else 0.0
+    total_orc_valor = float(orcs["total_estimado"].sum()) if total_orc else 0.0
 
-    etapa_stats, pedido_current = compute_etapa_stats(peds)
+    etapa_stats, pedido_current = compute_etapa_stats(peds["id"].tolist() if total_ped else [])
 
     c1, c2, c3, c4 = st.columns(4)
     c1.metric("🧾 Orçamentos", total_orc)
@@ -1035,25 +1201,132 @@ def page_vendas():
     c4.metric("📈 Total em orçamentos", brl(total_orc_valor))
 
     render_gargalos_panel(etapa_stats)
+    render_tendencia_mensal()
 
     st.markdown('<div class="cardx" style="margin-top:14px;">', unsafe_allow_html=True)
     st.subheader("🧩 Últimos pedidos (filtrados)")
-    if peds:
-        df = pd.DataFrame(peds)
+    if total_ped:
+        df = peds.head(50).copy()
         if "data_entrega_prevista" in df.columns:
-            df["data_entrega_prevista"] = df["data_entrega_prevista"].apply(fmt_date_br)
+            df["data_entrega_prevista"] = data_br_serie(df["data_entrega_prevista"])
         if "created_at" in df.columns:
-            df["created_at"] = df["created_at"].apply(fmt_date_br)
+            df["created_at"] = data_br_serie(df["created_at"])
         if "total" in df.columns:
-            df["total"] = df["total"].apply(brl)
+            df["total"] = brl_serie(df["total"])
 
         cols = [c for c in ["codigo", "cliente_nome", "status", "etapa_atual", "status_etapa", "data_entrega_prevista", "total", "created_at"] if c in df.columns]
-        st.dataframe(df[cols].head(50), use_container_width=True, hide_index=True)
+        st.dataframe(df[cols], use_container_width=True, hide_index=True)
     else:
         st.info("Sem pedidos no filtro selecionado.")
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+# itens de orçamento/pedido: medidas opcionais alimentam o plano de corte
+COLUNAS_ITENS = ["descricao", "qtd", "unidade", "valor_unit", "largura_mm", "altura_mm", "espessura_mm", "material", "fita_lados"]
+CONFIG_ITENS = {
+    "largura_mm": st.column_config.NumberColumn("Largura (mm)", min_value=0, step=1),
+    "altura_mm": st.column_config.NumberColumn("Altura (mm)", min_value=0, step=1),
+    "espessura_mm": st.column_config.NumberColumn("Espessura (mm)", min_value=0, step=0.5),
+    "material": st.column_config.TextColumn("Material", help="Ex: MDF Branco TX. Peças de materiais diferentes vão para chapas diferentes."),
+    "fita_lados": st.column_config.NumberColumn("Fita (lados)", min_value=0, max_value=4, step=1, help="Lados com fita de borda; os compridos contam primeiro."),
+}
+
+
+def render_adicionar_do_catalogo(prefixo: str) -> dict | None:
+    """Escolhe um produto do catálogo (a caixa filtra enquanto digita). Retorna o item a adicionar ou None."""
+    precos = catalogo.tabela_precos()
+    if not precos:
+        st.caption("Catálogo vazio. Cadastre produtos na página Catálogo.")
+        return None
+    chaves = sorted(precos)
+    c1, c2, c3 = st.columns([4, 1, 1])
+    with c1:
+        chave = st.selectbox(
+            "Produto",
+            chaves,
+            index=None,
+            placeholder="Digite para buscar…",
+            format_func=lambda k: f"{precos[k]['descricao']} • {precos[k]['unidade']} • {brl(precos[k]['valor_unit'])}",
+            key=f"{prefixo}_cat_prod",
+        )
+    with c2:
+        qtd = st.number_input("Qtd", min_value=0.01, value=1.0, step=1.0, key=f"{prefixo}_cat_qtd")
+    with c3:
+        st.markdown("<div style='height:28px'></div>", unsafe_allow_html=True)
+        if st.button("➕ Adicionar", key=f"{prefixo}_cat_add", use_container_width=True, disabled=chave is None):
+            return catalogo.item_do_produto(precos[chave], qtd)
+    return None
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def calcular_plano_corte(pecas: pd.DataFrame, chapa: tuple, serra: float, girar: bool):
+    # o expander roda a cada rerun: recalcula só quando as medidas ou a chapa mudam
+    return corte.plano_de_corte(pecas.to_dict("records"), chapa=chapa, serra=serra, girar=girar)
+
+
+def render_plano_corte(itens_df: pd.DataFrame):
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        larg = st.number_input("Chapa largura (mm)", min_value=100.0, value=corte.CHAPA_PADRAO[0], step=10.0, key="corte_w")
+    with c2:
+        alt_ = st.number_input("Chapa altura (mm)", min_value=100.0, value=corte.CHAPA_PADRAO[1], step=10.0, key="corte_h")
+    with c3:
+        serra = st.number_input("Serra (mm)", min_value=0.0, value=corte.SERRA_MM, step=0.5, key="corte_serra")
+    with c4:
+        girar = st.toggle("Pode girar peças", value=True, key="corte_girar", help="Desligue para MDF com veio.")
+
+    # só as colunas que o plano usa: mexer em preço ou unidade não recalcula
+    pecas = itens_df.reindex(columns=["descricao", "qtd", "largura_mm", "altura_mm", "espessura_mm", "material"])
+    planos = calcular_plano_corte(pecas, (larg, alt_), serra, girar)
+    if not planos:
+        st.caption("Preencha largura e altura (mm) nos itens para calcular as chapas.")
+        return
+
+    resumo = pd.DataFrame(
+        [
+            {
+                "Material": pl.material or "(sem material)",
+                "Espessura (mm)": pl.espessura,
+                "Peças": sum(len(c.pecas) for c in pl.chapas),
+                "Chapas": len(pl.chapas),
+                "Aproveitamento": f"{pl.aproveitamento:.0%}",
+                "Sobra (m²)": round(pl.desperdicio_m2, 2),
+            }
+            for pl in planos
+        ]
+    )
+    st.dataframe(resumo, use_container_width=True, hide_index=True)
+    for pl in planos:
+        if pl.nao_cabem:
+            st.warning(f"Não cabem na chapa ({pl.material or 'sem material'}): " + ", ".join(pl.nao_cabem[:10]))
+
+    opcoes = [(i, k) for i, pl in enumerate(planos) for k in range(len(pl.chapas))]
+    if not opcoes:
+        return
+    escolha = st.selectbox(
+        "Ver chapa",
+        opcoes,
+        format_func=lambda o: f"{planos[o[0]].material or 'sem material'} • chapa {o[1] + 1} de {len(planos[o[0]].chapas)}",
+        key="corte_ver",
+    )
+    chapa = planos[escolha[0]].chapas[escolha[1]]
+    pecas = pd.DataFrame(chapa.pecas, columns=["x", "y", "w", "h", "peca", "girada"])
+    pecas["x2"], pecas["y2"] = pecas["x"] + pecas["w"], pecas["y"] + pecas["h"]
+    pecas["medida"] = pecas["w"].map("{:g}".format) + " × " + pecas["h"].map("{:g}".format)
+    escala_x = alt.Scale(domain=[0, chapa.largura], nice=False)
+    escala_y = alt.Scale(domain=[0, chapa.altura], nice=False, reverse=True)
+    desenho = alt.Chart(pecas).mark_rect(stroke="#101828", strokeWidth=0.6).encode(
+        x=alt.X("x:Q", scale=escala_x, title=None),
+        x2="x2:Q",
+        y=alt.Y("y:Q", scale=escala_y, title=None),
+        y2="y2:Q",
+        color=alt.Color("peca:N", legend=None),
+        tooltip=[alt.Tooltip("peca:N", title="Peça"), alt.Tooltip("medida:N", title="mm"), alt.Tooltip("girada:N", title="Girada")],
+    )
+    largura_px = 640
+    st.altair_chart(desenho.properties(width=largura_px, height=int(largura_px * chapa.altura / chapa.largura)))
+
+
 def page_orcamento():
     render_topbar("🧾 Orçamentos", "Criar, editar, aprovar e gerar PDF. Não gera pedido automático.")
 
@@ -1126,9 +1399,16 @@ def page_orcamento():
                 unsafe_allow_html=True,
             )
 
-            itens = da.listar_orcamento_itens(int(oid)) or []
-            df_it = pd.DataFrame(itens) if itens else pd.DataFrame(columns=["descricao", "qtd", "unidade", "valor_unit"])
-            df_it = df_it[[c for c in ["descricao", "qtd", "unidade", "valor_unit"] if c in df_it.columns]]
+            versao = versao_vista("orc", int(oid), orc.get("version"))
+            # itens vindos do catálogo entram num rascunho (com o que já foi editado) até o "Salvar itens"
+            rascunho = st.session_state.get("orc_itens_rascunho")
+            if rascunho and rascunho[0] == int(oid):
+                df_it = rascunho[1]
+            else:
+                st.session_state.pop("orc_itens_rascunho", None)
+                itens = da.listar_orcamento_itens(int(oid)) or []
+                df_it = pd.DataFrame(itens) if itens else pd.DataFrame(columns=COLUNAS_ITENS)
+                df_it = df_it[[c for c in COLUNAS_ITENS if c in df_it.columns]]
 
             disabled_edit = (orc.get("status") == "Aprovado")
             edited = st.data_editor(
@@ -1137,29 +1417,54 @@ def page_orcamento():
                 use_container_width=True,
                 key="orc_itens",
                 disabled=disabled_edit,
+                column_config=CONFIG_ITENS,
             )
 
+            if not disabled_edit:
+                with st.expander("📚 Adicionar do catálogo", expanded=False):
+                    novo = render_adicionar_do_catalogo("orc")
+                    if novo:
+                        linhas = edited.to_dict("records") + [novo]
+                        st.session_state["orc_itens_rascunho"] = (int(oid), pd.DataFrame(linhas, columns=list(edited.columns)))
+                        # as edições já estão no rascunho: o editor recomeça a partir dele
+                        st.session_state.pop("orc_itens", None)
+                        st.rerun()
+                    if rascunho and rascunho[0] == int(oid):
+                        st.caption("Itens adicionados do catálogo só ficam gravados depois de “Salvar itens”.")
+
+            with st.expander("🪚 Plano de corte (chapas)", expanded=False):
+                render_plano_corte(edited)
+
             c1, c2, c3 = st.columns(3)
             with c1:
                 if st.button("💾 Salvar itens", use_container_width=True, disabled=disabled_edit):
-                    total = da.salvar_orcamento_itens(int(oid), edited.to_dict("records"))
-                    st.success(f"Itens salvos. Total estimado {brl(total)}")
-                    st.rerun()
+                    linhas = catalogo.preencher_itens(edited.to_dict("records"))
+                    ok, msg, total = da.salvar_orcamento_itens(int(oid), linhas, version=versao)
+                    esquecer_versao("orc")
+                    st.session_state.pop("orc_itens_rascunho", None)
+                    if ok:
+                        st.success(f"Itens salvos. Total estimado {brl(total)}")
+                        st.rerun()
+                    else:
+                        # descarta a edição local: o próximo render mostra os itens gravados pela outra pessoa
+                        st.session_state.pop("orc_itens", None)
+                        st.error(msg)
 
             with c2:
                 # Aqui só aprova, NÃO gera pedido
                 if st.button("✅ Aprovar orçamento", use_container_width=True, disabled=disabled_edit):
-                    ok = da.aprovar_orcamento(int(oid))
+                    ok, msg = da.atualizar_status_orcamento(int(oid), "Aprovado", version=versao)
+                    esquecer_versao("orc")
                     if ok:
                         st.success("Orçamento aprovado. Agora gere o pedido na página PEDIDOS.")
                         st.rerun()
                     else:
-                        st.error("Falha ao aprovar.")
+                        st.error(msg)
 
             with c3:
                 # PDF sempre disponível (melhor ainda quando tiver itens)
                 try:
-                    pdf_bytes = gerar_pdf_orcamento_bytes(int(oid))
+                    pdf_bytes = pdf_orcamento.gerar_pdf_orcamento_bytes(int(oid))
                     st.download_button(
                         "📄 Baixar PDF",
                         data=pdf_bytes,
@@ -1170,6 +1475,30 @@ def page_orcamento():
                 except Exception as e:
                     st.warning(f"Não consegui gerar PDF: {e}")
 
+            # cópia exata do PDF que foi para o cliente (sem renderizar de novo)
+            with st.expander("📨 PDFs enviados ao cliente", expanded=False):
+                if st.button("Registrar PDF atual como enviado", key="orc_pdf_envio", use_container_width=True):
+                    ok, msg = pdf_orcamento.registrar_envio(int(oid))
+                    st.success(msg) if ok else st.error(msg)
+
+                envios = pdf_orcamento.listar_envios(int(oid))
+                if not envios:
+                    st.caption("Nenhum envio registrado.")
+                for ev in envios:
+                    baixar = st.toggle(
+                        f"{fmt_dt_br(ev.get('created_at'))} • {ev.get('tamanho') or 0} bytes • hash {ev.get('hash_conteudo', '')[:10]}",
+                        key=f"orc_envio_{ev['id']}",
+                    )
+                    if baixar:
+                        st.download_button(
+                            "📄 Baixar este envio",
+                            data=pdf_orcamento.obter_pdf_salvo(int(ev["id"])) or b"",
+                            file_name=f"orcamento_{orc.get('codigo','')}_enviado_{ev['id']}.pdf",
+                            mime="application/pdf",
+                            use_container_width=True,
+                            key=f"orc_envio_dl_{ev['id']}",
+                        )
+
             st.markdown("</div>", unsafe_allow_html=True)
 
     # Lista de orçamentos
@@ -1182,9 +1511,9 @@ def page_orcamento():
     if rows:
         df = pd.DataFrame(rows)
         if "created_at" in df.columns:
-            df["created_at"] = df["created_at"].apply(fmt_date_br)
+            df["created_at"] = data_br_serie(df["created_at"])
         if "total_estimado" in df.columns:
-            df["total_estimado"] = df["total_estimado"].apply(brl)
+            df["total_estimado"] = brl_serie(df["total_estimado"])
         cols = [c for c in ["id", "codigo", "cliente_nome", "status", "total_estimado", "created_at"] if c in df.columns]
         st.dataframe(df[cols], use_container_width=True, hide_index=True)
 
@@ -1192,8 +1521,10 @@ def page_orcamento():
         if st.button("Abrir orçamento", use_container_width=True):
             st.session_state.orcamento_id = int(pick)
             st.rerun()
+        render_pdfs_em_lote(df["id"].tolist())
     else:
         st.info("Sem orçamentos no filtro selecionado.")
+    render_exportacao("orcamentos")
     st.markdown("</div>", unsafe_allow_html=True)
 
 
@@ -1236,6 +1567,7 @@ def page_pedido():
                         "status": "Aberto",
                     }
                 )
+                notificacoes.notificar_novo_pedido(pid, cod, cli.rsplit(" (ID", 1)[0])
                 st.success(f"Pedido criado. Código {cod}")
                 st.session_state.pedido_id = pid
                 st.rerun()
@@ -1270,13 +1602,15 @@ def page_pedido():
             obs2 = st.text_area("Observações do pedido", placeholder="Ex: gerado do orçamento X", key="obs_orc", height=70)
 
             if st.button("Gerar pedido deste orçamento", use_container_width=True):
-                ok, msg, pedido_id, pedido_codigo = da.gerar_pedido_a_partir_orcamento(
+                ok, msg, pedido_id, pedido_codigo, criado = da.gerar_pedido_a_partir_orcamento(
                     int(o_map[pick_orc]),
                     responsavel_id=f_map[resp2],
                     data_entrega_prevista=entrega2,
                     observacoes=(obs2 or "").strip(),
                 )
                 if ok:
+                    if criado:
+                        notificacoes.notificar_novo_pedido(pedido_id, pedido_codigo, pick_orc.split(" • ", 1)[-1].rsplit(" (ID", 1)[0])
                     st.success(msg)
                     st.session_state.pedido_id = pedido_id
                     st.session_state.page = "Produção" if can(["producao", "admin"]) else "Pedido"
@@ -1295,15 +1629,24 @@ def page_pedido():
             st.info("Crie ou selecione um pedido abaixo.")
             st.markdown("</div>", unsafe_allow_html=True)
         else:
+            ped = da.obter_pedido_por_id(int(pid)) or {}
+            versao = versao_vista("ped", int(pid), ped.get("version"))
             itens = da.listar_pedido_itens(pid) or []
-            df_it = pd.DataFrame(itens) if itens else pd.DataFrame(columns=["descricao", "qtd", "unidade", "valor_unit"])
-            df_it = df_it[[c for c in ["descricao", "qtd", "unidade", "valor_unit"] if c in df_it.columns]]
+            df_it = pd.DataFrame(itens) if itens else pd.DataFrame(columns=COLUNAS_ITENS)
+            df_it = df_it[[c for c in COLUNAS_ITENS if c in df_it.columns]]
 
-            edited = st.data_editor(df_it, num_rows="dynamic", use_container_width=True, key="ped_itens")
+            edited = st.data_editor(df_it, num_rows="dynamic", use_container_width=True, key="ped_itens", column_config=CONFIG_ITENS)
             if st.button("💾 Salvar itens do pedido", use_container_width=True):
-                total = da.salvar_pedido_itens(pid, edited.to_dict("records"))
-                st.success(f"Itens salvos. Total {brl(total)}")
-                st.rerun()
+                linhas = catalogo.preencher_itens(edited.to_dict("records"))
+                ok, msg, total = da.salvar_pedido_itens(pid, linhas, version=versao)
+                esquecer_versao("ped")
+                if ok:
+                    st.success(f"Itens salvos. Total {brl(total)}")
+                    st.rerun()
+                else:
+                    # descarta a edição local: o próximo render mostra os itens gravados pela outra pessoa
+                    st.session_state.pop("ped_itens", None)
+                    st.error(msg)
 
         st.markdown("</div>", unsafe_allow_html=True)
 
@@ -1317,11 +1660,11 @@ def page_pedido():
     if rows:
         df = pd.DataFrame(rows)
         if "data_entrega_prevista" in df.columns:
-            df["data_entrega_prevista"] = df["data_entrega_prevista"].apply(fmt_date_br)
+            df["data_entrega_prevista"] = data_br_serie(df["data_entrega_prevista"])
         if "created_at" in df.columns:
-            df["created_at"] = df["created_at"].apply(fmt_date_br)
+            df["created_at"] = data_br_serie(df["created_at"])
         if "total" in df.columns:
-            df["total"] = df["total"].apply(brl)
+            df["total"] = brl_serie(df["total"])
 
         cols = [c for c in ["id", "codigo", "cliente_nome", "status", "etapa_atual", "status_etapa", "responsavel_nome", "data_entrega_prevista", "total", "created_at"] if c in df.columns]
         st.dataframe(df[cols], use_container_width=True, hide_index=True)
@@ -1332,11 +1675,12 @@ def page_pedido():
             st.rerun()
     else:
         st.info("Sem pedidos no filtro selecionado.")
+    render_exportacao("pedidos")
     st.markdown("</div>", unsafe_allow_html=True)
 
     # Timeline abaixo da lista
-    etapa_stats, pedido_current = compute_etapa_stats(rows)
-    render_timeline_pedidos(rows, etapa_stats, pedido_current)
+    etapa_stats, pedido_current = compute_etapa_stats([int(r["id"]) for r in rows])
+    render_timeline_pedidos(rows, etapa_stats, pedido_current, q_lista=q)
 
 
 def page_producao():
@@ -1379,6 +1723,50 @@ def page_producao():
         st.markdown("</div>", unsafe_allow_html=True)
         return
 
+    # filtro por mês/ano nos cards, usando created_at do pedido
+    base_ids = None
+    if st.session_state.get("flt_month") != "Todos":
+        base_ids = set(int(x.get("id")) for x in peds_all if x.get("id") is not None)
+
+    # Movimentação em lote
+    if st.toggle("☑️ Mover vários pedidos", key="mv_lote"):
+        candidatos = [
+            p
+            for e in ETAPAS_PRODUCAO_UI
+            for p in (grupos.get(e, []) or [])
+            if base_ids is None or int(p.get("id")) in base_ids
+        ]
+        l_map = {f"{p.get('codigo', '')} • {p.get('cliente_nome', '')} • {p.get('etapa_atual', '')}": p for p in candidatos}
+        sel = st.multiselect("Pedidos", list(l_map.keys()), key="mv_lote_sel")
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            lote_etapa = st.selectbox("Nova etapa", ETAPAS_PRODUCAO_UI, key="mv_lote_et")
+        with c2:
+            lote_status = st.selectbox("Status", STATUS_ETAPA, key="mv_lote_st")
+        with c3:
+            lote_resp = st.selectbox("Responsável", list(f_map.keys()), key="mv_lote_rp")
+        lote_obs = st.text_area("Observação", key="mv_lote_ob", height=70, placeholder="Ex: lote de armários para montagem")
+
+        if st.button(f"Mover {len(sel)} pedido(s)", key="mv_lote_sv", use_container_width=True, disabled=not sel):
+            escolhidos = [l_map[k] for k in sel]
+            ok, msg = da.mover_pedidos_etapa(
+                [int(p.get("id")) for p in escolhidos], lote_etapa, lote_status, f_map[lote_resp], lote_obs
+            )
+            fetch_hist_pedido.clear()
+            if ok:
+                agenda_marcar_movidos(int(p.get("id")) for p in escolhidos)
+                notificacoes.notificar_mudancas_etapa(
+                    [
+                        (int(p.get("id")), p.get("codigo", ""), p.get("cliente_nome", ""))
+                        for p in escolhidos
+                        if (lote_etapa, lote_status) != (p.get("etapa_atual"), p.get("status_etapa"))
+                    ],
+                    lote_etapa,
+                    lote_status,
+                )
+            st.success(msg) if ok else st.error(msg)
+            st.rerun()
+
     cols = st.columns(len(ETAPAS_PRODUCAO_UI))
 
     for i, etapa in enumerate(ETAPAS_PRODUCAO_UI):
@@ -1387,72 +1775,475 @@ def page_producao():
 
             # Se etapa não existe no dict, segura
             lista = grupos.get(etapa, []) or []
-            # aplica filtro por mês/ano nos cards, usando created_at do pedido
-            if st.session_state.get("flt_month") != "Todos":
-                base_ids = set(int(x.get("id")) for x in peds_all if x.get("id") is not None)
+            if base_ids is not None:
                 lista = [p for p in lista if int(p.get("id")) in base_ids]
 
             if not lista:
                 st.caption("Sem pedidos aqui.")
                 continue
 
-            for p in lista:
+            # coluna inteira em um único bloco HTML
+            st.markdown(
+                cartoes.kanban_coluna_html(
+                    [
+                        {
+                            "codigo": p.get("codigo", ""),
+                            "status": p.get("status_etapa") or "A fazer",
+                            "cliente": p.get("cliente_nome", ""),
+                            "responsavel": p.get("responsavel_nome") or "Não definido",
+                            "entrega": fmt_date_br(p.get("data_entrega_prevista")) or "não definida",
+                            "total": brl(p.get("total") or 0),
+                        }
+                        for p in lista
+                    ]
+                ),
+                unsafe_allow_html=True,
+            )
+
+            # um painel de movimentação por coluna (antes era um por card)
+            with st.expander("⚙️ Mover e atualizar", expanded=False):
+                p_map = {f"{p.get('codigo', '')} • {p.get('cliente_nome', '')}": p for p in lista}
+                pick = st.selectbox("Pedido", list(p_map.keys()), key=f"mv_ped_{i}")
+                p = p_map[pick]
                 pid = int(p.get("id"))
-                cod = p.get("codigo", "")
-                cliente = p.get("cliente_nome", "")
-                resp_nome = p.get("responsavel_nome") or "Não definido"
-                status_et = p.get("status_etapa") or "A fazer"
-                entrega = fmt_date_br(p.get("data_entrega_prevista"))
-                totalv = brl(p.get("total") or 0)
-
-                st.markdown(
-                    f"""
-                    <div class="cardx" style="padding:14px; margin-bottom:10px;">
-                      <div style="display:flex; justify-content:space-between; gap:10px; align-items:flex-start;">
-                        <div style="font-weight:1000;">📦 {cod}</div>
-                        <span class="kbadge">{status_et}</span>
-                      </div>
-                      <div class="muted" style="margin-top:4px;">{cliente}</div>
-                      <div class="muted">👤 {resp_nome}</div>
-                      <div class="muted">🚚 Entrega {entrega if entrega else "não definida"}</div>
-                      <div class="muted">💰 {totalv}</div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
+                versao = versao_vista(f"kanban_{i}", pid, p.get("version"))
+
+                # se etapa atual não estiver na lista UI, coloca na primeira
+                try:
+                    idx = ETAPAS_PRODUCAO_UI.index(etapa)
+                except ValueError:
+                    idx = 0
+
+                nova_etapa = st.selectbox(
+                    "Etapa",
+                    ETAPAS_PRODUCAO_UI,
+                    index=idx,
+                    key=f"et_{pid}",
                 )
+                # status
+                cur_status = p.get("status_etapa") or STATUS_ETAPA[0]
+                st_idx = STATUS_ETAPA.index(cur_status) if cur_status in STATUS_ETAPA else 0
+                status_etapa = st.selectbox("Status", STATUS_ETAPA, index=st_idx, key=f"st_{pid}")
+
+                resp = st.selectbox("Responsável", list(f_map.keys()), index=0, key=f"rp_{pid}")
+                obs = st.text_area("Observação", key=f"ob_{pid}", height=70, placeholder="Ex: iniciando corte / aguardando material")
+
+                if st.button("Salvar movimentação", key=f"sv_{i}", use_container_width=True):
+                    ok, msg = da.mover_pedido_etapa(pid, nova_etapa, status_etapa, f_map[resp], obs, version=versao)
+                    esquecer_versao(f"kanban_{i}")
+                    fetch_hist_pedido.clear()
+                    if ok and (nova_etapa, status_etapa) != (p.get("etapa_atual"), p.get("status_etapa")):
+                        notificacoes.notificar_mudanca_etapa(pid, p.get("codigo", ""), p.get("cliente_nome", ""), nova_etapa, status_etapa)
+                    if ok:
+                        agenda_marcar_movidos([pid])
+                        st.success(msg)
+                        st.rerun()
+                    st.error(msg)
 
-                with st.expander("⚙️ Mover e atualizar", expanded=False):
-                    # se etapa atual não estiver na lista UI, coloca na primeira
-                    try:
-                        idx = ETAPAS_PRODUCAO_UI.index(etapa)
-                    except ValueError:
-                        idx = 0
-
-                    nova_etapa = st.selectbox(
-                        "Etapa",
-                        ETAPAS_PRODUCAO_UI,
-                        index=idx,
-                        key=f"et_{pid}",
-                    )
-                    # status
-                    cur_status = p.get("status_etapa") or STATUS_ETAPA[0]
-                    st_idx = STATUS_ETAPA.index(cur_status) if cur_status in STATUS_ETAPA else 0
-                    status_etapa = st.selectbox("Status", STATUS_ETAPA, index=st_idx, key=f"st_{pid}")
+    st.markdown("</div>", unsafe_allow_html=True)
 
-                    resp = st.selectbox("Responsável", list(f_map.keys()), index=0, key=f"rp_{pid}")
-                    obs = st.text_area("Observação", key=f"ob_{pid}", height=70, placeholder="Ex: iniciando corte / aguardando material")
+    if st.toggle("🗓️ Mostrar agenda sugerida", key="agenda_on"):
+        render_agenda_sugerida()
 
-                    if st.button("Salvar movimentação", key=f"sv_{pid}", use_container_width=True):
-                        ok, msg = da.mover_pedido_etapa(pid, nova_etapa, status_etapa, f_map[resp], obs)
-                        st.success(msg) if ok else st.error(msg)
-                        st.rerun()
+    if st.toggle("📊 Mostrar Gantt dos pedidos ativos", key="gantt_on"):
+        render_gantt()
 
-    st.markdown("</div>", unsafe_allow_html=True)
+    if st.toggle("🚚 Mostrar rota de transporte/montagem", key="rota_on"):
+        render_rota_do_dia()
 
 
 # =========================
 # SIDEBAR + NAVEGAÇÃO
 # =========================
+@st.cache_data(max_entries=4, show_spinner=False)
+def fetch_gantt(marcador):
+    # `marcador` (da.marcador_producao) muda a cada movimentação
+    abertos = previsao.pedidos_abertos().sort_values("data_entrega_prevista", na_position="last")
+    intervalos = pd.concat(
+        [
+            gantt.intervalos_reais(abertos["id"].tolist()),
+            gantt.intervalos_planejados(abertos, agenda.duracoes_medianas()),
+        ],
+        ignore_index=True,
+    )
+    return abertos, intervalos
+
+
+def render_gantt():
+    st.markdown('<div class="cardx" style="margin-top:14px;">', unsafe_allow_html=True)
+    st.subheader("📊 Gantt dos pedidos ativos")
+
+    abertos, intervalos = fetch_gantt(da.marcador_producao())
+    if intervalos.empty:
+        st.info("Nenhum pedido ativo com histórico ou entrega prevista.")
+        st.markdown("</div>", unsafe_allow_html=True)
+        return
+
+    c1, c2 = st.columns([3, 1])
+    with c1:
+        etapas = st.multiselect("Etapa atual", ETAPAS_PRODUCAO, key="gantt_etapas", placeholder="Todas")
+    with c2:
+        limite = st.selectbox("Pedidos", [50, 100, 300, 1000], index=2, key="gantt_lim")
+
+    sel = abertos if not etapas else abertos[abertos["etapa_atual"].isin(etapas)]
+    sel = sel.head(int(limite))
+    dados = intervalos[intervalos["pedido_id"].isin(sel["id"])]
+    if dados.empty:
+        st.info("Nada nesse filtro.")
+    else:
+        st.altair_chart(gantt.grafico(dados, sel[["codigo", "data_entrega_prevista"]].dropna()), use_container_width=True)
+        st.caption(
+            "Barra cheia = o que aconteceu (histórico de etapas); barra clara = o que falta, encaixado de trás "
+            "para frente a partir da entrega prevista com a duração mediana de cada etapa. "
+            "Ordenado pela entrega; arraste ou use a roda do mouse para navegar no tempo."
+        )
+    st.markdown("</div>", unsafe_allow_html=True)
+
+
+# agenda sugerida: fica na sessão e só é refeita inteira quando envelhece;
+# movimentação no Kanban replaneja só os pedidos movidos
+AGENDA_VALIDADE_S = 1800
+
+
+def agenda_marcar_movidos(ids):
+    st.session_state.setdefault("_agenda_movidos", set()).update(int(i) for i in ids)
+
+
+def obter_agenda():
+    ag = st.session_state.get("_agenda")
+    movidos = st.session_state.pop("_agenda_movidos", set())
+    velha = ag is None or (now_ts_utc() - pd.Timestamp(ag.agora)).total_seconds() > AGENDA_VALIDADE_S
+    if velha:
+        ag = agenda.carregar_agenda()
+    elif movidos:
+        ag.replanejar(movidos, previsao.pedidos_abertos(sorted(movidos)))
+    st.session_state["_agenda"] = ag
+    return ag
+
+
+def render_agenda_sugerida():
+    st.markdown('<div class="cardx" style="margin-top:14px;">', unsafe_allow_html=True)
+    st.subheader("🗓️ Agenda sugerida")
+
+    c1, c2 = st.columns([3, 1])
+    with c2:
+        if st.button("🔄 Replanejar tudo", key="agenda_full", use_container_width=True):
+            st.session_state.pop("_agenda", None)
+        dias = st.selectbox("Dias", [7, 14, 30], index=1, key="agenda_dias")
+
+    ag = obter_agenda()
+    resumo = ag.resumo()
+    if resumo.empty:
+        st.info("Nenhum pedido em aberto para planejar.")
+        st.markdown("</div>", unsafe_allow_html=True)
+        return
+
+    atrasados = resumo[resumo["atraso_dias"] > 0]
+    with c1:
+        st.caption(
+            f"{len(resumo)} pedido(s) planejados • {len(atrasados)} terminam depois da entrega prevista. "
+            "Etapa em andamento fica com o responsável atual; as demais vão para quem tem a função "
+            "(Funcionários → Função) e termina mais cedo."
+        )
+
+    plano = ag.plano_diario(int(dias))
+    if not plano.empty:
+        plano["tarefa"] = plano["codigo"].astype(str) + " • " + plano["etapa"]
+        grade = plano.groupby(["funcionario", "dia"])["tarefa"].agg(", ".join).unstack("dia").fillna("")
+        grade.columns = data_br_serie(pd.Series(grade.columns)).tolist()
+        st.dataframe(grade, use_container_width=True)
+
+    if len(atrasados):
+        st.markdown("**⏰ Pedidos que o plano não consegue entregar no prazo**")
+        show = atrasados.head(30).copy()
+        show["termino"] = data_br_serie(show["termino"])
+        show["entrega_prevista"] = data_br_serie(show["entrega_prevista"])
+        show["atraso_dias"] = show["atraso_dias"].round(1)
+        st.dataframe(
+            show[["codigo", "termino", "entrega_prevista", "atraso_dias"]].rename(
+                columns={"codigo": "Pedido", "termino": "Término planejado", "entrega_prevista": "Entrega prevista", "atraso_dias": "Atraso (dias)"}
+            ),
+            use_container_width=True,
+            hide_index=True,
+        )
+    st.markdown("</div>", unsafe_allow_html=True)
+
+
+def grafico_rota(rota: rotas.Rota):
+    pts = rota.paradas[["ordem", "codigo", "cliente", "latitude", "longitude"]].copy()
+    if rota.origem is not None:
+        origem = pd.DataFrame([{"ordem": 0, "codigo": "Origem", "cliente": "", "latitude": rota.origem[0], "longitude": rota.origem[1]}])
+        pts = pd.concat([origem, pts], ignore_index=True)
+    escala = alt.Scale(zero=False)
+    base = alt.Chart(pts).encode(
+        x=alt.X("longitude:Q", scale=escala, axis=None),
+        y=alt.Y("latitude:Q", scale=escala, axis=None),
+    )
+    linha = base.mark_line(color="#0B5FFF", opacity=0.6).encode(order="ordem:Q")
+    pontos = base.mark_circle(size=220, color="#0B5FFF").encode(
+        tooltip=[alt.Tooltip("ordem:Q", title="Ordem"), alt.Tooltip("codigo:N", title="Pedido"), alt.Tooltip("cliente:N", title="Cliente")]
+    )
+    rotulos = base.mark_text(color="white", fontSize=10, fontWeight="bold").encode(text="ordem:Q")
+    return alt.layer(linha, pontos, rotulos).properties(height=420)
+
+
+def render_rota_do_dia():
+    st.markdown('<div class="cardx" style="margin-top:14px;">', unsafe_allow_html=True)
+    st.subheader("🚚 Rota do dia")
+
+    c1, c2, c3 = st.columns([1, 2, 1])
+    with c1:
+        dia = st.date_input("Dia", value=date.today(), key="rota_dia", format="DD/MM/YYYY")
+    with c2:
+        etapas = st.multiselect("Etapa atual", ETAPAS_PRODUCAO, default=list(rotas.ETAPAS_ROTA), key="rota_etapas")
+    with c3:
+        atrasados = st.toggle("Incluir atrasados", key="rota_atrasados")
+
+    rota = rotas.rota_do_dia(dia, etapas or rotas.ETAPAS_ROTA, atrasados)
+    if rota.paradas.empty:
+        st.info("Nenhum pedido com coordenadas nesse dia e etapa.")
+    else:
+        k1, k2, k3 = st.columns(3)
+        k1.metric("📍 Paradas", len(rota.paradas))
+        k2.metric("🛣️ Distância estimada", f"{rota.distancia_km:.1f} km".replace(".", ","))
+        k3.metric("⏱️ Rodando", f"{rota.horas_estimadas:.1f} h".replace(".", ","))
+
+        st.altair_chart(grafico_rota(rota), use_container_width=True)
+        show = rota.paradas[["ordem", "codigo", "cliente", "endereco", "etapa", "km_trecho", "km_acumulado"]].copy()
+        show[["km_trecho", "km_acumulado"]] = show[["km_trecho", "km_acumulado"]].round(1)
+        st.dataframe(
+            show.rename(columns={"ordem": "#", "codigo": "Pedido", "cliente": "Cliente", "endereco": "Endereço",
+                                 "etapa": "Etapa", "km_trecho": "km do trecho", "km_acumulado": "km acumulado"}),
+            use_container_width=True,
+            hide_index=True,
+        )
+        link = rotas.link_mapa(rota)
+        if link:
+            st.link_button("🗺️ Abrir no Google Maps (até 10 paradas)", link, use_container_width=True)
+        st.caption(
+            f"Vizinho mais próximo + 2-opt: {rota.distancia_inicial_km:.1f} → {rota.distancia_km:.1f} km. "
+            "Distância em linha reta × fator de estrada (ROTA_FATOR_ESTRADA)"
+            + ("; sai da origem configurada." if rota.origem is not None else "; sem ROTA_ORIGEM_LAT/LON a rota começa na primeira parada.")
+        )
+
+    if len(rota.sem_coordenadas):
+        st.warning(
+            "Sem coordenadas do cliente (cadastre em Clientes): "
+            + ", ".join(str(c) for c in rota.sem_coordenadas["codigo"])
+        )
+    st.markdown("</div>", unsafe_allow_html=True)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_carga_responsaveis():
+    return da.carga_por_responsavel()
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_vazao_semanal(semanas: int = 12):
+    return da.vazao_semanal(semanas)
+
+
+def page_capacidade():
+    render_topbar("⚖️ Capacidade", "Carga em aberto e vazão por funcionário")
+
+    if not can(["producao", "admin", "leitura"]):
+        st.warning("Acesso restrito.")
+        return
+
+    semanas = 12
+    carga = fetch_carga_responsaveis()
+    vazao = fetch_vazao_semanal(semanas)
+
+    if carga.empty:
+        st.info("Nenhum pedido em aberto.")
+        return
+
+    por_resp = carga.groupby("responsavel", as_index=False)[["pedidos", "dias_em_etapa", "itens", "qtd_itens", "atrasados"]].sum()
+    media_semana = (
+        vazao.groupby("responsavel")["etapas"].mean()
+        if not vazao.empty else pd.Series(dtype=float)
+    )
+    por_resp["vazao_semana"] = por_resp["responsavel"].map(media_semana).fillna(0.0)
+    # semanas para zerar a fila atual no ritmo médio (pedido em aberto ≈ uma etapa por vez)
+    por_resp["semanas_fila"] = (por_resp["pedidos"] / por_resp["vazao_semana"].where(por_resp["vazao_semana"] > 0)).round(1)
+    por_resp = por_resp.sort_values(["pedidos", "dias_em_etapa"], ascending=False)
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("📦 Pedidos em aberto", int(por_resp["pedidos"].sum()))
+    c2.metric("👷 Responsáveis com carga", int(carga["responsavel_id"].nunique()))
+    c3.metric("⏰ Atrasados", int(por_resp["atrasados"].sum()))
+    c4.metric("🔁 Etapas fechadas/semana", f"{media_semana.sum():.1f}".replace(".", ","))
+
+    st.markdown('<div class="cardx" style="margin-top:14px;">', unsafe_allow_html=True)
+    st.subheader("👷 Carga por responsável")
+    show = por_resp.rename(
+        columns={
+            "responsavel": "Responsável",
+            "pedidos": "Pedidos",
+            "dias_em_etapa": "Dias na etapa (soma)",
+            "itens": "Itens",
+            "qtd_itens": "Qtd. itens",
+            "atrasados": "Atrasados",
+            "vazao_semana": "Etapas fechadas/semana",
+            "semanas_fila": "Semanas de fila",
+        }
+    ).round(1)
+    st.dataframe(show, use_container_width=True, hide_index=True)
+    st.caption(f"Vazão = média de etapas fechadas por semana nas últimas {semanas} semanas. Semanas de fila = pedidos em aberto ÷ vazão.")
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    st.markdown('<div class="cardx" style="margin-top:14px;">', unsafe_allow_html=True)
+    st.subheader("🧱 Pedidos por responsável e etapa")
+    grade = carga.pivot_table(index="responsavel", columns="etapa", values="pedidos", aggfunc="sum", fill_value=0)
+    grade = grade[[e for e in ETAPAS_PRODUCAO if e in grade.columns] + [e for e in grade.columns if e not in ETAPAS_PRODUCAO]]
+    st.bar_chart(grade)
+    dias = carga.pivot_table(index="responsavel", columns="etapa", values="dias_em_etapa", aggfunc="sum", fill_value=0.0)
+    dias = dias[grade.columns]
+    st.markdown("**⏱️ Dias acumulados na etapa atual**")
+    st.dataframe(dias.round(1), use_container_width=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    st.markdown('<div class="cardx" style="margin-top:14px;">', unsafe_allow_html=True)
+    st.subheader("🔁 Vazão semanal (etapas fechadas)")
+    if vazao.empty:
+        st.info("Nenhuma etapa fechada no período.")
+    else:
+        serie = vazao.pivot_table(index="semana", columns="responsavel", values="etapas", aggfunc="sum", fill_value=0)
+        serie.index = serie.index.strftime("%d/%m")
+        st.line_chart(serie)
+    st.markdown("</div>", unsafe_allow_html=True)
+
+
+@st.cache_data(ttl=120, show_spinner=False)
+def fetch_necessidades(etapas: tuple, de, ate):
+    return materiais.necessidades(list(etapas), de, ate)
+
+
+def page_materiais():
+    render_topbar("🧱 Materiais", "O que comprar para os pedidos em andamento")
+
+    if not can(["producao", "admin", "comercial"]):
+        st.warning("Acesso restrito.")
+        return
+
+    hoje = date.today()
+    c1, c2, c3 = st.columns([2, 1, 1])
+    with c1:
+        etapas = st.multiselect("Etapa atual", ETAPAS_PRODUCAO, default=list(materiais.ETAPAS_PADRAO), key="mat_etapas")
+    with c2:
+        de = st.date_input("Entrega de", value=None, key="mat_de", format="DD/MM/YYYY")
+    with c3:
+        ate = st.date_input("Entrega até", value=hoje + timedelta(days=7), key="mat_ate", format="DD/MM/YYYY")
+
+    df = fetch_necessidades(tuple(etapas), de, ate)
+
+    st.markdown('<div class="cardx" style="margin-top:14px;">', unsafe_allow_html=True)
+    st.subheader("🛒 Necessidade de materiais")
+    if not etapas:
+        st.info("Selecione ao menos uma etapa.")
+    elif df.empty:
+        st.info("Nenhum item nos pedidos desse filtro.")
+    else:
+        chapas = df[df["tipo"] == "Chapa"]
+        fita = df[df["tipo"] == "Fita de borda"]
+        k1, k2, k3 = st.columns(3)
+        k1.metric("🪵 Chapas (estimadas)", int(chapas["chapas"].sum()) if len(chapas) else 0)
+        k2.metric("🎞️ Fita de borda (m)", f"{fita['quantidade'].sum():.1f}".replace(".", ","))
+        k3.metric("🔩 Componentes", int((df["tipo"] == "Componente").sum()))
+
+        show = df.rename(
+            columns={
+                "tipo": "Tipo",
+                "material": "Material / item",
+                "espessura_mm": "Espessura (mm)",
+                "unidade": "Unidade",
+                "quantidade": "Quantidade",
+                "chapas": "Chapas",
+                "pedidos": "Pedidos",
+            }
+        )
+        show["Quantidade"] = show["Quantidade"].round(2)
+        st.dataframe(show, use_container_width=True, hide_index=True)
+        st.download_button(
+            "⬇️ Baixar CSV",
+            data=materiais.para_csv(df),
+            file_name=f"materiais_{hoje:%Y%m%d}.csv",
+            mime="text/csv",
+            use_container_width=True,
+        )
+        st.caption(
+            f"Chapas = área das peças ÷ ({corte.CHAPA_PADRAO[0]:g} × {corte.CHAPA_PADRAO[1]:g} mm × "
+            f"{materiais.APROVEITAMENTO_CHAPA:.0%} de aproveitamento). Para o número exato, use o plano de corte no orçamento."
+        )
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    with st.expander("🧩 Composição de itens (kits)", expanded=False):
+        st.caption("Item = descrição usada nos pedidos (sem diferenciar maiúsculas). Componente pode ser outro item composto.")
+        comp = pd.DataFrame(materiais.listar_composicoes() or [], columns=["item", "componente", "unidade", "qtd"])
+        editado = st.data_editor(comp, num_rows="dynamic", use_container_width=True, key="mat_comp")
+        if st.button("💾 Salvar composições", key="mat_comp_sv", use_container_width=True):
+            n = materiais.salvar_composicoes(editado.to_dict("records"))
+            fetch_necessidades.clear()
+            st.success(f"{n} linha(s) salvas.")
+            st.rerun()
+
+
+def page_catalogo():
+    render_topbar("📚 Catálogo", "Produtos, preços e medidas padrão dos itens")
+
+    if not can(["comercial", "admin"]):
+        st.warning("Acesso restrito.")
+        return
+
+    st.markdown('<div class="cardx">', unsafe_allow_html=True)
+    q = st.text_input("Buscar produto", placeholder="início da descrição, código ou trecho", key="cat_q")
+    if q and q.strip():
+        achados = catalogo.buscar(q, limite=50)
+        if achados:
+            df = pd.DataFrame(achados)[["codigo", "descricao", "unidade", "valor_unit"]]
+            df["valor_unit"] = brl_serie(df["valor_unit"])
+            st.dataframe(
+                df.rename(columns={"codigo": "Código", "descricao": "Descrição", "unidade": "Unidade", "valor_unit": "Preço"}),
+                use_container_width=True,
+                hide_index=True,
+            )
+        else:
+            st.info("Nenhum produto encontrado.")
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    st.markdown('<div class="cardx" style="margin-top:14px;">', unsafe_allow_html=True)
+    st.subheader("✏️ Produtos ativos")
+    st.caption(
+        "Nos orçamentos e pedidos, item com a mesma descrição recebe daqui unidade, preço e medidas que estiverem vazios. "
+        "Apagar a linha desativa o produto; os itens já lançados não mudam."
+    )
+    prod = pd.DataFrame(catalogo.listar_produtos(), columns=["id"] + catalogo.CAMPOS)
+    editado = st.data_editor(
+        prod,
+        num_rows="dynamic",
+        use_container_width=True,
+        key="cat_editor",
+        column_config={
+            "id": None,
+            "codigo": st.column_config.TextColumn("Código"),
+            "descricao": st.column_config.TextColumn("Descrição", required=True),
+            "unidade": st.column_config.TextColumn("Unidade", default="Unid."),
+            "valor_unit": st.column_config.NumberColumn("Preço (R$)", min_value=0, step=0.01, format="%.2f"),
+            **{c: CONFIG_ITENS[c] for c in ("largura_mm", "altura_mm", "espessura_mm", "material", "fita_lados")},
+        },
+    )
+    if st.button("💾 Salvar catálogo", key="cat_sv", use_container_width=True):
+        ok, msg = catalogo.salvar_produtos(editado.to_dict("records"))
+        if ok:
+            st.session_state.pop("cat_editor", None)
+            st.success(msg)
+            st.rerun()
+        else:
+            st.error(msg)
+    st.markdown("</div>", unsafe_allow_html=True)
+
+
 def sidebar_nav_button(label: str, page_name: str, emoji: str, current: str):
     active = current == page_name
     tag = "ATIVO" if active else "ABRIR"
@@ -1490,7 +2281,10 @@ def sidebar():
     sidebar_nav_button("Funcionários", "Funcionários", "👷", current)
     sidebar_nav_button("Orçamentos", "Orçamento", "🧾", current)
     sidebar_nav_button("Pedidos", "Pedido", "📦", current)
+    sidebar_nav_button("Catálogo", "Catálogo", "📚", current)
     sidebar_nav_button("Produção", "Produção", "🏭", current)
+    sidebar_nav_button("Capacidade", "Capacidade", "⚖️", current)
+    sidebar_nav_button("Materiais", "Materiais", "🧱", current)
 
     st.sidebar.divider()
     st.sidebar.markdown("### Filtro por mês")
@@ -1540,6 +2334,9 @@ else:
         "Funcionários": page_funcionarios,
         "Orçamento": page_orcamento,
         "Pedido": page_pedido,
+        "Catálogo": page_catalogo,
         "Produção": page_producao,
+        "Capacidade": page_capacidade,
+        "Materiais": page_materiais,
     }
     routes.get(page, page_vendas)()
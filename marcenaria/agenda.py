@@ -0,0 +1,258 @@
+# Agenda de produção sugerida: quem faz qual etapa de qual pedido, e quando.
+#
+# Escalonador de lista: as etapas prontas ficam num heap ordenado pela folga
+# (prazo − pronto − trabalho que ainda falta no pedido). A de menor folga vai
+# para o funcionário apto (FUNCOES_POR_ETAPA) que a termina mais cedo,
+# encaixada no primeiro buraco livre da agenda dele, não só no fim. Quando
+# uma etapa é alocada, a seguinte do mesmo pedido entra no heap.
+#
+# Replanejar um pedido que andou no Kanban não refaz tudo: as tarefas dele
+# saem das agendas e só as dele são encaixadas de novo nos buracos. Os outros
+# pedidos não se mexem até o próximo planejamento completo.
+#
+# Tempo em dias corridos a partir da meia-noite de hoje (America/Fortaleza);
+# duração de cada etapa = mediana histórica dela (analytics.duracoes_fechadas).
+#
+#   python -m marcenaria.agenda
+import heapq
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .config import ETAPAS_PRODUCAO, FUNCOES_POR_ETAPA, FORTALEZA_TZ
+from .data_access import listar_funcionarios
+from .previsao import etapas_restantes, pedidos_abertos
+from . import analytics
+
+# etapa sem histórico
+DURACAO_PADRAO = 1.0
+# etapa já estourada (mais tempo do que a mediana) ainda ocupa alguém
+DURACAO_MINIMA = 0.25
+
+_SEM_PRAZO = float("inf")
+
+
+@dataclass
+class Tarefa:
+    pedido_id: int
+    etapa: str
+    funcionario_id: int | None
+    inicio: float
+    fim: float
+
+
+class Agenda:
+    """
+    `funcionarios`: linhas de listar_funcionarios (id, nome, funcao, capacidade).
+    `duracoes`: {etapa: dias}. Cada funcionário tem `capacidade` trilhas; cada
+    trilha é uma lista de intervalos (inicio, fim) ordenada e sem sobreposição.
+    """
+
+    def __init__(self, funcionarios: list[dict], duracoes: dict, agora: datetime | None = None):
+        self.agora = agora or datetime.now(FORTALEZA_TZ)
+        self.origem = pd.Timestamp(self.agora).normalize()
+        self.t0 = (pd.Timestamp(self.agora) - self.origem).total_seconds() / 86400.0
+
+        self.nomes = {int(f["id"]): f.get("nome") or "" for f in funcionarios}
+        self.trilhas: dict[tuple, list] = {}
+        for f in funcionarios:
+            for k in range(max(1, int(f.get("capacidade") or 1))):
+                self.trilhas[(int(f["id"]), k)] = []
+
+        self.aptos: dict[str, list[tuple]] = {}
+        for etapa in ETAPAS_PRODUCAO:
+            chaves = FUNCOES_POR_ETAPA.get(etapa, ())
+            ids = {
+                int(f["id"]) for f in funcionarios
+                if any(c in (f.get("funcao") or "").lower() for c in chaves)
+            } or set(self.nomes)
+            self.aptos[etapa] = [t for t in self.trilhas if t[0] in ids]
+
+        self.historico = duracoes
+        self.duracoes = {e: float(duracoes.get(e) or DURACAO_PADRAO) for e in ETAPAS_PRODUCAO}
+        self.pedidos: dict[int, dict] = {}
+        self.tarefas: dict[int, list[tuple]] = {}  # pedido_id -> [(trilha, Tarefa)]
+
+    # -------------------------
+    # encaixe
+    # -------------------------
+    @staticmethod
+    def _buraco(trilha: list, pronto: float, dur: float) -> float:
+        """Início mais cedo >= pronto em que `dur` cabe entre os intervalos da trilha."""
+        i = max(0, bisect_right(trilha, (pronto, _SEM_PRAZO)) - 1)
+        inicio = pronto
+        for ini, fim, *_ in trilha[i:]:
+            if inicio + dur <= ini:
+                return inicio
+            inicio = max(inicio, fim)
+        return inicio
+
+    def _alocar(self, pid: int, etapa: str, pronto: float, dur: float, fixo: int | None = None) -> Tarefa:
+        candidatas = self.aptos[etapa]
+        if fixo is not None and any(t[0] == fixo for t in self.trilhas):
+            candidatas = [t for t in self.trilhas if t[0] == fixo]
+        if not candidatas:
+            tarefa = Tarefa(pid, etapa, None, pronto, pronto + dur)
+            self.tarefas.setdefault(pid, []).append((None, tarefa))
+            return tarefa
+
+        melhor, inicio = None, _SEM_PRAZO
+        for t in candidatas:
+            ini = self._buraco(self.trilhas[t], pronto, dur)
+            if ini < inicio:
+                melhor, inicio = t, ini
+        tarefa = Tarefa(pid, etapa, melhor[0], inicio, inicio + dur)
+        trilha = self.trilhas[melhor]
+        trilha.insert(bisect_right(trilha, (inicio, tarefa.fim)), (inicio, tarefa.fim, pid, etapa))
+        self.tarefas.setdefault(pid, []).append((melhor, tarefa))
+        return tarefa
+
+    def _remover(self, pid: int):
+        for trilha, tarefa in self.tarefas.pop(pid, []):
+            if trilha is not None:
+                self.trilhas[trilha].remove((tarefa.inicio, tarefa.fim, pid, tarefa.etapa))
+
+    # -------------------------
+    # pedidos
+    # -------------------------
+    def _restantes(self, p: dict) -> list[tuple]:
+        """[(etapa, dias)] que faltam (previsao.etapas_restantes), a começar pela atual."""
+        etapas = etapas_restantes(p.get("etapa_atual"), p.get("status_etapa") == "Concluído", self.historico)
+        out = [(e, self.duracoes[e]) for e in etapas]
+        if out and out[0][0] == p.get("etapa_atual"):
+            gasto = float(p.get("dias_na_etapa") or 0.0)
+            out[0] = (out[0][0], max(DURACAO_MINIMA, out[0][1] - gasto))
+        return out
+
+    def _prazo(self, p: dict) -> float:
+        entrega = pd.to_datetime(p.get("data_entrega_prevista"), errors="coerce")
+        if pd.isna(entrega):
+            return _SEM_PRAZO
+        # fim do dia da entrega
+        return (entrega.normalize() - self.origem.tz_localize(None)).days + 1.0
+
+    def _registrar(self, abertos: pd.DataFrame) -> list[tuple]:
+        fila = []
+        for p in abertos.to_dict("records"):
+            pid = int(p["id"])
+            passos = self._restantes(p)
+            prazo = self._prazo(p)
+            p["_passos"], p["_prazo"] = passos, prazo
+            # a etapa em andamento fica com quem já está nela
+            p["_fixo"] = (
+                int(p["responsavel_id"])
+                if p.get("status_etapa") in ("Em andamento", "Pausado") and not pd.isna(p.get("responsavel_id"))
+                else None
+            )
+            self.pedidos[pid] = p
+            if passos:
+                falta = sum(d for _, d in passos)
+                fila.append((prazo - self.t0 - falta, self.t0, pid, 0))
+        return fila
+
+    def _escalonar(self, fila: list[tuple]):
+        heapq.heapify(fila)
+        while fila:
+            _, pronto, pid, i = heapq.heappop(fila)
+            p = self.pedidos[pid]
+            etapa, dur = p["_passos"][i]
+            tarefa = self._alocar(pid, etapa, pronto, dur, p["_fixo"] if i == 0 else None)
+            if i + 1 < len(p["_passos"]):
+                falta = sum(d for _, d in p["_passos"][i + 1:])
+                heapq.heappush(fila, (p["_prazo"] - tarefa.fim - falta, tarefa.fim, pid, i + 1))
+
+    def planejar(self, abertos: pd.DataFrame):
+        """Planejamento completo de todos os pedidos em aberto."""
+        for t in self.trilhas.values():
+            t.clear()
+        self.pedidos.clear()
+        self.tarefas.clear()
+        self._escalonar(self._registrar(abertos))
+        return self
+
+    def replanejar(self, ids, abertos: pd.DataFrame):
+        """
+        Só os pedidos `ids` (ex.: os que acabaram de andar no Kanban).
+        `abertos` traz o estado novo deles; quem não estiver lá saiu da produção.
+        """
+        for pid in ids:
+            self._remover(int(pid))
+            self.pedidos.pop(int(pid), None)
+        self._escalonar(self._registrar(abertos))
+        return self
+
+    # -------------------------
+    # saída
+    # -------------------------
+    def _dt(self, dias):
+        return self.origem + pd.to_timedelta(dias, unit="D")
+
+    def tarefas_df(self) -> pd.DataFrame:
+        linhas = [
+            (t.pedido_id, self.pedidos[t.pedido_id].get("codigo"), t.etapa, t.funcionario_id,
+             self.nomes.get(t.funcionario_id, "Sem responsável"), t.inicio, t.fim)
+            for lst in self.tarefas.values() for _, t in lst
+        ]
+        df = pd.DataFrame(linhas, columns=["pedido_id", "codigo", "etapa", "funcionario_id", "funcionario", "inicio_d", "fim_d"])
+        df["inicio"] = self._dt(df["inicio_d"].to_numpy(dtype=float))
+        df["fim"] = self._dt(df["fim_d"].to_numpy(dtype=float))
+        return df.sort_values(["inicio_d", "codigo"], ignore_index=True)
+
+    def resumo(self) -> pd.DataFrame:
+        """Uma linha por pedido: término planejado, prazo e atraso (dias, 0 se no prazo)."""
+        ids = list(self.tarefas)
+        fim = np.array([max(t.fim for _, t in self.tarefas[pid]) for pid in ids], dtype=float)
+        prazo = np.array([self.pedidos[pid]["_prazo"] for pid in ids], dtype=float)
+        atraso = np.where(np.isfinite(prazo), np.maximum(0.0, fim - prazo), 0.0)
+        return pd.DataFrame(
+            {
+                "pedido_id": ids,
+                "codigo": [self.pedidos[pid].get("codigo") for pid in ids],
+                "termino": self._dt(fim),
+                "entrega_prevista": [self.pedidos[pid].get("data_entrega_prevista") for pid in ids],
+                "atraso_dias": atraso,
+            }
+        ).sort_values(["atraso_dias", "termino"], ascending=[False, True], ignore_index=True)
+
+    def plano_diario(self, dias: int = 14) -> pd.DataFrame:
+        """Dia a dia: quem está em qual etapa de qual pedido nos próximos `dias`."""
+        df = self.tarefas_df()
+        if df.empty:
+            return pd.DataFrame(columns=["dia", "funcionario", "codigo", "etapa"])
+        d = np.arange(dias, dtype=float)
+        ini = df["inicio_d"].to_numpy(dtype=float)[:, None]
+        fim = df["fim_d"].to_numpy(dtype=float)[:, None]
+        t_idx, d_idx = np.nonzero((ini < d + 1) & (fim > d))
+        out = df.iloc[t_idx][["funcionario", "codigo", "etapa"]].reset_index(drop=True)
+        out.insert(0, "dia", self._dt(d[d_idx]).date)
+        return out.sort_values(["dia", "funcionario", "codigo"], ignore_index=True)
+
+
+def duracoes_medianas(meses: int = 12) -> dict:
+    return {e: float(np.median(v)) for e, v in analytics.duracoes_fechadas(meses).items() if len(v)}
+
+
+def carregar_agenda(agora: datetime | None = None) -> Agenda:
+    """Agenda completa a partir do banco (funcionários ativos, histórico e pedidos em aberto)."""
+    ag = Agenda(listar_funcionarios(ativo_only=True) or [], duracoes_medianas(), agora=agora)
+    return ag.planejar(pedidos_abertos())
+
+
+if __name__ == "__main__":
+    import time
+
+    t = time.perf_counter()
+    ag = carregar_agenda()
+    print(f"plano completo: {len(ag.pedidos)} pedido(s), {time.perf_counter() - t:.3f}s (com consultas)")
+
+    res = ag.resumo()
+    print(res.head(15).to_string())
+    if len(res):
+        pid = int(res["pedido_id"].iloc[0])
+        abertos = pedidos_abertos([pid])
+        t = time.perf_counter()
+        ag.replanejar([pid], abertos)
+        print(f"replanejar 1 pedido: {(time.perf_counter() - t) * 1000:.2f} ms")
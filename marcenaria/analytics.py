@@ -0,0 +1,87 @@
+# Percentis de duração das etapas de produção (producao_etapas).
+#
+# Média engana com cauda longa (uma Montagem de 40 dias puxa tudo para cima),
+# então o semáforo e os painéis usam p50/p75/p90/p95. Uma consulta só, com
+# GROUPING SETS: por etapa, por etapa + responsável e por etapa + mês.
+# A unidade é a visita à etapa (data_access.sql_visitas_etapa), não a linha:
+# cada troca de status abre uma linha nova. Só entram visitas fechadas.
+import numpy as np
+import pandas as pd
+
+from .data_access import fetch_dataframe, sql_visitas_etapa
+
+PERCENTIS = ("p50", "p75", "p90", "p95")
+
+# abaixo disso o percentil não diz nada; o semáforo volta para a média
+MIN_AMOSTRAS = 5
+
+# início da janela de `meses` meses (parâmetro da consulta)
+_DESDE = "date_trunc('month', now()) - make_interval(months => %(meses)s)"
+
+
+def percentis_etapas(meses: int = 12) -> pd.DataFrame:
+    """
+    Colunas: dimensao ('etapa' | 'responsavel' | 'mes'), etapa, responsavel_id,
+    responsavel_nome, mes, n, media, p50, p75, p90, p95 (dias).
+    """
+    return fetch_dataframe(f"""
+        WITH {sql_visitas_etapa(_DESDE)},
+        dur AS (
+            SELECT
+                v.etapa,
+                v.responsavel_id,
+                date_trunc('month', v.fim_em) AS mes,
+                GREATEST(0, EXTRACT(EPOCH FROM (v.fim_em - v.inicio_em)) / 86400.0) AS dias
+            FROM visitas v
+            WHERE v.fim_em >= {_DESDE}
+        ),
+        g AS (
+            SELECT
+                CASE GROUPING(responsavel_id, mes)
+                    WHEN 3 THEN 'etapa'
+                    WHEN 1 THEN 'responsavel'
+                    ELSE 'mes'
+                END AS dimensao,
+                etapa,
+                responsavel_id,
+                mes,
+                COUNT(*) AS n,
+                AVG(dias) AS media,
+                percentile_cont(0.50) WITHIN GROUP (ORDER BY dias) AS p50,
+                percentile_cont(0.75) WITHIN GROUP (ORDER BY dias) AS p75,
+                percentile_cont(0.90) WITHIN GROUP (ORDER BY dias) AS p90,
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY dias) AS p95
+            FROM dur
+            GROUP BY GROUPING SETS ((etapa), (etapa, responsavel_id), (etapa, mes))
+        )
+        SELECT g.*, f.nome AS responsavel_nome
+        FROM g
+        LEFT JOIN bd_marcenaria.funcionarios f ON f.id = g.responsavel_id
+        ORDER BY g.dimensao, g.etapa, g.mes, f.nome
+    """, {"meses": int(meses)})
+
+
+def limiares_por_etapa(df: pd.DataFrame, min_amostras: int = MIN_AMOSTRAS) -> dict:
+    """{etapa: {"n", "p50", "p75", "p90", "p95"}} só das etapas com amostra suficiente."""
+    if df is None or df.empty:
+        return {}
+    base = df[(df["dimensao"] == "etapa") & (df["n"] >= min_amostras)]
+    return {
+        r["etapa"]: {"n": int(r["n"]), **{p: float(r[p]) for p in PERCENTIS}}
+        for r in base[["etapa", "n", *PERCENTIS]].to_dict("records")
+    }
+
+
+def duracoes_fechadas(meses: int = 12) -> dict:
+    """{etapa: np.ndarray ordenado de durações (dias)} das visitas fechadas no período."""
+    df = fetch_dataframe(f"""
+        WITH {sql_visitas_etapa(_DESDE)}
+        SELECT
+            v.etapa,
+            GREATEST(0, EXTRACT(EPOCH FROM (v.fim_em - v.inicio_em)) / 86400.0) AS dias
+        FROM visitas v
+        WHERE v.fim_em >= {_DESDE}
+    """, {"meses": int(meses)})
+    if df.empty:
+        return {}
+    return {etapa: np.sort(g.to_numpy(dtype=float)) for etapa, g in df.groupby("etapa")["dias"]}
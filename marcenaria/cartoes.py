@@ -0,0 +1,161 @@
+import html
+from string import Template
+
+# =========================
+# TEMPLATES (compilados uma vez, no import)
+# =========================
+# Tudo em uma linha só: vários cards concatenados viram UM bloco HTML no markdown
+# (linha em branco ou indentação de 4 espaços quebraria o bloco).
+_KANBAN_CARD = Template(
+    '<div class="cardx" style="padding:14px;margin-bottom:10px;">'
+    '<div style="display:flex;justify-content:space-between;gap:10px;align-items:flex-start;">'
+    '<div style="font-weight:1000;">📦 $codigo</div>'
+    '<span class="kbadge">$status</span>'
+    '</div>'
+    '<div class="muted" style="margin-top:4px;">$cliente</div>'
+    '<div class="muted">👤 $responsavel</div>'
+    '<div class="muted">🚚 Entrega $entrega</div>'
+    '<div class="muted">💰 $total</div>'
+    '</div>'
+)
+
+_TIMELINE_CARD = Template(
+    '<div class="cardx" style="margin:12px 0;">'
+    '<div style="display:flex;justify-content:space-between;gap:12px;align-items:flex-start;flex-wrap:wrap;">'
+    '<div>'
+    '<div style="font-weight:1000;font-size:1.05rem;">📦 $codigo</div>'
+    '<div class="muted">$cliente</div>'
+    '<div class="muted">Etapa <b>$etapa</b> • Status <b>$status</b> • Total <b>$total</b></div>'
+    '</div>'
+    '<div style="display:flex;gap:8px;flex-wrap:wrap;align-items:center;">'
+    '<span class="kbadge">🗓️ Criado <b>$criado</b></span>'
+    '<span class="kbadge">🔄 Atualizado <b>$atualizado</b></span>'
+    '<span class="kbadge $prazo_badge">🚚 $prazo</span>'
+    '<span class="kbadge">⏱️ Andamento <b>$andamento dia(s)</b></span>'
+    '<span class="sem-pill $sem_cls">🚦 $sem_txt</span>'
+    '<span class="kbadge $prev_badge">🔮 $previsao</span>'
+    '</div>'
+    '</div>'
+    '<div class="muted" style="margin-top:8px;">$sem_detail</div>'
+    '</div>'
+)
+
+_TIMELINE_LINHA = Template(
+    '<div class="tl-row">'
+    '<div><div class="tl-dot"></div></div>'
+    '<div class="tl-box">'
+    '<div style="display:flex;gap:8px;flex-wrap:wrap;align-items:center;">'
+    '<span class="kbadge">🧱 <b>$etapa</b></span>'
+    '<span class="kbadge">📌 <b>$status</b></span>'
+    '<span class="kbadge">👤 <b>$responsavel</b></span>'
+    '<span class="kbadge">⏱️ <b>$duracao</b></span>'
+    '<span class="kbadge">$situacao</span>'
+    '</div>'
+    '<div class="muted" style="margin-top:6px;">Início <b>$inicio</b>$fim</div>'
+    '<div class="muted" style="margin-top:4px;">📝 $obs</div>'
+    '</div>'
+    '</div>'
+)
+
+
+def _esc(v) -> str:
+    if v is None:
+        return ""
+    return html.escape(str(v), quote=True)
+
+
+def _fill(tpl: Template, d: dict, campos) -> str:
+    return tpl.substitute({k: _esc(d.get(k)) for k in campos})
+
+
+_CAMPOS_KANBAN = ("codigo", "status", "cliente", "responsavel", "entrega", "total")
+_CAMPOS_TIMELINE = (
+    "codigo", "cliente", "etapa", "status", "total", "criado", "atualizado",
+    "prazo_badge", "prazo", "andamento", "sem_cls", "sem_txt", "sem_detail",
+    "prev_badge", "previsao",
+)
+
+
+# =========================
+# KANBAN
+# =========================
+def kanban_coluna_html(cards: list[dict]) -> str:
+    """
+    Uma coluna inteira do Kanban em um único bloco HTML (um delta só no Streamlit).
+    Cada card já vem com os textos formatados; aqui só escapa e preenche.
+    """
+    return "".join(_fill(_KANBAN_CARD, c, _CAMPOS_KANBAN) for c in (cards or []))
+
+
+# =========================
+# LINHA DO TEMPO
+# =========================
+def timeline_card_html(card: dict) -> str:
+    return _fill(_TIMELINE_CARD, card, _CAMPOS_TIMELINE)
+
+
+def timeline_historico_html(linhas: list[dict]) -> str:
+    """
+    Histórico detalhado de um pedido em um único bloco HTML.
+    `fim` é o texto da data de fim (vazio quando a etapa está em andamento).
+    """
+    out = []
+    for r in linhas or []:
+        fim = r.get("fim")
+        out.append(
+            _TIMELINE_LINHA.substitute(
+                etapa=_esc(r.get("etapa")),
+                status=_esc(r.get("status")),
+                responsavel=_esc(r.get("responsavel")),
+                duracao=_esc(r.get("duracao")),
+                situacao="✅ Finalizado" if fim else "🟣 Em andamento",
+                inicio=_esc(r.get("inicio")),
+                fim=f" • Fim <b>{_esc(fim)}</b>" if fim else " • <b>Em andamento</b>",
+                obs=_esc(r.get("obs")),
+            )
+        )
+    return "".join(out)
+
+
+# =========================
+# MEDIÇÃO (python -m marcenaria.cartoes)
+# =========================
+def _medir(n_pedidos: int = 200, n_colunas: int = 4, hist_por_pedido: int = 5):
+    cards = [
+        {
+            "codigo": f"PED{i:06d}",
+            "status": "Em andamento",
+            "cliente": f"Cliente {i}",
+            "responsavel": "Não definido",
+            "entrega": "20/10/2026",
+            "total": "R$ 12.345,67",
+        }
+        for i in range(n_pedidos)
+    ]
+    colunas = [cards[i::n_colunas] for i in range(n_colunas)]
+    hist = [
+        {"etapa": "Produção", "status": "Em andamento", "responsavel": "Func", "duracao": "3d",
+         "inicio": "10/10/2026 08:00", "fim": "", "obs": "Sem observações."}
+        for _ in range(hist_por_pedido)
+    ]
+
+    # antes: um st.markdown por card e um por linha do histórico
+    antes_kanban = [kanban_coluna_html([c]) for c in cards]
+    antes_hist = [timeline_historico_html([h]) for _ in range(n_pedidos) for h in hist]
+    # depois: um por coluna e um por linha do tempo expandida
+    depois_kanban = [kanban_coluna_html(col) for col in colunas]
+    depois_hist = [timeline_historico_html(hist) for _ in range(n_pedidos)]
+
+    def _tot(blocos):
+        return len(blocos), sum(len(b.encode("utf-8")) for b in blocos)
+
+    for nome, antes, depois in (
+        ("kanban", antes_kanban, depois_kanban),
+        ("historico", antes_hist, depois_hist),
+    ):
+        (ma, ba), (md, bd) = _tot(antes), _tot(depois)
+        print(f"{nome:<10} antes: {ma:>5} deltas {ba:>8} bytes | depois: {md:>5} deltas {bd:>8} bytes")
+
+
+if __name__ == "__main__":
+    _medir()
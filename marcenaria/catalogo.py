@@ -0,0 +1,247 @@
+# Catálogo de produtos: descrição, unidade, preço e medidas padrão.
+#
+# A busca no banco usa os índices de produtos: lower(descricao)
+# text_pattern_ops para prefixo e pg_trgm (quando instalado) para trecho no
+# meio. O editor de itens não vai ao banco a cada tecla: a tabela de preços
+# inteira (poucas centenas de linhas) fica em memória. Ela é recarregada quando
+# o catálogo muda: na hora, se a mudança foi feita por aqui; senão, na primeira
+# consulta depois de CONFERIR_A_CADA_S segundos em que o marcador do banco mudou.
+#
+#   python -m marcenaria.catalogo "armário"    (busca e mede as consultas)
+import threading
+import time
+
+from psycopg2 import errors
+from psycopg2.extras import RealDictCursor
+
+from .db_connector import get_db_connection
+from .data_access import escapar_like
+from .formatacao import celula_num, celula_texto, celula_vazia
+
+# de quanto em quanto tempo o cache pergunta ao banco se o catálogo mudou (s)
+CONFERIR_A_CADA_S = 30.0
+
+CAMPOS = ["codigo", "descricao", "unidade", "valor_unit", "largura_mm", "altura_mm", "espessura_mm", "material", "fita_lados"]
+
+# o que o catálogo preenche num item de orçamento/pedido (descricao é a chave)
+CAMPOS_ITEM = ["unidade", "valor_unit", "largura_mm", "altura_mm", "espessura_mm", "material", "fita_lados"]
+
+_trava = threading.Lock()
+_cache = {"marcador": None, "conferido": 0.0, "precos": {}}
+
+
+# =========================
+# BANCO
+# =========================
+def buscar(termo: str, limite: int = 20, inativos: bool = False) -> list[dict]:
+    """
+    Produtos cuja descrição ou código começa com `termo` (primeiro) ou contém `termo`.
+    Sem `termo`, lista em ordem alfabética.
+    """
+    termo = (termo or "").strip().lower()
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"""
+                SELECT id, {", ".join(CAMPOS)}, ativo
+                FROM bd_marcenaria.produtos
+                WHERE (%(inativos)s OR ativo)
+                  AND (%(termo)s = ''
+                       OR lower(descricao) LIKE %(prefixo)s
+                       OR codigo LIKE %(prefixo_cod)s
+                       OR descricao ILIKE %(trecho)s)
+                ORDER BY (lower(descricao) LIKE %(prefixo)s) DESC, lower(descricao)
+                LIMIT %(limite)s
+            """, {
+                "inativos": inativos,
+                "termo": termo,
+                "prefixo": escapar_like(termo) + "%",
+                "prefixo_cod": escapar_like(termo.upper()) + "%",
+                "trecho": "%" + escapar_like(termo) + "%",
+                "limite": int(limite),
+            })
+            return cur.fetchall() or []
+
+
+def listar_produtos(inativos: bool = False) -> list[dict]:
+    return buscar("", limite=100000, inativos=inativos)
+
+
+def salvar_produtos(linhas: list[dict]) -> tuple:
+    """
+    Grava o catálogo editado: linha com id é atualizada, sem id entra (ou atualiza
+    o produto de mesma descrição), e produto ativo que sumiu da lista é desativado
+    (os itens antigos continuam com a descrição). Renomear para a descrição de um
+    produto inativo, ou de um que saiu da lista, apaga esse produto antes.
+    Retorna (ok, msg).
+    """
+    vistos, validas = set(), []
+    for r in linhas or []:
+        desc = "" if celula_vazia(r.get("descricao")) else " ".join(str(r["descricao"]).split())
+        if not desc:
+            continue
+        if desc.lower() in vistos:
+            return False, f"Descrição repetida no catálogo: “{desc}”."
+        vistos.add(desc.lower())
+        valor = r.get("valor_unit")
+        valor = 0.0 if celula_vazia(valor) else float(valor)
+        medidas = [celula_num(r.get(c)) for c in ("largura_mm", "altura_mm", "espessura_mm")]
+        validas.append({
+            "id": None if celula_vazia(r.get("id")) else int(r["id"]),
+            "codigo": None if celula_vazia(r.get("codigo")) else str(r["codigo"]).strip().upper(),
+            "descricao": desc,
+            "unidade": "Unid." if celula_vazia(r.get("unidade")) else str(r["unidade"]).strip(),
+            "valor_unit": round(valor, 2),
+            "largura_mm": medidas[0],
+            "altura_mm": medidas[1],
+            "espessura_mm": medidas[2],
+            "material": celula_texto(r.get("material")),
+            "fita_lados": 0 if celula_vazia(r.get("fita_lados")) else int(min(4, max(0, float(r["fita_lados"])))),
+        })
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            # a descrição é única: produto inativo (ou que saiu da lista) com o nome novo de outro sai antes
+            com_id = [p for p in validas if p["id"] is not None]
+            if com_id:
+                cur.execute("""
+                    DELETE FROM bd_marcenaria.produtos p
+                    USING unnest(%s::int[], %s::text[]) AS v(id, descricao)
+                    WHERE lower(p.descricao) = lower(v.descricao)
+                      AND p.id <> v.id
+                      AND (NOT p.ativo OR NOT (p.id = ANY(%s::int[])))
+                """, ([p["id"] for p in com_id], [p["descricao"] for p in com_id], [p["id"] for p in com_id]))
+
+            ids = []
+            try:
+                for p in validas:
+                    if p["id"] is not None:
+                        cur.execute("""
+                            UPDATE bd_marcenaria.produtos
+                            SET codigo=%(codigo)s, descricao=%(descricao)s, unidade=%(unidade)s, valor_unit=%(valor_unit)s,
+                                largura_mm=%(largura_mm)s, altura_mm=%(altura_mm)s, espessura_mm=%(espessura_mm)s,
+                                material=%(material)s, fita_lados=%(fita_lados)s, ativo=TRUE, updated_at=CURRENT_TIMESTAMP
+                            WHERE id=%(id)s
+                            RETURNING id
+                        """, p)
+                        linha = cur.fetchone()
+                        if linha:
+                            ids.append(linha[0])
+                            continue
+                    cur.execute("""
+                        INSERT INTO bd_marcenaria.produtos
+                        (codigo,descricao,unidade,valor_unit,largura_mm,altura_mm,espessura_mm,material,fita_lados)
+                        VALUES (%(codigo)s,%(descricao)s,%(unidade)s,%(valor_unit)s,%(largura_mm)s,%(altura_mm)s,%(espessura_mm)s,%(material)s,%(fita_lados)s)
+                        ON CONFLICT ((lower(descricao))) DO UPDATE
+                        SET codigo=EXCLUDED.codigo, descricao=EXCLUDED.descricao, unidade=EXCLUDED.unidade,
+                            valor_unit=EXCLUDED.valor_unit, largura_mm=EXCLUDED.largura_mm, altura_mm=EXCLUDED.altura_mm,
+                            espessura_mm=EXCLUDED.espessura_mm, material=EXCLUDED.material, fita_lados=EXCLUDED.fita_lados,
+                            ativo=TRUE, updated_at=CURRENT_TIMESTAMP
+                        RETURNING id
+                    """, p)
+                    ids.append(cur.fetchone()[0])
+            except errors.UniqueViolation:
+                # troca de nomes entre dois produtos da lista na mesma gravação
+                conn.rollback()
+                return False, f"Já existe outro produto com a descrição “{p['descricao']}”. Renomeie um de cada vez."
+
+            cur.execute("""
+                UPDATE bd_marcenaria.produtos
+                SET ativo=FALSE, updated_at=CURRENT_TIMESTAMP
+                WHERE ativo AND NOT (id = ANY(%s::int[]))
+            """, (ids,))
+            desativados = cur.rowcount
+            conn.commit()
+
+    invalidar()
+    return True, f"{len(ids)} produto(s) salvos" + (f", {desativados} desativado(s)." if desativados else ".")
+
+
+# =========================
+# TABELA DE PREÇOS EM MEMÓRIA
+# =========================
+def _marcador() -> tuple:
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*), MAX(updated_at), MAX(id) FROM bd_marcenaria.produtos")
+            return tuple(str(v) for v in cur.fetchone())
+
+
+def invalidar():
+    with _trava:
+        _cache["marcador"] = None
+        _cache["conferido"] = 0.0
+
+
+def _atualizar():
+    agora = time.monotonic()
+    with _trava:
+        if _cache["marcador"] is not None and agora - _cache["conferido"] < CONFERIR_A_CADA_S:
+            return
+        marcador = _marcador()
+        _cache["conferido"] = agora
+        if marcador == _cache["marcador"]:
+            return
+        precos = {}
+        for p in buscar("", limite=100000):
+            p["valor_unit"] = float(p["valor_unit"] or 0)
+            for c in ("largura_mm", "altura_mm", "espessura_mm"):
+                p[c] = None if p[c] is None else float(p[c])
+            precos[p["descricao"].lower()] = p
+        _cache["precos"] = precos
+        _cache["marcador"] = marcador
+
+
+def tabela_precos() -> dict:
+    """{descrição em minúsculas: produto} dos produtos ativos. Recarregar troca o dict inteiro; não mexa nele."""
+    _atualizar()
+    return _cache["precos"]
+
+
+def produto(descricao) -> dict | None:
+    if celula_vazia(descricao):
+        return None
+    return tabela_precos().get(" ".join(str(descricao).split()).lower())
+
+
+def preencher_itens(itens: list[dict]) -> list[dict]:
+    """
+    Itens cuja descrição está no catálogo recebem dele o que estiver vazio.
+    O que foi digitado no item prevalece, inclusive preço 0 e "Unid.".
+    """
+    precos = tabela_precos()
+    out = []
+    for it in itens or []:
+        p = None if celula_vazia(it.get("descricao")) else precos.get(" ".join(str(it["descricao"]).split()).lower())
+        if p:
+            it = dict(it)
+            for c in CAMPOS_ITEM:
+                if celula_vazia(it.get(c)) and not celula_vazia(p.get(c)):
+                    it[c] = p[c]
+        out.append(it)
+    return out
+
+
+def item_do_produto(p: dict, qtd: float = 1) -> dict:
+    """Linha de item de orçamento/pedido a partir de um produto do catálogo."""
+    return {"descricao": p["descricao"], "qtd": qtd, **{c: p.get(c) for c in CAMPOS_ITEM}}
+
+
+if __name__ == "__main__":
+    import sys
+
+    termo = sys.argv[1] if len(sys.argv) > 1 else ""
+    t = time.perf_counter()
+    achados = buscar(termo)
+    print(f"banco: {len(achados)} produto(s) em {(time.perf_counter() - t) * 1000:.1f} ms")
+
+    invalidar()
+    t = time.perf_counter()
+    tabela_precos()
+    print(f"carga da tabela: {len(_cache['precos'])} produto(s) em {(time.perf_counter() - t) * 1000:.1f} ms")
+
+    itens = [{"descricao": p["descricao"]} for p in achados] * 50
+    t = time.perf_counter()
+    preencher_itens(itens)
+    print(f"preencher {len(itens)} itens em memória: {(time.perf_counter() - t) * 1000:.1f} ms")
+    for p in achados:
+        print(f"  {p['descricao']:<50} {p['unidade']:<8} {float(p['valor_unit'] or 0):>10.2f}")
@@ -7,6 +7,8 @@ FORTALEZA_TZ = pytz.timezone("America/Fortaleza")
 
 DB_SCHEMA = (os.environ.get("DB_SCHEMA") or "bd_marcenaria").strip()
 
+LOGO_URL = "https://i.ibb.co/FkXDym6H/logo-mamede.png"
+
 TEMA_CORES = {
     "primary": "#0B5FFF",
     "secondary": "#F3F6FF",
@@ -35,8 +37,23 @@ ETAPAS_PRODUCAO = [
     "Montagem",
 ]
 
+# Etapas fora do Kanban: nenhum pedido é movido para elas
+ETAPAS_KANBAN_EXCLUIR = {"Expedição", "Transporte"}
+
 STATUS_ETAPA = ["A fazer", "Em andamento", "Pausado", "Concluído"]
 
+# Quem pode fazer cada etapa na agenda sugerida (marcenaria.agenda): trechos
+# procurados em funcionarios.funcao, sem maiúsculas. Etapa sem ninguém apto
+# fica aberta para qualquer funcionário ativo.
+FUNCOES_POR_ETAPA = {
+    "Medição técnica": ("medi", "projet", "técnic"),
+    "Projeto técnico": ("projet", "desenh"),
+    "Produção": ("marcen", "produ", "auxiliar"),
+    "Expedição": ("exped", "auxiliar", "marcen"),
+    "Transporte": ("motor", "transp", "entreg"),
+    "Montagem": ("mont", "instal"),
+}
+
 def _env_bool(name: str, default: bool = False) -> bool:
     v = os.environ.get(name)
     if v is None:
@@ -87,11 +104,13 @@ def get_db_config():
         "sslmode": os.environ.get("DB_SSLMODE") or _safe_st_secrets_get("DB_SSLMODE", "prefer"),
     }
 
-# MVP: e-mail opcional (não usado)
+# E-mail opcional: enviado em segundo plano por marcenaria.notificacoes
 def get_email_config() -> dict:
     smtp_password = (os.environ.get("SMTP_PASSWORD") or os.environ.get("SMTP_PASS") or "").strip()
     return {
         "enabled_new": _env_bool("MAIL_ON_NEW_DEMANDA", False),
+        "enabled_etapa": _env_bool("MAIL_ON_MUDANCA_ETAPA", False),
+        "transport": (os.environ.get("MAIL_TRANSPORT") or "smtp").strip().lower(),
         "host": os.environ.get("SMTP_HOST", "").strip(),
         "port": _env_int("SMTP_PORT", 587),
         "user": os.environ.get("SMTP_USER", "").strip(),
@@ -103,6 +122,8 @@ def get_email_config() -> dict:
         "bcc": _env_list("MAIL_BCC"),
         "subject_prefix": os.environ.get("MAIL_SUBJECT_PREFIX", "Marcenaria").strip(),
         "timeout": _env_int("MAIL_SEND_TIMEOUT", 20),
+        # espera depois da primeira notificação antes de enviar: o que chegar nesse tempo vai no mesmo resumo
+        "debounce_s": _env_int("MAIL_DEBOUNCE_S", 60),
     }
 
 def get_brevo_config() -> dict:
@@ -114,3 +135,51 @@ def get_brevo_config() -> dict:
         "timeout": _env_int("BREVO_TIMEOUT", 20),
         "subject_prefix": os.environ.get("MAIL_SUBJECT_PREFIX", "Marcenaria").strip(),
     }
+
+def get_worker_config() -> dict:
+    return {
+        "sink": (os.environ.get("WORKER_SINK") or "log").strip(),
+        "lote": _env_int("WORKER_LOTE", 50),
+        "intervalo": _env_int("WORKER_INTERVALO", 5),
+        "max_tentativas": _env_int("WORKER_MAX_TENTATIVAS", 5),
+    }
+
+def get_webhook_config() -> dict:
+    return {
+        "urls": _env_list("WEBHOOK_URLS"),
+        "timeout": _env_int("WEBHOOK_TIMEOUT", 10),
+        "max_tentativas": _env_int("WEBHOOK_MAX_TENTATIVAS", 4),
+        "backoff_ms": _env_int("WEBHOOK_BACKOFF_MS", 500),
+        "backoff_max_ms": _env_int("WEBHOOK_BACKOFF_MAX_MS", 30000),
+        "concorrencia": _env_int("WEBHOOK_CONCORRENCIA", 4),
+        # tempo máximo de um lote (s): o worker segura os eventos travados enquanto isso
+        "prazo_lote_s": _env_int("WEBHOOK_PRAZO_LOTE_S", 30),
+        "token": (os.environ.get("WEBHOOK_TOKEN") or "").strip(),
+    }
+
+def _env_float(name: str, default: float | None) -> float | None:
+    try:
+        return float(str(os.environ[name]).strip().replace(",", "."))
+    except Exception:
+        return default
+
+# Rota de transporte/montagem (marcenaria.rotas). Sem ROTA_ORIGEM_LAT/LON a
+# rota começa na primeira parada e não volta.
+def get_rotas_config() -> dict:
+    lat, lon = _env_float("ROTA_ORIGEM_LAT", None), _env_float("ROTA_ORIGEM_LON", None)
+    return {
+        "origem": (lat, lon) if lat is not None and lon is not None else None,
+        "voltar": _env_bool("ROTA_VOLTAR", True),
+        # linha reta × fator ≈ distância pela estrada
+        "fator_estrada": _env_float("ROTA_FATOR_ESTRADA", 1.3),
+        "velocidade_kmh": _env_float("ROTA_VELOCIDADE_KMH", 40.0),
+    }
+
+def get_particoes_config() -> dict:
+    return {
+        "meses_a_frente": _env_int("PARTICOES_MESES_A_FRENTE", 3),
+        # 0 = sem retenção (guarda tudo)
+        "retencao_eventos_meses": _env_int("EVENTOS_RETENCAO_MESES", 0),
+        # "arquivar" move a partição para o schema de arquivo; "excluir" apaga
+        "retencao_acao": (os.environ.get("EVENTOS_RETENCAO_ACAO") or "arquivar").strip().lower(),
+    }
@@ -0,0 +1,272 @@
+# Plano de corte: encaixa as peças dos itens (largura × altura, em mm) em chapas padrão.
+#
+# Guilhotina: cada peça colocada divide o retângulo livre em dois, com corte de
+# ponta a ponta como na seccionadora. Para cada peça, todos os retângulos livres
+# de todas as chapas abertas são avaliados de uma vez com numpy: primeira chapa
+# em que cabe, e nela o retângulo que sobra menos. Por cima disso, uma busca
+# simples que varia a ordem das peças e a regra de divisão até estourar o
+# orçamento de tempo. Fica o plano com menos chapas e, no empate, a maior
+# sobra inteira (retalho aproveitável).
+#
+# Peças de material/espessura diferentes vão para chapas diferentes.
+#
+#   python -m marcenaria.corte     (mede com um projeto de exemplo)
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from .formatacao import celula_num, celula_texto
+
+# MDF mais comum no mercado (mm)
+CHAPA_PADRAO = (2750.0, 1840.0)
+# espessura da serra: some entre uma peça e outra
+SERRA_MM = 4.0
+# tempo total da busca por plano de corte (s); a UI roda a cada edição
+ORCAMENTO_S = 0.3
+
+# divisão do retângulo que sobra ao lado/acima da peça
+_REGRAS = ("eixo_menor", "eixo_maior", "area_maior")
+
+
+@dataclass
+class Peca:
+    rotulo: str
+    largura: float
+    altura: float
+    material: str = ""
+    espessura: float | None = None
+
+
+@dataclass
+class Chapa:
+    largura: float
+    altura: float
+    # (x, y, largura, altura, rotulo, girada)
+    pecas: list = field(default_factory=list)
+
+    @property
+    def area_pecas(self) -> float:
+        return float(sum(w * h for _, _, w, h, _, _ in self.pecas))
+
+
+@dataclass
+class Plano:
+    material: str
+    espessura: float | None
+    chapa: tuple
+    chapas: list
+    nao_cabem: list = field(default_factory=list)
+    tentativas: int = 0
+
+    @property
+    def area_pecas(self) -> float:
+        return sum(c.area_pecas for c in self.chapas)
+
+    @property
+    def area_total(self) -> float:
+        return len(self.chapas) * self.chapa[0] * self.chapa[1]
+
+    @property
+    def aproveitamento(self) -> float:
+        return self.area_pecas / self.area_total if self.area_total else 0.0
+
+    @property
+    def desperdicio_m2(self) -> float:
+        return (self.area_total - self.area_pecas) / 1e6
+
+
+# =========================
+# ITENS -> PEÇAS
+# =========================
+def pecas_dos_itens(itens: list[dict]) -> list[Peca]:
+    """Uma Peca por unidade de cada item com largura_mm e altura_mm (qtd arredondada)."""
+    out = []
+    for it in itens or []:
+        w, h = celula_num(it.get("largura_mm")), celula_num(it.get("altura_mm"))
+        if not w or not h:
+            continue
+        qtd = max(1, int(round(celula_num(it.get("qtd")) or 1)))
+        material = celula_texto(it.get("material"))
+        rotulo = str(it.get("descricao") or "").strip() or f"{w:g}×{h:g}"
+        out += [Peca(rotulo, w, h, material, celula_num(it.get("espessura_mm"))) for _ in range(qtd)]
+    return out
+
+
+# =========================
+# GUILHOTINA
+# =========================
+def _passada(dims: np.ndarray, W: float, H: float, serra: float, girar: bool, regra: str):
+    """
+    Encaixa as peças na ordem de `dims` (n×2). Retorna (colocações, n_chapas, maior_sobra)
+    com colocações = [(i, chapa, x, y, w, h, girada)].
+    """
+    # retângulos livres: chapa, x, y, w, h
+    livres = np.empty((0, 5))
+    colocadas = []
+    n_chapas = 0
+    for i, (pw, ph) in enumerate(dims):
+        fw, fh = livres[:, 3], livres[:, 4]
+        sobra = fw * fh - pw * ph
+        ok = (fw >= pw) & (fh >= ph)
+        chave = np.where(ok, livres[:, 0] * 1e12 + sobra, np.inf)
+        girada = False
+        if girar and pw != ph:
+            ok_g = (fw >= ph) & (fh >= pw)
+            chave_g = np.where(ok_g, livres[:, 0] * 1e12 + sobra, np.inf)
+            # gira só onde é melhor que sem girar
+            usar_g = chave_g < chave
+            chave = np.minimum(chave, chave_g)
+        j = int(np.argmin(chave)) if len(chave) else -1
+        if j < 0 or not np.isfinite(chave[j]):
+            # abre chapa nova
+            livres = np.vstack([livres, [n_chapas, 0.0, 0.0, W, H]])
+            n_chapas += 1
+            j = len(livres) - 1
+            girada = not (W >= pw and H >= ph)
+        else:
+            girada = bool(girar and pw != ph and usar_g[j])
+
+        c, x, y, fw, fh = livres[j]
+        w, h = (ph, pw) if girada else (pw, ph)
+        colocadas.append((i, int(c), x, y, w, h, girada))
+
+        # a serra come `serra` mm depois da peça, se ainda couber
+        ew, eh = min(w + serra, fw), min(h + serra, fh)
+        rw, rh = fw - ew, fh - eh
+        if regra == "eixo_menor":
+            horizontal = rw < rh
+        elif regra == "eixo_maior":
+            horizontal = rw >= rh
+        else:
+            horizontal = rw * fh >= fw * rh
+        # a faixa ao lado/acima da peça não inclui o corte da serra
+        if horizontal:
+            # corte horizontal atravessa a chapa: a faixa de cima fica inteira
+            novos = [(c, x + ew, y, rw, h), (c, x, y + eh, fw, rh)]
+        else:
+            novos = [(c, x + ew, y, rw, fh), (c, x, y + eh, w, rh)]
+        novos = [r for r in novos if r[3] > 0 and r[4] > 0]
+        livres = np.vstack([np.delete(livres, j, axis=0), np.array(novos).reshape(-1, 5)])
+
+    ultima = livres[livres[:, 0] == n_chapas - 1] if n_chapas else livres
+    maior_sobra = float((ultima[:, 3] * ultima[:, 4]).max()) if len(ultima) else 0.0
+    return colocadas, n_chapas, maior_sobra
+
+
+def _ordens(dims: np.ndarray):
+    w, h = dims[:, 0], dims[:, 1]
+    yield np.argsort(-(w * h), kind="stable")
+    yield np.argsort(-np.maximum(w, h), kind="stable")
+    yield np.argsort(-h, kind="stable")
+    yield np.argsort(-w, kind="stable")
+    yield np.argsort(-(w + h), kind="stable")
+
+
+def encaixar(pecas: list[Peca], chapa: tuple = CHAPA_PADRAO, serra: float = SERRA_MM, girar: bool = True,
+             orcamento_s: float = ORCAMENTO_S, seed: int = 0) -> Plano:
+    """Plano de corte para um grupo de peças do mesmo material/espessura."""
+    W, H = float(chapa[0]), float(chapa[1])
+    material = pecas[0].material if pecas else ""
+    espessura = pecas[0].espessura if pecas else None
+
+    cabe = [
+        (p.largura <= W and p.altura <= H) or (girar and p.altura <= W and p.largura <= H)
+        for p in pecas
+    ]
+    nao_cabem = [f"{p.rotulo} ({p.largura:g}×{p.altura:g})" for p, c in zip(pecas, cabe) if not c]
+    pecas = [p for p, c in zip(pecas, cabe) if c]
+    if not pecas:
+        return Plano(material, espessura, (W, H), [], nao_cabem)
+
+    dims = np.array([(p.largura, p.altura) for p in pecas], dtype=float)
+    rng = np.random.default_rng(seed)
+    limite = time.perf_counter() + orcamento_s
+
+    # nenhum plano usa menos chapas que isso: chegou aqui, para
+    minimo = int(np.ceil((dims[:, 0] * dims[:, 1]).sum() / (W * H)))
+
+    melhor, melhor_chave, melhor_ordem, tentativas = None, None, None, 0
+
+    def tentar(ordem, regra):
+        nonlocal melhor, melhor_chave, melhor_ordem, tentativas
+        tentativas += 1
+        colocadas, n, sobra = _passada(dims[ordem], W, H, serra, girar, regra)
+        chave = (n, -sobra)
+        if melhor_chave is None or chave < melhor_chave:
+            melhor, melhor_chave, melhor_ordem = (colocadas, n, ordem), chave, ordem
+
+    def acabou():
+        return melhor_chave[0] <= minimo or time.perf_counter() > limite
+
+    # heurísticas clássicas primeiro; a primeira passada sempre roda
+    for ordem in _ordens(dims):
+        for regra in _REGRAS:
+            tentar(ordem, regra)
+            if acabou():
+                break
+        if acabou():
+            break
+
+    # depois: pequenas trocas na melhor ordem até acabar o tempo
+    while not acabou() and len(pecas) > 1:
+        ordem = melhor_ordem.copy()
+        for _ in range(max(1, len(ordem) // 10)):
+            a, b = rng.integers(0, len(ordem), 2)
+            ordem[a], ordem[b] = ordem[b], ordem[a]
+        tentar(ordem, _REGRAS[int(rng.integers(0, len(_REGRAS)))])
+
+    colocadas, n, ordem = melhor
+    chapas = [Chapa(W, H) for _ in range(n)]
+    for i, c, x, y, w, h, girada in colocadas:
+        chapas[c].pecas.append((float(x), float(y), float(w), float(h), pecas[ordem[i]].rotulo, girada))
+    return Plano(material, espessura, (W, H), chapas, nao_cabem, tentativas)
+
+
+def plano_de_corte(itens: list[dict], chapa: tuple = CHAPA_PADRAO, serra: float = SERRA_MM,
+                   girar: bool = True, orcamento_s: float = ORCAMENTO_S) -> list[Plano]:
+    """Um Plano por (material, espessura) dos itens; o orçamento de tempo é dividido entre eles."""
+    grupos: dict[tuple, list[Peca]] = {}
+    for p in pecas_dos_itens(itens):
+        grupos.setdefault((p.material.lower(), p.espessura), []).append(p)
+    if not grupos:
+        return []
+    fatia = orcamento_s / len(grupos)
+    return [encaixar(g, chapa, serra, girar, fatia) for g in grupos.values()]
+
+
+def sobreposicoes(chapa: Chapa, serra: float = 0.0) -> int:
+    """
+    Pares de peças que se sobrepõem ou ficam a menos de `serra` mm uma da outra
+    nos dois eixos (0 num plano válido). Checagem vetorizada.
+    """
+    if len(chapa.pecas) < 2:
+        return 0
+    a = np.array([p[:4] for p in chapa.pecas], dtype=float)
+    x, y, w, h = a[:, 0], a[:, 1], a[:, 2], a[:, 3]
+    # cada peça "ocupa" também o corte da serra depois dela
+    xf, yf = x + w + serra - 1e-6, y + h + serra - 1e-6
+    cruza = (
+        (x[:, None] < xf[None, :]) & (x[None, :] < xf[:, None])
+        & (y[:, None] < yf[None, :]) & (y[None, :] < yf[:, None])
+    )
+    return int(np.triu(cruza, k=1).sum())
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(1)
+    itens = [
+        {"descricao": f"Peça {i}", "qtd": int(rng.integers(1, 5)), "largura_mm": float(rng.integers(200, 1200)),
+         "altura_mm": float(rng.integers(100, 700)), "espessura_mm": 15, "material": "MDF Branco"}
+        for i in range(60)
+    ]
+    t = time.perf_counter()
+    planos = plano_de_corte(itens)
+    dt = time.perf_counter() - t
+    for pl in planos:
+        assert all(sobreposicoes(c, SERRA_MM) == 0 for c in pl.chapas)
+        print(
+            f"{pl.material} {pl.espessura:g}mm: {sum(len(c.pecas) for c in pl.chapas)} peças em {len(pl.chapas)} chapa(s), "
+            f"aproveitamento {pl.aproveitamento:.1%}, {pl.tentativas} tentativas"
+        )
+    print(f"{dt:.2f}s")
@@ -2,13 +2,17 @@ import json
 from datetime import date, datetime
 from decimal import Decimal
 
+import pandas as pd
+import psycopg2
+import psycopg2.extensions
 import streamlit as st
 from psycopg2.extras import RealDictCursor
 
 from .db_connector import get_db_connection
 from .auth import hash_password, verificar_senha
-from .timezone_utils import agora_fortaleza
-from .config import ETAPAS_PRODUCAO, STATUS_ETAPA
+from .config import ETAPAS_PRODUCAO, STATUS_ETAPA, FORTALEZA_TZ
+from . import pdf_orcamento
+from .formatacao import celula_num, celula_texto
 
 
 # =========================
@@ -30,6 +34,64 @@ def dumps_safe(payload) -> str:
     return json.dumps(json_safe(payload), ensure_ascii=False, default=str)
 
 
+# =========================
+# LEITURA COLUNAR (pandas)
+# =========================
+# OIDs do Postgres que viram coluna de data/hora no DataFrame
+_OID_TIMESTAMPTZ = 1184
+_OID_TIMESTAMP = 1114
+_OID_DATE = 1082
+
+# numeric -> float direto no driver (sem Decimal no meio); datas chegam como
+# texto ISO e são convertidas de uma vez por coluna
+_NUMERIC_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, "MARC_NUMERIC_FLOAT",
+    lambda v, cur: float(v) if v is not None else None,
+)
+# numeric/float4/float8: coluna float64 mesmo com NULL (NaN), nunca object
+_OIDS_FLOAT = set(psycopg2.extensions.DECIMAL.values) | {700, 701}
+_DATAS_TEXTO = psycopg2.extensions.new_type(
+    (_OID_TIMESTAMPTZ, _OID_TIMESTAMP, _OID_DATE), "MARC_DATAS_TEXTO",
+    lambda v, cur: v,
+)
+
+
+def fetch_dataframe(sql: str, params=None) -> pd.DataFrame:
+    """
+    Executa `sql` num cursor de tuplas e monta o DataFrame por coluna:
+    numeric vira float64, timestamptz vira datetime64 em America/Fortaleza,
+    date vira datetime64 (sem hora). Não cria um dict por linha.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            psycopg2.extensions.register_type(_NUMERIC_FLOAT, cur)
+            psycopg2.extensions.register_type(_DATAS_TEXTO, cur)
+            cur.execute(sql, params)
+            desc = cur.description
+            rows = cur.fetchall() or []
+
+    nomes = [d[0] for d in desc]
+    colunas = list(zip(*rows)) if rows else [()] * len(nomes)
+
+    dados = {}
+    for d, valores in zip(desc, colunas):
+        if d.type_code == _OID_TIMESTAMPTZ:
+            serie = pd.to_datetime(pd.Series(valores, dtype=object), utc=True, format="ISO8601")
+            dados[d.name] = serie.dt.tz_convert(FORTALEZA_TZ)
+        elif d.type_code in (_OID_TIMESTAMP, _OID_DATE):
+            dados[d.name] = pd.to_datetime(pd.Series(valores, dtype=object), format="ISO8601")
+        elif d.type_code in _OIDS_FLOAT:
+            dados[d.name] = pd.Series(valores, dtype="float64")
+        else:
+            dados[d.name] = pd.Series(valores, dtype=None if valores else object)
+    return pd.DataFrame(dados, columns=nomes)
+
+
+def escapar_like(termo: str) -> str:
+    """Escapa \\, % e _ para o termo casar literalmente dentro de LIKE/ILIKE."""
+    return termo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
 # =========================
 # AUTH
 # =========================
@@ -145,8 +207,8 @@ def criar_cliente(d):
         with conn.cursor() as cur:
             cur.execute("""
                 INSERT INTO bd_marcenaria.clientes
-                (nome,fantasia,cpf_cnpj,telefone,whatsapp,email,endereco,observacoes,ativo)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,TRUE)
+                (nome,fantasia,cpf_cnpj,telefone,whatsapp,email,endereco,observacoes,latitude,longitude,ativo)
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,TRUE)
                 RETURNING id
             """, (
                 d["nome"],
@@ -157,6 +219,8 @@ def criar_cliente(d):
                 d.get("email", ""),
                 d.get("endereco", ""),
                 d.get("observacoes", ""),
+                d.get("latitude"),
+                d.get("longitude"),
             ))
             cid = cur.fetchone()[0]
             conn.commit()
@@ -177,6 +241,68 @@ def atualizar_cliente(cid: int, d):
             return True
 
 
+def atualizar_coordenadas_clientes(linhas: list[dict]) -> tuple:
+    """
+    Grava latitude/longitude em lote. Cada linha identifica o cliente por `id`,
+    `cpf_cnpj` (só dígitos) ou `nome` (sem maiúsculas), nessa ordem. Linha que
+    casa com mais de um cliente (nome ou documento repetido) não grava nada.
+    Retorna (atualizados, não encontrados, [identificação das linhas ambíguas]).
+    """
+    dados, invalidas = [], 0
+    for r in linhas or []:
+        try:
+            dados.append((
+                int(r["id"]) if r.get("id") not in (None, "") else None,
+                "".join(ch for ch in str(r.get("cpf_cnpj") or "") if ch.isdigit()) or None,
+                str(r.get("nome") or "").strip().lower() or None,
+                float(r["latitude"]),
+                float(r["longitude"]),
+            ))
+        except (TypeError, ValueError):
+            invalidas += 1
+    if not dados:
+        return 0, invalidas, []
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                WITH v(n, id, doc, nome, lat, lon) AS (
+                    SELECT * FROM unnest(%s::int[], %s::int[], %s::text[], %s::text[], %s::float8[], %s::float8[])
+                ),
+                todos AS (
+                    SELECT c.id, v.lat, v.lon, v.n, COUNT(*) OVER (PARTITION BY v.n) AS k
+                    FROM v
+                    JOIN bd_marcenaria.clientes c
+                      ON c.id = v.id
+                      OR (v.id IS NULL AND v.doc IS NOT NULL AND regexp_replace(c.cpf_cnpj, '[^0-9]', '', 'g') = v.doc)
+                      OR (v.id IS NULL AND v.doc IS NULL AND lower(c.nome) = v.nome)
+                ),
+                casados AS (
+                    SELECT id, lat, lon, n FROM todos WHERE k = 1
+                ),
+                -- o mesmo cliente em várias linhas: vale a última
+                alvo AS (
+                    SELECT DISTINCT ON (id) id, lat, lon FROM casados ORDER BY id, n DESC
+                ),
+                upd AS (
+                    UPDATE bd_marcenaria.clientes c
+                    SET latitude=alvo.lat, longitude=alvo.lon, updated_at=CURRENT_TIMESTAMP
+                    FROM alvo
+                    WHERE c.id = alvo.id
+                    RETURNING c.id
+                )
+                SELECT
+                    (SELECT COUNT(*) FROM upd),
+                    (SELECT COUNT(DISTINCT n) FROM todos),
+                    (SELECT array_agg(DISTINCT COALESCE(v.doc, v.nome)) FROM v JOIN todos t ON t.n = v.n WHERE t.k > 1)
+            """, (
+                list(range(len(dados))),
+                *[list(col) for col in zip(*dados)],
+            ))
+            atualizados, casadas, ambiguas = cur.fetchone()
+            conn.commit()
+    return int(atualizados), invalidas + len(dados) - int(casadas), sorted(ambiguas or [])
+
+
 # =========================
 # FUNCIONÁRIOS
 # =========================
@@ -198,10 +324,10 @@ def criar_funcionario(d):
     with get_db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
-                INSERT INTO bd_marcenaria.funcionarios (nome,funcao,telefone,data_admissao,ativo)
-                VALUES (%s,%s,%s,%s,TRUE)
+                INSERT INTO bd_marcenaria.funcionarios (nome,funcao,telefone,data_admissao,capacidade,ativo)
+                VALUES (%s,%s,%s,%s,%s,TRUE)
                 RETURNING id
-            """, (d["nome"], d.get("funcao", ""), d.get("telefone", ""), d.get("data_admissao")))
+            """, (d["nome"], d.get("funcao", ""), d.get("telefone", ""), d.get("data_admissao"), int(d.get("capacidade") or 1)))
             fid = cur.fetchone()[0]
             conn.commit()
             return fid
@@ -210,20 +336,27 @@ def criar_funcionario(d):
 # =========================
 # ORÇAMENTOS / PEDIDOS
 # =========================
-def _codigo(prefix="ORC"):
-    return f"{prefix}{agora_fortaleza().strftime('%y%m%d%H%M%S')}"
+# Concorrência otimista: as escritas recebem a `version` que o usuário viu e
+# só aplicam se ninguém gravou no meio (version=None pula a checagem).
+CONFLITO_VERSAO = "Foi alterado por outra pessoa enquanto você editava. Confira os dados atualizados e salve de novo."
+
+
+def _sem_linha(cur, tabela: str, rid: int, nome: str) -> str:
+    # UPDATE ... AND version=%s não achou linha: sumiu ou mudou de versão
+    cur.execute(f"SELECT 1 FROM bd_marcenaria.{tabela} WHERE id=%s", (rid,))
+    return CONFLITO_VERSAO if cur.fetchone() else f"{nome} não encontrado."
 
 
 def criar_orcamento(d):
     with get_db_connection() as conn:
         with conn.cursor() as cur:
-            codigo = d.get("codigo") or _codigo("ORC")
+            # sem código informado, vem da sequence do ano no próprio INSERT
             cur.execute("""
                 INSERT INTO bd_marcenaria.orcamentos (codigo,cliente_id,status,total_estimado,validade,observacoes)
-                VALUES (%s,%s,%s,%s,%s,%s)
+                VALUES (COALESCE(%s, bd_marcenaria.proximo_codigo('ORC')),%s,%s,%s,%s,%s)
                 RETURNING id, codigo
             """, (
-                codigo,
+                d.get("codigo") or None,
                 d["cliente_id"],
                 d.get("status", "Aberto"),  # alinhado com o app
                 d.get("total_estimado", 0),
@@ -235,7 +368,7 @@ def criar_orcamento(d):
             return oid, cod
 
 
-def atualizar_status_orcamento(orcamento_id: int, status: str):
+def atualizar_status_orcamento(orcamento_id: int, status: str, version=None):
     status = (status or "").strip()
     if status not in ["Aberto", "Rascunho", "Aprovado", "Cancelado"]:
         return False, "Status inválido."
@@ -244,13 +377,16 @@ def atualizar_status_orcamento(orcamento_id: int, status: str):
         with conn.cursor() as cur:
             cur.execute("""
                 UPDATE bd_marcenaria.orcamentos
-                SET status=%s, updated_at=CURRENT_TIMESTAMP
-                WHERE id=%s
-            """, (status, orcamento_id))
+                SET status=%s, version=version + 1, updated_at=CURRENT_TIMESTAMP
+                WHERE id=%s AND (%s::int IS NULL OR version=%s)
+            """, (status, orcamento_id, version, version))
             if cur.rowcount == 0:
+                msg = _sem_linha(cur, "orcamentos", orcamento_id, "Orçamento")
                 conn.rollback()
-                return False, "Orçamento não encontrado."
+                return False, msg
             conn.commit()
+            # status aparece no PDF: regrava o arquivo salvo sem segurar a tela
+            pdf_orcamento.agendar_atualizacao(orcamento_id)
             return True, f"Status atualizado para {status}."
 
 
@@ -266,22 +402,27 @@ def obter_orcamento_por_id(orcamento_id: int):
             return cur.fetchone()
 
 
-def listar_orcamentos(q=None):
+def listar_orcamentos(q=None, colunar=False):
+    """Lista de dicts; com `colunar=True`, um DataFrame montado direto das colunas."""
+    where = "WHERE 1=1"
+    params = []
+    if q:
+        where += " AND (o.codigo ILIKE %s OR o.observacoes ILIKE %s)"
+        params += [f"%{q}%", f"%{q}%"]
+
+    sql = f"""
+        SELECT o.*, c.nome as cliente_nome
+        FROM bd_marcenaria.orcamentos o
+        LEFT JOIN bd_marcenaria.clientes c ON c.id=o.cliente_id
+        {where}
+        ORDER BY o.created_at DESC
+    """
+    if colunar:
+        return fetch_dataframe(sql, params)
+
     with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            where = "WHERE 1=1"
-            params = []
-            if q:
-                where += " AND (o.codigo ILIKE %s OR o.observacoes ILIKE %s)"
-                params += [f"%{q}%", f"%{q}%"]
-
-            cur.execute(f"""
-                SELECT o.*, c.nome as cliente_nome
-                FROM bd_marcenaria.orcamentos o
-                LEFT JOIN bd_marcenaria.clientes c ON c.id=o.cliente_id
-                {where}
-                ORDER BY o.created_at DESC
-            """, params)
+            cur.execute(sql, params)
             return cur.fetchall()
 
 
@@ -296,53 +437,107 @@ def listar_orcamento_itens(orcamento_id: int):
             return cur.fetchall()
 
 
-def salvar_orcamento_itens(orcamento_id: int, itens: list):
+def carregar_orcamentos_com_itens(orcamento_ids: list):
+    """
+    [(orcamento, [itens])] na ordem de `orcamento_ids`, com duas consultas
+    no total (cabeçalhos + todos os itens), para o PDF em lote.
+    """
+    ids = [int(i) for i in dict.fromkeys(orcamento_ids or [])]
+    if not ids:
+        return []
+
     with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM bd_marcenaria.orcamento_itens WHERE orcamento_id=%s", (orcamento_id,))
-            total = 0.0
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT o.*, c.nome as cliente_nome
+                FROM bd_marcenaria.orcamentos o
+                LEFT JOIN bd_marcenaria.clientes c ON c.id=o.cliente_id
+                WHERE o.id = ANY(%s)
+            """, (ids,))
+            orcs = {r["id"]: dict(r) for r in (cur.fetchall() or [])}
 
-            for it in itens or []:
-                desc = (it.get("descricao") or "").strip()
-                if not desc:
-                    continue
-                qtd = float(it.get("qtd") or 1)
-                vu = float(it.get("valor_unit") or 0)
-                sub = round(qtd * vu, 2)
-                total += sub
+            cur.execute("""
+                SELECT orcamento_id, descricao, qtd, unidade, valor_unit, subtotal
+                FROM bd_marcenaria.orcamento_itens
+                WHERE orcamento_id = ANY(%s)
+                ORDER BY orcamento_id, id
+            """, (ids,))
+            itens = {}
+            for r in cur.fetchall() or []:
+                itens.setdefault(r["orcamento_id"], []).append(dict(r))
+
+    return [(orcs[i], itens.get(i, [])) for i in ids if i in orcs]
+
+
+def _dimensoes(it: dict) -> tuple:
+    """(largura_mm, altura_mm, espessura_mm, material, fita_lados) de um item; vazio = None/''/0."""
+    lados = int(min(4, celula_num(it.get("fita_lados")) or 0))
+    return (celula_num(it.get("largura_mm")), celula_num(it.get("altura_mm")), celula_num(it.get("espessura_mm")),
+            celula_texto(it.get("material")), lados)
+
+
+def salvar_orcamento_itens(orcamento_id: int, itens: list, version=None):
+    """
+    Regrava os itens e o total. Retorna (ok, msg, total).
+    Com `version`, só grava se o orcamento não mudou desde que o usuário abriu.
+    """
+    linhas = []
+    total = 0.0
+    for it in itens or []:
+        desc = (it.get("descricao") or "").strip()
+        if not desc:
+            continue
+        qtd = float(it.get("qtd") or 1)
+        vu = float(it.get("valor_unit") or 0)
+        sub = round(qtd * vu, 2)
+        total += sub
+        linhas.append((desc, qtd, (it.get("unidade") or "Unid."), vu, sub, _dimensoes(it)))
+    total = round(total, 2)
 
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            # checa e incrementa a versão primeiro: a linha fica travada só durante este save
+            cur.execute("""
+                UPDATE bd_marcenaria.orcamentos
+                SET total_estimado=%s, version=version + 1, updated_at=CURRENT_TIMESTAMP
+                WHERE id=%s AND (%s::int IS NULL OR version=%s)
+            """, (total, orcamento_id, version, version))
+            if cur.rowcount == 0:
+                msg = _sem_linha(cur, "orcamentos", orcamento_id, "Orçamento")
+                conn.rollback()
+                return False, msg, total
+
+            cur.execute("DELETE FROM bd_marcenaria.orcamento_itens WHERE orcamento_id=%s", (orcamento_id,))
+            for desc, qtd, unidade, vu, sub, dims in linhas:
                 cur.execute("""
                     INSERT INTO bd_marcenaria.orcamento_itens
-                    (orcamento_id,descricao,qtd,unidade,valor_unit,subtotal)
-                    VALUES (%s,%s,%s,%s,%s,%s)
+                    (orcamento_id,descricao,qtd,unidade,valor_unit,subtotal,largura_mm,altura_mm,espessura_mm,material,fita_lados)
+                    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
                 """, (
                     orcamento_id,
                     desc,
                     qtd,
-                    (it.get("unidade") or "Unid."),
+                    unidade,
                     vu,
-                    sub
+                    sub,
+                    *dims
                 ))
 
-            cur.execute(
-                "UPDATE bd_marcenaria.orcamentos SET total_estimado=%s, updated_at=CURRENT_TIMESTAMP WHERE id=%s",
-                (round(total, 2), orcamento_id)
-            )
             conn.commit()
-            return round(total, 2)
+            pdf_orcamento.agendar_atualizacao(orcamento_id)
+            return True, "Itens salvos.", total
 
 
 def criar_pedido(d):
     with get_db_connection() as conn:
         with conn.cursor() as cur:
-            codigo = d.get("codigo") or _codigo("PED")
             cur.execute("""
                 INSERT INTO bd_marcenaria.pedidos
                 (codigo,cliente_id,orcamento_id,status,etapa_atual,status_etapa,responsavel_id,data_entrega_prevista,total,observacoes)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+                VALUES (COALESCE(%s, bd_marcenaria.proximo_codigo('PED')),%s,%s,%s,%s,%s,%s,%s,%s,%s)
                 RETURNING id, codigo
             """, (
-                codigo,
+                d.get("codigo") or None,
                 d["cliente_id"],
                 d.get("orcamento_id"),
                 d.get("status", "Aberto"),
@@ -358,23 +553,91 @@ def criar_pedido(d):
             return pid, cod
 
 
-def listar_pedidos(q=None):
+def obter_pedido_por_id(pedido_id: int):
     with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            where = "WHERE 1=1"
-            params = []
-            if q:
-                where += " AND (p.codigo ILIKE %s OR p.observacoes ILIKE %s)"
-                params += [f"%{q}%", f"%{q}%"]
+            cur.execute("""
+                SELECT p.*, c.nome as cliente_nome
+                FROM bd_marcenaria.pedidos p
+                LEFT JOIN bd_marcenaria.clientes c ON c.id=p.cliente_id
+                WHERE p.id=%s
+            """, (pedido_id,))
+            return cur.fetchone()
+
+
+def listar_pedidos(q=None, colunar=False):
+    """Lista de dicts; com `colunar=True`, um DataFrame montado direto das colunas."""
+    where = "WHERE 1=1"
+    params = []
+    if q:
+        like = f"%{escapar_like(q)}%"
+        where += " AND (p.codigo ILIKE %s OR p.observacoes ILIKE %s)"
+        params += [like, like]
+
+    sql = f"""
+        SELECT p.*, c.nome as cliente_nome, f.nome as responsavel_nome
+        FROM bd_marcenaria.pedidos p
+        LEFT JOIN bd_marcenaria.clientes c ON c.id=p.cliente_id
+        LEFT JOIN bd_marcenaria.funcionarios f ON f.id=p.responsavel_id
+        {where}
+        ORDER BY p.created_at DESC
+    """
+    if colunar:
+        return fetch_dataframe(sql, params)
+
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
 
+def buscar_pedidos(termo: str, limit=None, q_lista=None, mes: int | None = None, ano: int | None = None):
+    """
+    Busca da linha do tempo: código, cliente, etapa, status da etapa e responsável.
+    Cada parte casa numa tabela só (trigram em codigo/nome quando existir) e
+    etapa/status viram IN sobre as listas fixas, que usam o índice de etapa.
+    `q_lista` (código/observação, como em listar_pedidos) e `mes`/`ano` de
+    criação repetem no banco os filtros da lista de pedidos.
+    """
+    t = (termo or "").strip()
+    if not t:
+        return []
+    tl = t.lower()
+    like = f"%{escapar_like(t)}%"
+    lista = f"%{escapar_like(q_lista.strip())}%" if q_lista and q_lista.strip() else None
+    periodo = (int(ano), int(mes)) if mes and ano else (None, None)
+    etapas = [e for e in ETAPAS_PRODUCAO if tl in e.lower()]
+    status = [s for s in STATUS_ETAPA if tl in s.lower()]
+
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(f"""
+                WITH alvo AS (
+                    SELECT id FROM bd_marcenaria.pedidos
+                    WHERE codigo ILIKE %s OR etapa_atual = ANY(%s) OR status_etapa = ANY(%s)
+                    UNION
+                    SELECT p.id
+                    FROM bd_marcenaria.clientes c
+                    JOIN bd_marcenaria.pedidos p ON p.cliente_id=c.id
+                    WHERE c.nome ILIKE %s
+                    UNION
+                    SELECT p.id
+                    FROM bd_marcenaria.funcionarios f
+                    JOIN bd_marcenaria.pedidos p ON p.responsavel_id=f.id
+                    WHERE f.nome ILIKE %s
+                )
                 SELECT p.*, c.nome as cliente_nome, f.nome as responsavel_nome
-                FROM bd_marcenaria.pedidos p
+                FROM alvo a
+                JOIN bd_marcenaria.pedidos p ON p.id=a.id
                 LEFT JOIN bd_marcenaria.clientes c ON c.id=p.cliente_id
                 LEFT JOIN bd_marcenaria.funcionarios f ON f.id=p.responsavel_id
-                {where}
-                ORDER BY p.created_at DESC
-            """, params)
+                WHERE (%s::text IS NULL OR p.codigo ILIKE %s OR p.observacoes ILIKE %s)
+                  AND (%s::int IS NULL OR (p.created_at >= make_date(%s, %s, 1)
+                                           AND p.created_at < make_date(%s, %s, 1) + INTERVAL '1 month'))
+                ORDER BY COALESCE(p.updated_at, p.created_at) DESC
+                {"LIMIT %s" if limit else ""}
+            """, [like, etapas, status, like, like, lista, lista, lista, periodo[0], *periodo, *periodo]
+                + ([int(limit)] if limit else []))
             return cur.fetchall()
 
 
@@ -389,48 +652,63 @@ def listar_pedido_itens(pedido_id: int):
             return cur.fetchall()
 
 
-def salvar_pedido_itens(pedido_id: int, itens: list):
+def salvar_pedido_itens(pedido_id: int, itens: list, version=None):
+    """
+    Regrava os itens e o total. Retorna (ok, msg, total).
+    Com `version`, só grava se o pedido não mudou desde que o usuário abriu.
+    """
+    linhas = []
+    total = 0.0
+    for it in itens or []:
+        desc = (it.get("descricao") or "").strip()
+        if not desc:
+            continue
+        qtd = float(it.get("qtd") or 1)
+        vu = float(it.get("valor_unit") or 0)
+        sub = round(qtd * vu, 2)
+        total += sub
+        linhas.append((desc, qtd, (it.get("unidade") or "Unid."), vu, sub, _dimensoes(it)))
+    total = round(total, 2)
+
     with get_db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM bd_marcenaria.pedido_itens WHERE pedido_id=%s", (pedido_id,))
-            total = 0.0
-
-            for it in itens or []:
-                desc = (it.get("descricao") or "").strip()
-                if not desc:
-                    continue
-                qtd = float(it.get("qtd") or 1)
-                vu = float(it.get("valor_unit") or 0)
-                sub = round(qtd * vu, 2)
-                total += sub
+            # checa e incrementa a versão primeiro: a linha fica travada só durante este save
+            cur.execute("""
+                UPDATE bd_marcenaria.pedidos
+                SET total=%s, version=version + 1, updated_at=CURRENT_TIMESTAMP
+                WHERE id=%s AND (%s::int IS NULL OR version=%s)
+            """, (total, pedido_id, version, version))
+            if cur.rowcount == 0:
+                msg = _sem_linha(cur, "pedidos", pedido_id, "Pedido")
+                conn.rollback()
+                return False, msg, total
 
+            cur.execute("DELETE FROM bd_marcenaria.pedido_itens WHERE pedido_id=%s", (pedido_id,))
+            for desc, qtd, unidade, vu, sub, dims in linhas:
                 cur.execute("""
                     INSERT INTO bd_marcenaria.pedido_itens
-                    (pedido_id,descricao,qtd,unidade,valor_unit,subtotal)
-                    VALUES (%s,%s,%s,%s,%s,%s)
+                    (pedido_id,descricao,qtd,unidade,valor_unit,subtotal,largura_mm,altura_mm,espessura_mm,material,fita_lados)
+                    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
                 """, (
                     pedido_id,
                     desc,
                     qtd,
-                    (it.get("unidade") or "Unid."),
+                    unidade,
                     vu,
-                    sub
+                    sub,
+                    *dims
                 ))
 
-            cur.execute(
-                "UPDATE bd_marcenaria.pedidos SET total=%s, updated_at=CURRENT_TIMESTAMP WHERE id=%s",
-                (round(total, 2), pedido_id)
-            )
             conn.commit()
-            return round(total, 2)
+            return True, "Itens salvos.", total
 
 
 # =========================
 # APROVAÇÃO DO ORÇAMENTO
 # =========================
-def aprovar_orcamento(orcamento_id: int):
+def aprovar_orcamento(orcamento_id: int, version=None):
     # mantém por compatibilidade, mas agora usa a função padrão
-    return atualizar_status_orcamento(orcamento_id, "Aprovado")[0]
+    return atualizar_status_orcamento(orcamento_id, "Aprovado", version)[0]
 
 
 # =========================
@@ -442,6 +720,7 @@ def gerar_pedido_a_partir_orcamento(
     data_entrega_prevista=None,
     observacoes: str = ""
 ):
+    """Retorna (ok, msg, pedido_id, pedido_codigo, criado); `criado` é False quando o pedido já existia."""
     with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("""
@@ -452,10 +731,10 @@ def gerar_pedido_a_partir_orcamento(
             """, (orcamento_id,))
             orc = cur.fetchone()
             if not orc:
-                return False, "Orçamento não encontrado.", None, None
+                return False, "Orçamento não encontrado.", None, None, False
 
             if (orc.get("status") or "").strip() != "Aprovado":
-                return False, "Orçamento ainda não está aprovado. Aprova na aba Orçamento.", None, None
+                return False, "Orçamento ainda não está aprovado. Aprova na aba Orçamento.", None, None, False
 
             # Evita duplicar
             cur.execute("""
@@ -466,19 +745,17 @@ def gerar_pedido_a_partir_orcamento(
             """, (orcamento_id,))
             existing = cur.fetchone()
             if existing:
-                return True, f"Já existe pedido para este orçamento. Código {existing['codigo']}", existing["id"], existing["codigo"]
+                return True, f"Já existe pedido para este orçamento. Código {existing['codigo']}", existing["id"], existing["codigo"], False
 
             # Cria pedido
-            pedido_codigo = _codigo("PED")
             cur.execute("""
                 INSERT INTO bd_marcenaria.pedidos (
                     codigo, cliente_id, orcamento_id, status, etapa_atual, status_etapa,
                     responsavel_id, data_entrega_prevista, total, observacoes
                 )
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+                VALUES (bd_marcenaria.proximo_codigo('PED'),%s,%s,%s,%s,%s,%s,%s,%s,%s)
                 RETURNING id, codigo
             """, (
-                pedido_codigo,
                 orc["cliente_id"],
                 orcamento_id,
                 "Aberto",
@@ -509,15 +786,16 @@ def gerar_pedido_a_partir_orcamento(
                 total += sub
                 cur.execute("""
                     INSERT INTO bd_marcenaria.pedido_itens
-                    (pedido_id, descricao, qtd, unidade, valor_unit, subtotal)
-                    VALUES (%s,%s,%s,%s,%s,%s)
+                    (pedido_id, descricao, qtd, unidade, valor_unit, subtotal, largura_mm, altura_mm, espessura_mm, material, fita_lados)
+                    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
                 """, (
                     pedido_id,
                     it.get("descricao", ""),
                     qtd,
                     it.get("unidade", "Unid."),
                     vu,
-                    round(sub, 2)
+                    round(sub, 2),
+                    *_dimensoes(it)
                 ))
 
             # Ajusta total do pedido
@@ -528,7 +806,7 @@ def gerar_pedido_a_partir_orcamento(
             """, (round(total, 2), pedido_id))
 
             conn.commit()
-            return True, f"Pedido criado. Código {pedido_codigo}", pedido_id, pedido_codigo
+            return True, f"Pedido criado. Código {pedido_codigo}", pedido_id, pedido_codigo, True
 
 
 # =========================
@@ -560,7 +838,8 @@ def mover_pedido_etapa(
     nova_etapa: str,
     status_etapa: str,
     responsavel_id=None,
-    observacoes: str = ""
+    observacoes: str = "",
+    version=None
 ):
     if nova_etapa not in ETAPAS_PRODUCAO:
         return False, "Etapa inválida."
@@ -570,29 +849,47 @@ def mover_pedido_etapa(
     with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("""
-                SELECT id, etapa_atual, status_etapa
+                SELECT id, etapa_atual, status_etapa, version
                 FROM bd_marcenaria.pedidos
                 WHERE id=%s
             """, (pedido_id,))
             atual = cur.fetchone()
             if not atual:
                 return False, "Pedido não encontrado."
+            if version is not None and atual.get("version") != version:
+                return False, CONFLITO_VERSAO
 
             mudou = (atual.get("etapa_atual") != nova_etapa) or (atual.get("status_etapa") != status_etapa)
             if not mudou:
                 return True, "Nada mudou. Não registrei evento."
 
-            # 1) atualiza pedido
+            # 1) atualiza pedido (a versão é checada de novo: alguém pode ter gravado depois do SELECT)
             cur.execute("""
                 UPDATE bd_marcenaria.pedidos
                 SET etapa_atual=%s,
                     status_etapa=%s,
                     responsavel_id=%s,
+                    version=version + 1,
                     updated_at=CURRENT_TIMESTAMP
-                WHERE id=%s
-            """, (nova_etapa, status_etapa, responsavel_id, pedido_id))
+                WHERE id=%s AND version=%s
+            """, (nova_etapa, status_etapa, responsavel_id, pedido_id, atual.get("version")))
+            if cur.rowcount == 0:
+                conn.rollback()
+                return False, CONFLITO_VERSAO
 
-            # 2) histórico interno
+            # 2) histórico interno: fecha o intervalo aberto (o mais recente) e abre o novo
+            cur.execute("""
+                UPDATE bd_marcenaria.producao_etapas e
+                SET fim_em=CURRENT_TIMESTAMP
+                FROM (
+                    SELECT id, created_at
+                    FROM bd_marcenaria.producao_etapas
+                    WHERE pedido_id=%s AND fim_em IS NULL
+                    ORDER BY inicio_em DESC, id DESC
+                    LIMIT 1
+                ) a
+                WHERE e.id = a.id AND e.created_at = a.created_at
+            """, (pedido_id,))
             cur.execute("""
                 INSERT INTO bd_marcenaria.producao_etapas
                 (pedido_id, etapa, status, responsavel_id, inicio_em, observacoes)
@@ -632,3 +929,317 @@ def mover_pedido_etapa(
             if ev and ev.get("id"):
                 return True, f"Movido. Evento criado ID {ev['id']}."
             return True, "Movido. Mas não consegui criar evento."
+
+
+def mover_pedidos_etapa(
+    ids: list,
+    nova_etapa: str,
+    status_etapa: str,
+    responsavel_id=None,
+    observacoes: str = ""
+):
+    """
+    Versão em lote do mover_pedido_etapa: uma transação e um comando por passo
+    (pedidos, fecha histórico, abre histórico, fila de automação), qualquer que
+    seja o número de pedidos. Pedidos que já estão na etapa/status são ignorados.
+    """
+    if nova_etapa not in ETAPAS_PRODUCAO:
+        return False, "Etapa inválida."
+    if status_etapa not in STATUS_ETAPA:
+        return False, "Status inválido."
+
+    ids = sorted({int(i) for i in (ids or [])})
+    if not ids:
+        return False, "Nenhum pedido selecionado."
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            # 1) atualiza pedidos (só os que mudam)
+            cur.execute("""
+                UPDATE bd_marcenaria.pedidos
+                SET etapa_atual=%s,
+                    status_etapa=%s,
+                    responsavel_id=%s,
+                    version=version + 1,
+                    updated_at=CURRENT_TIMESTAMP
+                WHERE id = ANY(%s)
+                  AND (etapa_atual IS DISTINCT FROM %s OR status_etapa IS DISTINCT FROM %s)
+                RETURNING id
+            """, (nova_etapa, status_etapa, responsavel_id, ids, nova_etapa, status_etapa))
+            movidos = [r[0] for r in (cur.fetchall() or [])]
+            if not movidos:
+                conn.rollback()
+                return True, "Nada mudou. Não registrei evento."
+
+            # 2) histórico interno: fecha o intervalo aberto (o mais recente) de cada pedido e abre os novos
+            cur.execute("""
+                UPDATE bd_marcenaria.producao_etapas e
+                SET fim_em=CURRENT_TIMESTAMP
+                FROM (
+                    SELECT DISTINCT ON (pedido_id) id, created_at
+                    FROM bd_marcenaria.producao_etapas
+                    WHERE pedido_id = ANY(%s) AND fim_em IS NULL
+                    ORDER BY pedido_id, inicio_em DESC, id DESC
+                ) a
+                WHERE e.id = a.id AND e.created_at = a.created_at
+            """, (movidos,))
+            cur.execute("""
+                INSERT INTO bd_marcenaria.producao_etapas
+                (pedido_id, etapa, status, responsavel_id, inicio_em, observacoes)
+                SELECT pid, %s, %s, %s, CURRENT_TIMESTAMP, %s
+                FROM unnest(%s::int[]) AS pid
+            """, (nova_etapa, status_etapa, responsavel_id, observacoes or "", movidos))
+
+            # 3) fila de automação
+            cur.execute("""
+                INSERT INTO bd_marcenaria.producao_eventos (
+                    pedido_id,
+                    cliente_id,
+                    cliente_nome,
+                    cliente_whatsapp,
+                    etapa,
+                    status,
+                    responsavel_id,
+                    observacoes
+                )
+                SELECT
+                    p.id,
+                    p.cliente_id,
+                    c.nome,
+                    COALESCE(NULLIF(c.whatsapp,''), NULLIF(c.telefone,'')),
+                    %s,
+                    %s,
+                    %s,
+                    %s
+                FROM bd_marcenaria.pedidos p
+                JOIN bd_marcenaria.clientes c ON c.id = p.cliente_id
+                WHERE p.id = ANY(%s)
+            """, (nova_etapa, status_etapa, responsavel_id, observacoes or "", movidos))
+            n_eventos = cur.rowcount
+
+            conn.commit()
+            ignorados = len(ids) - len(movidos)
+            msg = f"{len(movidos)} pedido(s) movido(s). {n_eventos} evento(s) criado(s)."
+            if ignorados:
+                msg += f" {ignorados} já estava(m) nessa etapa/status."
+            return True, msg
+
+
+def sql_visitas_etapa(desde: str) -> str:
+    """
+    CTEs (sem o WITH) que terminam em `visitas`: cada passagem de um pedido por uma
+    etapa. Toda troca de status abre uma linha nova em producao_etapas, então as
+    linhas seguidas do mesmo pedido na mesma etapa viram uma visita só, do primeiro
+    início ao último fim (fim_em NULL = visita em aberto); responsavel_id é o da
+    última linha. Entram os pedidos com alguma linha fechada a partir de `desde`
+    (expressão SQL).
+    """
+    return f"""
+        linhas AS (
+            SELECT
+                e.id,
+                e.pedido_id,
+                e.etapa,
+                e.responsavel_id,
+                COALESCE(e.inicio_em, e.created_at) AS inicio,
+                e.fim_em,
+                LAG(e.etapa) OVER (PARTITION BY e.pedido_id ORDER BY COALESCE(e.inicio_em, e.created_at), e.id) AS anterior
+            FROM bd_marcenaria.producao_etapas e
+            WHERE e.pedido_id IN (
+                SELECT pedido_id FROM bd_marcenaria.producao_etapas WHERE fim_em >= {desde}
+            )
+        ),
+        ilhas AS (
+            SELECT *,
+                   SUM(CASE WHEN anterior IS DISTINCT FROM etapa THEN 1 ELSE 0 END)
+                       OVER (PARTITION BY pedido_id ORDER BY inicio, id) AS visita
+            FROM linhas
+        ),
+        visitas AS (
+            SELECT
+                pedido_id,
+                etapa,
+                (array_agg(responsavel_id ORDER BY inicio DESC, id DESC))[1] AS responsavel_id,
+                MIN(inicio) AS inicio_em,
+                CASE WHEN bool_and(fim_em IS NOT NULL) THEN MAX(fim_em) END AS fim_em
+            FROM ilhas
+            GROUP BY pedido_id, etapa, visita
+        )
+    """
+
+
+def marcador_producao() -> tuple:
+    """
+    Muda a cada movimentação do Kanban (nova linha em producao_etapas) ou
+    edição de pedido. Serve de chave para caches derivados da produção.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT
+                    (SELECT MAX(id) FROM bd_marcenaria.producao_etapas),
+                    (SELECT MAX(updated_at) FROM bd_marcenaria.pedidos)
+            """)
+            etapa_id, pedido_em = cur.fetchone()
+            return (etapa_id, str(pedido_em))
+
+
+# =========================
+# CAPACIDADE (carga por responsável)
+# =========================
+def carga_por_responsavel() -> pd.DataFrame:
+    """
+    Pedidos em aberto agregados por responsável e etapa atual, numa consulta:
+    pedidos, dias acumulados na etapa atual, itens (linhas e quantidade) e atrasados.
+    """
+    return fetch_dataframe("""
+        WITH abertos AS (
+            SELECT p.id, p.responsavel_id, p.etapa_atual, p.data_entrega_prevista
+            FROM bd_marcenaria.pedidos p
+            WHERE COALESCE(p.status, '') NOT IN ('Entregue', 'Cancelado')
+              AND NOT (p.etapa_atual = %(ultima)s AND p.status_etapa = 'Concluído')
+        ),
+        itens AS (
+            SELECT i.pedido_id, COUNT(*) AS linhas, SUM(i.qtd) AS qtd
+            FROM bd_marcenaria.pedido_itens i
+            JOIN abertos a ON a.id = i.pedido_id
+            GROUP BY i.pedido_id
+        ),
+        em_aberto AS (
+            SELECT DISTINCT ON (e.pedido_id) e.pedido_id, COALESCE(e.inicio_em, e.created_at) AS desde
+            FROM bd_marcenaria.producao_etapas e
+            JOIN abertos a ON a.id = e.pedido_id
+            WHERE e.fim_em IS NULL
+            ORDER BY e.pedido_id, COALESCE(e.inicio_em, e.created_at) DESC
+        )
+        SELECT
+            a.responsavel_id,
+            COALESCE(f.nome, 'Sem responsável') AS responsavel,
+            COALESCE(a.etapa_atual, '-') AS etapa,
+            COUNT(*) AS pedidos,
+            COALESCE(SUM(GREATEST(0, EXTRACT(EPOCH FROM (now() - x.desde)) / 86400.0)), 0) AS dias_em_etapa,
+            COALESCE(SUM(i.linhas), 0) AS itens,
+            COALESCE(SUM(i.qtd), 0) AS qtd_itens,
+            COUNT(*) FILTER (WHERE a.data_entrega_prevista < CURRENT_DATE) AS atrasados
+        FROM abertos a
+        LEFT JOIN itens i ON i.pedido_id = a.id
+        LEFT JOIN em_aberto x ON x.pedido_id = a.id
+        LEFT JOIN bd_marcenaria.funcionarios f ON f.id = a.responsavel_id
+        GROUP BY a.responsavel_id, f.nome, a.etapa_atual
+        ORDER BY responsavel, etapa
+    """, {"ultima": ETAPAS_PRODUCAO[-1]})
+
+
+def vazao_semanal(semanas: int = 12) -> pd.DataFrame:
+    """
+    Etapas fechadas (visitas, ver sql_visitas_etapa) por semana e responsável,
+    nas últimas `semanas` semanas. Semanas sem nada fechado vêm com zero.
+    """
+    desde = "date_trunc('week', now()) - make_interval(weeks => %(semanas)s - 1)"
+    return fetch_dataframe(f"""
+        WITH semanas AS (
+            SELECT generate_series(
+                {desde},
+                date_trunc('week', now()),
+                interval '1 week'
+            ) AS semana
+        ),
+        {sql_visitas_etapa(desde)},
+        fechadas AS (
+            SELECT date_trunc('week', v.fim_em) AS semana, v.responsavel_id, COUNT(*) AS etapas
+            FROM visitas v
+            WHERE v.fim_em >= {desde}
+            GROUP BY 1, 2
+        ),
+        pessoas AS (
+            SELECT DISTINCT responsavel_id FROM fechadas
+        )
+        SELECT
+            s.semana,
+            p.responsavel_id,
+            COALESCE(f.nome, 'Sem responsável') AS responsavel,
+            COALESCE(x.etapas, 0) AS etapas
+        FROM semanas s
+        CROSS JOIN pessoas p
+        LEFT JOIN fechadas x ON x.semana = s.semana AND x.responsavel_id IS NOT DISTINCT FROM p.responsavel_id
+        LEFT JOIN bd_marcenaria.funcionarios f ON f.id = p.responsavel_id
+        ORDER BY s.semana, responsavel
+    """, {"semanas": int(semanas)})
+
+
+# =========================
+# TENDÊNCIA MENSAL (dashboard)
+# =========================
+def serie_mensal(meses: int = 24) -> pd.DataFrame:
+    """
+    Uma linha por mês (os últimos `meses`, inclusive o atual, sem buracos):
+    orçamentos/pedidos criados e valores, pedidos entregues e lead time médio.
+    Entregue = primeira vez que a última etapa foi marcada "Concluído"
+    (ou status "Entregue" no pedido). Tudo agregado no banco, numa consulta.
+    """
+    etapa_final = ETAPAS_PRODUCAO[-1]
+    return fetch_dataframe("""
+        WITH meses AS (
+            SELECT generate_series(
+                date_trunc('month', now()) - make_interval(months => %(meses)s - 1),
+                date_trunc('month', now()),
+                interval '1 month'
+            ) AS mes
+        ),
+        inicio AS (
+            SELECT MIN(mes) AS desde FROM meses
+        ),
+        orc AS (
+            SELECT date_trunc('month', o.created_at) AS mes,
+                   COUNT(*) AS orcamentos,
+                   SUM(o.total_estimado) AS valor_orcamentos
+            FROM bd_marcenaria.orcamentos o, inicio
+            WHERE o.created_at >= inicio.desde
+            GROUP BY 1
+        ),
+        ped AS (
+            SELECT date_trunc('month', p.created_at) AS mes,
+                   COUNT(*) AS pedidos,
+                   SUM(p.total) AS valor_pedidos
+            FROM bd_marcenaria.pedidos p, inicio
+            WHERE p.created_at >= inicio.desde
+            GROUP BY 1
+        ),
+        concluidos AS (
+            -- created_at limita as partições lidas de producao_etapas
+            SELECT e.pedido_id, MIN(e.inicio_em) AS concluido_em
+            FROM bd_marcenaria.producao_etapas e, inicio
+            WHERE e.etapa = %(etapa_final)s
+              AND e.status = 'Concluído'
+              AND e.created_at >= inicio.desde
+            GROUP BY e.pedido_id
+        ),
+        entregas AS (
+            SELECT p.created_at,
+                   COALESCE(c.concluido_em, CASE WHEN p.status = 'Entregue' THEN p.updated_at END) AS entregue_em
+            FROM bd_marcenaria.pedidos p
+            LEFT JOIN concluidos c ON c.pedido_id = p.id
+            WHERE c.pedido_id IS NOT NULL OR p.status = 'Entregue'
+        ),
+        ent AS (
+            SELECT date_trunc('month', entregue_em) AS mes,
+                   COUNT(*) AS entregues,
+                   AVG(EXTRACT(EPOCH FROM (entregue_em - created_at)) / 86400.0) AS lead_time_dias
+            FROM entregas, inicio
+            WHERE entregue_em >= inicio.desde
+            GROUP BY 1
+        )
+        SELECT
+            m.mes,
+            COALESCE(orc.orcamentos, 0) AS orcamentos,
+            COALESCE(orc.valor_orcamentos, 0) AS valor_orcamentos,
+            COALESCE(ped.pedidos, 0) AS pedidos,
+            COALESCE(ped.valor_pedidos, 0) AS valor_pedidos,
+            COALESCE(ent.entregues, 0) AS entregues,
+            ent.lead_time_dias
+        FROM meses m
+        LEFT JOIN orc ON orc.mes = m.mes
+        LEFT JOIN ped ON ped.mes = m.mes
+        LEFT JOIN ent ON ent.mes = m.mes
+        ORDER BY m.mes
+    """, {"meses": int(meses), "etapa_final": etapa_final})
@@ -0,0 +1,179 @@
+# Exportação de pedidos/orçamentos (uma linha por item, com cliente) em CSV ou XLSX.
+#
+# Lê por cursor nomeado (server-side): o Postgres entrega `lote` linhas por vez
+# e cada lote é escrito direto no arquivo, então a memória fica constante
+# qualquer que seja o período.
+#
+#   python -m marcenaria.exportacao pedidos --de 2025-01-01 --ate 2025-12-31 --formato xlsx -o pedidos_2025.xlsx
+import argparse
+import csv
+from datetime import date, datetime, timedelta
+
+from .db_connector import get_db_connection
+
+FORMATOS = ("csv", "xlsx")
+
+# tipo -> (cabeçalho, SELECT com os filtros de período em created_at do documento)
+_CONSULTAS = {
+    "pedidos": (
+        [
+            "pedido_id", "codigo", "status", "etapa_atual", "status_etapa", "responsavel",
+            "data_entrega_prevista", "total_pedido", "observacoes", "criado_em",
+            "cliente_id", "cliente_nome", "cliente_cpf_cnpj", "cliente_telefone", "cliente_email",
+            "item_descricao", "item_qtd", "item_unidade", "item_valor_unit", "item_subtotal",
+        ],
+        """
+            SELECT
+                p.id, p.codigo, p.status, p.etapa_atual, p.status_etapa, f.nome,
+                p.data_entrega_prevista, p.total, p.observacoes, p.created_at,
+                c.id, c.nome, c.cpf_cnpj, c.telefone, c.email,
+                i.descricao, i.qtd, i.unidade, i.valor_unit, i.subtotal
+            FROM bd_marcenaria.pedidos p
+            LEFT JOIN bd_marcenaria.clientes c ON c.id = p.cliente_id
+            LEFT JOIN bd_marcenaria.funcionarios f ON f.id = p.responsavel_id
+            LEFT JOIN bd_marcenaria.pedido_itens i ON i.pedido_id = p.id
+            WHERE p.created_at >= %s AND p.created_at < %s
+            ORDER BY p.created_at, p.id, i.id
+        """,
+    ),
+    "orcamentos": (
+        [
+            "orcamento_id", "codigo", "status", "validade", "total_estimado", "observacoes", "criado_em",
+            "cliente_id", "cliente_nome", "cliente_cpf_cnpj", "cliente_telefone", "cliente_email",
+            "item_descricao", "item_qtd", "item_unidade", "item_valor_unit", "item_subtotal",
+        ],
+        """
+            SELECT
+                o.id, o.codigo, o.status, o.validade, o.total_estimado, o.observacoes, o.created_at,
+                c.id, c.nome, c.cpf_cnpj, c.telefone, c.email,
+                i.descricao, i.qtd, i.unidade, i.valor_unit, i.subtotal
+            FROM bd_marcenaria.orcamentos o
+            LEFT JOIN bd_marcenaria.clientes c ON c.id = o.cliente_id
+            LEFT JOIN bd_marcenaria.orcamento_itens i ON i.orcamento_id = o.id
+            WHERE o.created_at >= %s AND o.created_at < %s
+            ORDER BY o.created_at, o.id, i.id
+        """,
+    ),
+}
+
+_CONTAGEM = {
+    "pedidos": """
+        SELECT COUNT(*)
+        FROM bd_marcenaria.pedidos p
+        LEFT JOIN bd_marcenaria.pedido_itens i ON i.pedido_id = p.id
+        WHERE p.created_at >= %s AND p.created_at < %s
+    """,
+    "orcamentos": """
+        SELECT COUNT(*)
+        FROM bd_marcenaria.orcamentos o
+        LEFT JOIN bd_marcenaria.orcamento_itens i ON i.orcamento_id = o.id
+        WHERE o.created_at >= %s AND o.created_at < %s
+    """,
+}
+
+
+# =========================
+# ESCRITORES
+# =========================
+class _EscritorCsv:
+    def __init__(self, caminho: str, cabecalho: list):
+        # utf-8-sig + ';' abre direto no Excel em pt-BR
+        self._f = open(caminho, "w", newline="", encoding="utf-8-sig")
+        self._w = csv.writer(self._f, delimiter=";")
+        self._w.writerow(cabecalho)
+
+    def escrever(self, linhas):
+        self._w.writerows(linhas)
+
+    def fechar(self):
+        self._f.close()
+
+
+class _EscritorXlsx:
+    def __init__(self, caminho: str, cabecalho: list):
+        try:
+            from openpyxl import Workbook
+        except ImportError as e:
+            raise RuntimeError("Exportar em XLSX precisa do openpyxl (pip install openpyxl).") from e
+        self._caminho = caminho
+        # write_only: as linhas vão para um arquivo temporário do openpyxl, não ficam na memória
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet("dados")
+        self._ws.append(cabecalho)
+
+    def escrever(self, linhas):
+        for r in linhas:
+            # Excel não aceita datetime com fuso; a sessão já está em America/Fortaleza
+            self._ws.append([v.replace(tzinfo=None) if isinstance(v, datetime) else v for v in r])
+
+    def fechar(self):
+        self._wb.save(self._caminho)
+
+
+_ESCRITORES = {"csv": _EscritorCsv, "xlsx": _EscritorXlsx}
+
+
+# =========================
+# EXPORTAR
+# =========================
+def exportar(tipo: str, caminho: str, de: date, ate: date, formato: str = "csv", lote: int = 2000, progresso=None) -> int:
+    """
+    Grava em `caminho` as linhas de `tipo` ("pedidos" ou "orcamentos") criadas
+    entre `de` e `ate` (inclusive). `progresso(feitas, total)` é chamado a cada lote.
+    Retorna o número de linhas escritas.
+    """
+    if tipo not in _CONSULTAS:
+        raise ValueError(f"Tipo inválido: {tipo}")
+    if formato not in _ESCRITORES:
+        raise ValueError(f"Formato inválido: {formato}")
+
+    cabecalho, sql = _CONSULTAS[tipo]
+    params = (de, ate + timedelta(days=1))
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_CONTAGEM[tipo], params)
+            total = int(cur.fetchone()[0] or 0)
+
+        escritor = _ESCRITORES[formato](caminho, cabecalho)
+        feitas = 0
+        try:
+            # cursor nomeado = server-side: só `lote` linhas trafegam por vez
+            with conn.cursor(name=f"exportacao_{tipo}") as cur:
+                cur.itersize = lote
+                cur.execute(sql, params)
+                while True:
+                    linhas = cur.fetchmany(lote)
+                    if not linhas:
+                        break
+                    escritor.escrever(linhas)
+                    feitas += len(linhas)
+                    if progresso:
+                        progresso(feitas, total)
+        finally:
+            escritor.fechar()
+        conn.rollback()
+
+    if progresso:
+        progresso(feitas, max(total, feitas))
+    return feitas
+
+
+def main(argv=None):
+    hoje = date.today()
+    ap = argparse.ArgumentParser(prog="python -m marcenaria.exportacao", description="Exporta pedidos ou orçamentos com itens e clientes.")
+    ap.add_argument("tipo", choices=sorted(_CONSULTAS))
+    ap.add_argument("--de", type=date.fromisoformat, default=date(hoje.year, 1, 1))
+    ap.add_argument("--ate", type=date.fromisoformat, default=hoje)
+    ap.add_argument("--formato", choices=FORMATOS, default="csv")
+    ap.add_argument("--lote", type=int, default=2000)
+    ap.add_argument("-o", "--saida", help="arquivo de saída (padrão: <tipo>_<de>_<ate>.<formato>)")
+    args = ap.parse_args(argv)
+
+    saida = args.saida or f"{args.tipo}_{args.de:%Y%m%d}_{args.ate:%Y%m%d}.{args.formato}"
+    n = exportar(args.tipo, saida, args.de, args.ate, formato=args.formato, lote=args.lote)
+    print(f"{n} linha(s) em {saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Formatação de valores para tela e PDF (sem dependência do Streamlit).
+import numpy as np
+import pandas as pd
+
+
+def safe_float(x, default=0.0):
+    try:
+        return float(x)
+    except Exception:
+        return default
+
+
+def brl(v):
+    try:
+        return f"R$ {float(v):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    except Exception:
+        return "R$ 0,00"
+
+
+def fmt_date_br(x):
+    if x is None or x == "":
+        return ""
+    try:
+        dt = pd.to_datetime(x, errors="coerce")
+        if pd.isna(dt):
+            return str(x)
+        return dt.strftime("%d/%m/%Y")
+    except Exception:
+        return str(x)
+
+
+def fmt_dt_br(x):
+    if x is None or x == "":
+        return ""
+    try:
+        dt = pd.to_datetime(x, errors="coerce")
+        if pd.isna(dt):
+            return str(x)
+        return dt.strftime("%d/%m/%Y %H:%M")
+    except Exception:
+        return str(x)
+
+
+# =========================
+# CÉLULAS DO DATA_EDITOR
+# =========================
+# Célula vazia do data_editor chega como None, NaN ou ''.
+def celula_vazia(v) -> bool:
+    return v is None or v != v or (isinstance(v, str) and not v.strip())
+
+
+def celula_num(v):
+    """Número > 0 da célula, ou None (vazia, texto, zero ou negativo)."""
+    if celula_vazia(v):
+        return None
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        return None
+    return v if v == v and v > 0 else None
+
+
+def celula_texto(v) -> str:
+    return "" if celula_vazia(v) else str(v).strip()
+
+
+# =========================
+# COLUNAS INTEIRAS (pandas)
+# =========================
+# Mesmo resultado de brl/fmt_date_br/fmt_dt_br, para a coluna toda: a conversão
+# é vetorizada e cada valor distinto é formatado uma vez só (em listagem, datas
+# e valores se repetem muito; strftime por linha é o que custa caro).
+def _por_valor_distinto(serie, formatar):
+    codigos, distintos = pd.factorize(serie)
+    textos = np.asarray(formatar(distintos), dtype=object)
+    if not len(textos):
+        return np.full(len(codigos), "", dtype=object)
+    return textos.take(codigos)
+
+
+def brl_serie(s):
+    s = pd.Series(s)
+    v = pd.to_numeric(s, errors="coerce").fillna(0.0).astype("float64")
+    return pd.Series(_por_valor_distinto(v, lambda u: [brl(x) for x in u]), index=s.index)
+
+
+def _fmt_serie(s, formato: str, arredondar: str, um_valor):
+    s = pd.Series(s)
+    try:
+        dt = pd.to_datetime(s, errors="coerce")
+    except (ValueError, TypeError):
+        # fusos/tipos misturados na mesma coluna: cai no formatador de um valor
+        return s.map(um_valor)
+    out = pd.Series(_por_valor_distinto(dt.dt.floor(arredondar), lambda u: u.strftime(formato)), index=s.index)
+    # vazio continua vazio; o que não é data volta como texto (igual ao fmt_* de um valor)
+    vazio = s.isna() | (s.astype(str) == "")
+    invalido = dt.isna() & ~vazio
+    out[vazio] = ""
+    out[invalido] = s[invalido].astype(str)
+    return out
+
+
+def data_br_serie(s):
+    return _fmt_serie(s, "%d/%m/%Y", "D", fmt_date_br)
+
+
+def data_hora_br_serie(s):
+    return _fmt_serie(s, "%d/%m/%Y %H:%M", "min", fmt_dt_br)
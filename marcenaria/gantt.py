@@ -0,0 +1,136 @@
+# Gantt dos pedidos ativos: intervalos reais (producao_etapas) e planejados.
+#
+# Planejado = as etapas que faltam (previsao.etapas_restantes), encaixadas de
+# trás para frente a partir do fim do dia da entrega prevista, cada uma com a
+# mediana histórica dela. Sai
+# tudo de uma transformação vetorizada (pedidos × etapas) e vira um gráfico
+# Altair só, em vez de um bloco HTML por pedido.
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from .config import ETAPAS_KANBAN_EXCLUIR, ETAPAS_PRODUCAO, FORTALEZA_TZ
+from .data_access import fetch_dataframe
+from .previsao import percorre
+
+DURACAO_PADRAO = 1.0  # dias, etapa sem histórico
+
+COLUNAS = ["pedido_id", "codigo", "etapa", "responsavel", "inicio", "fim", "tipo"]
+
+
+def intervalos_reais(ids: list[int]) -> pd.DataFrame:
+    """Histórico de etapas dos pedidos `ids`; intervalo aberto vai até agora."""
+    if not ids:
+        return pd.DataFrame(columns=COLUNAS)
+    df = fetch_dataframe("""
+        SELECT
+            e.pedido_id,
+            p.codigo,
+            e.etapa,
+            COALESCE(f.nome, 'Sem responsável') AS responsavel,
+            COALESCE(e.inicio_em, e.created_at) AS inicio,
+            COALESCE(e.fim_em, now()) AS fim
+        FROM bd_marcenaria.producao_etapas e
+        JOIN bd_marcenaria.pedidos p ON p.id = e.pedido_id
+        LEFT JOIN bd_marcenaria.funcionarios f ON f.id = e.responsavel_id
+        WHERE e.pedido_id = ANY(%(ids)s)
+        ORDER BY e.pedido_id, inicio
+    """, {"ids": [int(i) for i in ids]})
+    df["tipo"] = "Real"
+    return df[COLUNAS]
+
+
+def intervalos_planejados(abertos: pd.DataFrame, duracoes: dict) -> pd.DataFrame:
+    """
+    `abertos` como em previsao.pedidos_abertos(); `duracoes` = {etapa: dias}.
+    Uma linha por etapa que falta (as de previsao.etapas_restantes) de cada pedido com entrega prevista.
+    """
+    base = abertos[abertos["data_entrega_prevista"].notna()]
+    if base.empty:
+        return pd.DataFrame(columns=COLUNAS)
+
+    dur = np.array([float(duracoes.get(e) or DURACAO_PADRAO) for e in ETAPAS_PRODUCAO])
+    segue = np.array([percorre(e, duracoes) for e in ETAPAS_PRODUCAO])
+    no_kanban = np.array([e not in ETAPAS_KANBAN_EXCLUIR for e in ETAPAS_PRODUCAO])
+
+    # falta[p, j]: o pedido p ainda passa pela etapa j (mesma regra de etapas_restantes)
+    k = base["etapa_atual"].map({e: i for i, e in enumerate(ETAPAS_PRODUCAO)}).fillna(0).to_numpy(dtype=np.int64)[:, None]
+    concluida = (base["status_etapa"] == "Concluído").to_numpy()[:, None]
+    cols = np.arange(len(ETAPAS_PRODUCAO))[None, :]
+    falta = ((cols > k) & segue) | ((cols == k) & ~concluida & no_kanban)
+
+    # resto[p, j] = dias da etapa j até o fim para o pedido p; resto[:, S] = 0
+    d = np.where(falta, dur, 0.0)
+    resto = np.hstack([np.cumsum(d[:, ::-1], axis=1)[:, ::-1], np.zeros((len(d), 1))])
+    p_idx, j = np.nonzero(falta)
+
+    prazo = (
+        pd.to_datetime(base["data_entrega_prevista"]).dt.normalize() + pd.Timedelta(days=1)
+    ).dt.tz_localize(FORTALEZA_TZ).to_numpy()[p_idx]
+    return pd.DataFrame(
+        {
+            "pedido_id": base["id"].to_numpy()[p_idx],
+            "codigo": base["codigo"].to_numpy()[p_idx],
+            "etapa": np.array(ETAPAS_PRODUCAO, dtype=object)[j],
+            "responsavel": "",
+            "inicio": pd.DatetimeIndex(prazo) - pd.to_timedelta(resto[p_idx, j], unit="D"),
+            "fim": pd.DatetimeIndex(prazo) - pd.to_timedelta(resto[p_idx, j + 1], unit="D"),
+            "tipo": "Planejado",
+        }
+    )
+
+
+def grafico(intervalos: pd.DataFrame, entregas: pd.DataFrame | None = None, altura_linha: int = 16):
+    """
+    Um gráfico só: barra clara = planejado, barra cheia = real, cor = etapa,
+    losango = entrega prevista, linha vertical = agora. Zoom/arraste no eixo do tempo.
+    """
+    df = intervalos.copy()
+    # Vega-Lite lê datas como texto ISO; fuso já aplicado
+    df["inicio"] = pd.to_datetime(df["inicio"]).dt.tz_convert(FORTALEZA_TZ).dt.tz_localize(None)
+    df["fim"] = pd.to_datetime(df["fim"]).dt.tz_convert(FORTALEZA_TZ).dt.tz_localize(None)
+    # pedidos com entrega prevista na ordem dela; os sem data vão para o fim
+    com_data = list(dict.fromkeys(entregas["codigo"])) if entregas is not None and len(entregas) else []
+    ordem = com_data + sorted(set(df["codigo"]) - set(com_data))
+
+    y = alt.Y("codigo:N", sort=ordem, title=None, axis=alt.Axis(labelLimit=140))
+    cor = alt.Color("etapa:N", scale=alt.Scale(domain=ETAPAS_PRODUCAO), title="Etapa")
+    dica = [
+        alt.Tooltip("codigo:N", title="Pedido"),
+        alt.Tooltip("etapa:N", title="Etapa"),
+        alt.Tooltip("tipo:N", title="Tipo"),
+        alt.Tooltip("responsavel:N", title="Responsável"),
+        alt.Tooltip("inicio:T", title="Início", format="%d/%m/%Y %H:%M"),
+        alt.Tooltip("fim:T", title="Fim", format="%d/%m/%Y %H:%M"),
+    ]
+    zoom = alt.selection_interval(bind="scales", encodings=["x"])
+    x = alt.X("inicio:T", title=None, axis=alt.Axis(format="%d/%m"))
+
+    planejado = (
+        alt.Chart(df[df["tipo"] == "Planejado"])
+        .mark_bar(opacity=0.3, height=altura_linha - 2)
+        .encode(x=x, x2="fim:T", y=y, color=cor, tooltip=dica)
+        .add_params(zoom)
+    )
+    real = (
+        alt.Chart(df[df["tipo"] == "Real"])
+        .mark_bar(height=max(4, altura_linha // 2))
+        .encode(x=x, x2="fim:T", y=y, color=cor, tooltip=dica)
+    )
+    agora = alt.Chart(pd.DataFrame({"t": [pd.Timestamp.now(FORTALEZA_TZ).tz_localize(None)]})).mark_rule(
+        color="#E5484D", strokeDash=[4, 3]
+    ).encode(x="t:T")
+
+    camadas = [planejado, real, agora]
+    if entregas is not None and len(entregas):
+        # o losango fica no fim do dia do prazo; a dica mostra a data prevista mesmo
+        prazo = pd.to_datetime(entregas["data_entrega_prevista"])
+        ent = entregas.assign(prazo=prazo, entrega=prazo + pd.Timedelta(days=1))
+        camadas.append(
+            alt.Chart(ent[["codigo", "prazo", "entrega"]])
+            .mark_point(shape="diamond", filled=True, color="#101828", size=40)
+            .encode(x="entrega:T", y=y, tooltip=[alt.Tooltip("codigo:N", title="Pedido"), alt.Tooltip("prazo:T", title="Prazo", format="%d/%m/%Y")])
+        )
+
+    n = max(1, df["codigo"].nunique())
+    return alt.layer(*camadas).properties(height=n * altura_linha)
@@ -0,0 +1,240 @@
+# Necessidade de materiais dos pedidos em aberto (para compras).
+#
+# Uma consulta agrega os pedido_itens dos pedidos filtrados por etapa atual e
+# janela de entrega: área de chapa por material/espessura, metros de fita de
+# borda e quantidade por descrição de item. Itens compostos (tabela
+# composicoes, que pode aninhar) viram os componentes; a expansão achatada da
+# composição fica em cache até a tabela mudar.
+#
+#   python -m marcenaria.materiais --etapas "Projeto técnico,Produção" --ate 2025-06-30 -o compras.csv
+import argparse
+import csv
+import io
+import math
+from datetime import date
+from functools import lru_cache
+
+import pandas as pd
+from psycopg2.extras import RealDictCursor
+
+from .config import ETAPAS_PRODUCAO
+from .corte import CHAPA_PADRAO
+from .db_connector import get_db_connection
+from .data_access import fetch_dataframe
+
+ETAPAS_PADRAO = ("Projeto técnico", "Produção")
+
+# fração média da chapa que vira peça (o resto é serra e retalho)
+APROVEITAMENTO_CHAPA = 0.85
+
+COLUNAS = ["tipo", "material", "espessura_mm", "unidade", "quantidade", "chapas", "pedidos"]
+
+
+# =========================
+# COMPOSIÇÕES (BOM)
+# =========================
+def _marcador_composicoes():
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*), MAX(updated_at), MAX(id) FROM bd_marcenaria.composicoes")
+            return tuple(str(v) for v in cur.fetchone())
+
+
+@lru_cache(maxsize=2)
+def _bom_expandida(marcador) -> dict:
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT item, componente, unidade, qtd FROM bd_marcenaria.composicoes")
+            linhas = cur.fetchall() or []
+
+    direto: dict[str, list] = {}
+    for item, comp, unidade, qtd in linhas:
+        direto.setdefault(item.strip().lower(), []).append((comp.strip(), unidade or "Unid.", float(qtd or 0)))
+
+    def achatar(chave, caminho):
+        # {(componente, unidade): qtd por unidade do item}, só folhas
+        out = {}
+        for comp, unidade, qtd in direto.get(chave, []):
+            filho = comp.lower()
+            if filho in direto and filho not in caminho:
+                for k, q in achatar(filho, caminho | {filho}).items():
+                    out[k] = out.get(k, 0.0) + qtd * q
+            else:
+                out[(comp, unidade)] = out.get((comp, unidade), 0.0) + qtd
+        return out
+
+    return {chave: achatar(chave, {chave}) for chave in direto}
+
+
+def bom_expandida() -> dict:
+    """{descrição do item (minúsculas): {(componente, unidade): qtd por unidade}} com compostos aninhados achatados."""
+    return _bom_expandida(_marcador_composicoes())
+
+
+def listar_composicoes() -> list[dict]:
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT item, componente, unidade, qtd FROM bd_marcenaria.composicoes ORDER BY item, id")
+            return cur.fetchall() or []
+
+
+def salvar_composicoes(linhas: list[dict]) -> int:
+    """Regrava a tabela inteira (é pequena e editada de uma vez). Retorna quantas linhas ficaram."""
+    validas = []
+    for r in linhas or []:
+        item = str(r.get("item") or "").strip()
+        comp = str(r.get("componente") or "").strip()
+        try:
+            qtd = float(r.get("qtd"))
+        except (TypeError, ValueError):
+            continue
+        if item and comp and qtd == qtd and qtd > 0:
+            validas.append((item, comp, str(r.get("unidade") or "").strip() or "Unid.", qtd))
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM bd_marcenaria.composicoes")
+            if validas:
+                cur.executemany(
+                    "INSERT INTO bd_marcenaria.composicoes (item, componente, unidade, qtd) VALUES (%s,%s,%s,%s)",
+                    validas,
+                )
+            conn.commit()
+    return len(validas)
+
+
+# =========================
+# NECESSIDADES
+# =========================
+def _agregado(etapas, de, ate) -> pd.DataFrame:
+    return fetch_dataframe("""
+        WITH itens AS (
+            SELECT
+                i.pedido_id,
+                i.descricao,
+                i.unidade,
+                COALESCE(i.qtd, 1) AS qtd,
+                i.largura_mm,
+                i.altura_mm,
+                i.espessura_mm,
+                COALESCE(NULLIF(TRIM(i.material), ''), '(sem material)') AS material,
+                COALESCE(i.fita_lados, 0) AS fita_lados,
+                (i.largura_mm > 0 AND i.altura_mm > 0) AS tem_medida
+            FROM bd_marcenaria.pedidos p
+            JOIN bd_marcenaria.pedido_itens i ON i.pedido_id = p.id
+            WHERE COALESCE(p.status, '') NOT IN ('Entregue', 'Cancelado')
+              AND (%(etapas)s::text[] IS NULL OR p.etapa_atual = ANY(%(etapas)s::text[]))
+              AND (%(de)s::date IS NULL OR p.data_entrega_prevista >= %(de)s::date)
+              AND (%(ate)s::date IS NULL OR p.data_entrega_prevista <= %(ate)s::date)
+        )
+        SELECT 'Chapa' AS tipo, MIN(material) AS material, espessura_mm, 'm²' AS unidade,
+               SUM(qtd * largura_mm * altura_mm) / 1e6 AS quantidade,
+               COUNT(DISTINCT pedido_id) AS pedidos,
+               FALSE AS tem_medida
+        FROM itens
+        WHERE tem_medida
+        GROUP BY LOWER(material), espessura_mm
+
+        UNION ALL
+
+        SELECT 'Fita de borda', MIN(material), espessura_mm, 'm',
+               SUM(qtd * (LEAST(fita_lados, 2) * GREATEST(largura_mm, altura_mm)
+                          + GREATEST(fita_lados - 2, 0) * LEAST(largura_mm, altura_mm))) / 1000.0,
+               COUNT(DISTINCT pedido_id),
+               FALSE
+        FROM itens
+        WHERE tem_medida AND fita_lados > 0
+        GROUP BY LOWER(material), espessura_mm
+
+        UNION ALL
+
+        SELECT 'Item', MIN(TRIM(descricao)), NULL, MIN(COALESCE(unidade, 'Unid.')),
+               SUM(qtd),
+               COUNT(DISTINCT pedido_id),
+               BOOL_OR(COALESCE(tem_medida, FALSE))
+        FROM itens
+        GROUP BY LOWER(TRIM(descricao))
+    """, {
+        "etapas": None if etapas is None else list(etapas),
+        "de": de,
+        "ate": ate,
+    })
+
+
+def necessidades(etapas=ETAPAS_PADRAO, de: date | None = None, ate: date | None = None,
+                 chapa: tuple = CHAPA_PADRAO, aproveitamento: float = APROVEITAMENTO_CHAPA) -> pd.DataFrame:
+    """
+    Colunas COLUNAS. tipo: 'Chapa' (m² e chapas estimadas), 'Fita de borda' (m),
+    'Componente' (da composição dos itens compostos, somado ao que também é pedido
+    avulso) ou 'Item' (item sem medida e sem composição). etapas=None = todas;
+    lista vazia = nenhuma.
+    """
+    ag = _agregado(etapas, de, ate)
+    if ag.empty:
+        return pd.DataFrame(columns=COLUNAS)
+
+    itens = ag[ag["tipo"] == "Item"]
+    resto = ag[ag["tipo"] != "Item"].drop(columns="tem_medida")
+
+    bom = bom_expandida()
+    chave = itens["material"].str.lower()
+    composto = chave.isin(bom.keys())
+
+    comp = [
+        (c, u, q * float(qtd), int(n))
+        for k, qtd, n in zip(chave[composto], itens["quantidade"][composto], itens["pedidos"][composto])
+        for (c, u), q in bom[k].items()
+    ]
+    componentes = pd.DataFrame(comp, columns=["material", "unidade", "quantidade", "pedidos"]).assign(tipo="Componente")
+
+    # item com medida já entrou como chapa; sem medida e sem composição vai como está
+    avulsos = itens[~composto & ~itens["tem_medida"].astype(bool)].drop(columns="tem_medida")
+
+    # o mesmo material pode vir de kits e avulso: uma linha por (material, unidade).
+    # `pedidos` = da origem que mais usa (um pedido pode ter vários itens que levam o mesmo);
+    # "Componente" < "Item", então a linha é Componente se algum kit leva o material
+    soltos = pd.concat([componentes, avulsos[componentes.columns]], ignore_index=True)
+    if len(soltos):
+        soltos = soltos.assign(chave=soltos["material"].str.strip().str.lower()).groupby(["chave", "unidade"], as_index=False).agg(
+            material=("material", "first"), quantidade=("quantidade", "sum"), pedidos=("pedidos", "max"), tipo=("tipo", "min")
+        ).drop(columns="chave")
+
+    out = pd.concat([resto, soltos], ignore_index=True)
+    area_chapa = chapa[0] * chapa[1] / 1e6
+    eh_chapa = out["tipo"] == "Chapa"
+    out["chapas"] = pd.NA
+    out.loc[eh_chapa, "chapas"] = [math.ceil(a / (area_chapa * aproveitamento)) for a in out.loc[eh_chapa, "quantidade"]]
+    ordem = {"Chapa": 0, "Fita de borda": 1, "Componente": 2, "Item": 3}
+    out = out.sort_values(["tipo", "material"], key=lambda s: s.map(ordem) if s.name == "tipo" else s.str.lower())
+    return out[COLUNAS].reset_index(drop=True)
+
+
+def para_csv(df: pd.DataFrame) -> bytes:
+    """CSV no mesmo formato da exportação (';' e utf-8-sig, abre direto no Excel)."""
+    buf = io.StringIO()
+    w = csv.writer(buf, delimiter=";")
+    w.writerow(COLUNAS)
+    w.writerows(df[COLUNAS].astype(object).where(df[COLUNAS].notna(), "").itertuples(index=False, name=None))
+    return buf.getvalue().encode("utf-8-sig")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m marcenaria.materiais", description="Necessidade de materiais dos pedidos em aberto.")
+    ap.add_argument("--etapas", default=",".join(ETAPAS_PADRAO), help=f"separadas por vírgula (vazio = todas); opções: {', '.join(ETAPAS_PRODUCAO)}")
+    ap.add_argument("--de", type=date.fromisoformat)
+    ap.add_argument("--ate", type=date.fromisoformat)
+    ap.add_argument("-o", "--saida", help="arquivo CSV (padrão: imprime na tela)")
+    args = ap.parse_args(argv)
+
+    etapas = [e.strip() for e in args.etapas.split(",") if e.strip()] or None
+    df = necessidades(etapas, args.de, args.ate)
+    if args.saida:
+        with open(args.saida, "wb") as f:
+            f.write(para_csv(df))
+        print(f"{len(df)} linha(s) em {args.saida}")
+    else:
+        print(df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,246 @@
+import logging
+from datetime import date
+
 from .db_connector import get_db_connection
 from .auth import hash_password
+from .config import get_particoes_config
+from .timezone_utils import agora_fortaleza
 
 SCHEMA = "bd_marcenaria"
+SCHEMA_ARQUIVO = "bd_marcenaria_arquivo"
+
+# DETACH pega ACCESS EXCLUSIVE na tabela-mãe; se não conseguir nesse tempo, desiste e tenta na próxima manutenção
+# (DETACH ... CONCURRENTLY não serve: a tabela tem partição DEFAULT)
+DETACH_LOCK_TIMEOUT = "3s"
+
+log = logging.getLogger("marcenaria.migrations")
+
+# Tabelas append-only particionadas por mês em created_at.
+# As FKs são recriadas na conversão (CREATE TABLE ... LIKE não copia FKs).
+TABELAS_PARTICIONADAS = {
+    "producao_eventos": [
+        "FOREIGN KEY (pedido_id) REFERENCES pedidos(id) ON DELETE CASCADE",
+        "FOREIGN KEY (cliente_id) REFERENCES clientes(id)",
+        "FOREIGN KEY (responsavel_id) REFERENCES funcionarios(id)",
+    ],
+    "producao_etapas": [
+        "FOREIGN KEY (pedido_id) REFERENCES pedidos(id) ON DELETE CASCADE",
+        "FOREIGN KEY (responsavel_id) REFERENCES funcionarios(id)",
+    ],
+}
+
+
+def _exec_opcional(cur, sql: str) -> bool:
+    # roda dentro de SAVEPOINT: se falhar (ex.: extensão indisponível), não derruba o init
+    cur.execute("SAVEPOINT sp_opcional")
+    try:
+        cur.execute(sql)
+        cur.execute("RELEASE SAVEPOINT sp_opcional")
+        return True
+    except Exception:
+        cur.execute("ROLLBACK TO SAVEPOINT sp_opcional")
+        return False
+
+
+# =========================
+# CÓDIGOS ORC/PED
+# =========================
+# Uma sequence por prefixo e ano (ex.: PED26-000123), consumida no próprio INSERT.
+PREFIXOS_CODIGO = ("ORC", "PED")
+
+_FN_PROXIMO_CODIGO = f"""
+    CREATE OR REPLACE FUNCTION {SCHEMA}.proximo_codigo(prefixo TEXT)
+    RETURNS TEXT
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        ano TEXT := to_char(now() AT TIME ZONE 'America/Fortaleza', 'YY');
+        seq TEXT := '{SCHEMA}.seq_codigo_' || lower(prefixo) || '_' || ano;
+        n BIGINT;
+    BEGIN
+        BEGIN
+            n := nextval(seq::regclass);
+        EXCEPTION WHEN undefined_table THEN
+            -- primeiro código do ano: cria a sequence (outra sessão pode ter criado junto)
+            BEGIN
+                EXECUTE 'CREATE SEQUENCE IF NOT EXISTS ' || seq;
+            EXCEPTION WHEN unique_violation OR duplicate_table THEN
+                NULL;
+            END;
+            n := nextval(seq::regclass);
+        END;
+        RETURN upper(prefixo) || ano || '-' || lpad(n::TEXT, greatest(6, length(n::TEXT)), '0');
+    END
+    $$
+"""
+
+
+def garantir_sequencias_codigo(cur, hoje: date | None = None):
+    # deixa pronta a do ano seguinte para a virada não pagar o CREATE
+    hoje = hoje or agora_fortaleza().date()
+    for prefixo in PREFIXOS_CODIGO:
+        for ano in (hoje.year, hoje.year + 1):
+            cur.execute(f"CREATE SEQUENCE IF NOT EXISTS {SCHEMA}.seq_codigo_{prefixo.lower()}_{ano % 100:02d}")
+
+
+# =========================
+# PARTICIONAMENTO MENSAL
+# =========================
+def _somar_meses(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def _eh_particionada(cur, tabela: str) -> bool:
+    cur.execute("""
+        SELECT c.relkind
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+    """, (SCHEMA, tabela))
+    r = cur.fetchone()
+    return bool(r) and r[0] == "p"
+
+
+def _particoes(cur, tabela: str) -> dict:
+    # {date(ano, mes, 1): nome} das partições mensais (nome termina em _AAAAMM)
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = %s AND p.relname = %s
+    """, (SCHEMA, tabela))
+    out = {}
+    for (nome,) in cur.fetchall():
+        sufixo = nome.rsplit("_", 1)[-1]
+        if len(sufixo) == 6 and sufixo.isdigit():
+            out[date(int(sufixo[:4]), int(sufixo[4:]), 1)] = nome
+    return out
+
+
+def garantir_particoes(cur, tabela: str, desde: date | None = None, meses_a_frente: int = 3):
+    """
+    Cria as partições mensais de `desde` (ou do mês atual) até `meses_a_frente` meses à frente.
+    Linhas do mês que já caíram na DEFAULT são movidas para a partição nova.
+    """
+    hoje = agora_fortaleza().date().replace(day=1)
+    ini = (desde or hoje).replace(day=1)
+    fim = _somar_meses(hoje, max(meses_a_frente, 1))
+    existentes = _particoes(cur, tabela)
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f"{SCHEMA}.{tabela}_default",))
+    tem_default = cur.fetchone()[0]
+    m = ini
+    while m <= fim:
+        if m not in existentes:
+            nome = f"{tabela}_{m:%Y%m}"
+            de, ate = m.isoformat(), _somar_meses(m, 1).isoformat()
+            movidas = 0
+            if tem_default:
+                cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.{tabela}_default WHERE created_at >= %s AND created_at < %s", (de, ate))
+                movidas = cur.fetchone()[0]
+            if movidas:
+                # com linhas do mês na DEFAULT o CREATE ... PARTITION OF falha: cria solta, move e anexa
+                cur.execute(f"CREATE TABLE {SCHEMA}.{nome} (LIKE {SCHEMA}.{tabela} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+                cur.execute(f"""
+                    WITH movidas AS (
+                        DELETE FROM {SCHEMA}.{tabela}_default
+                        WHERE created_at >= %s AND created_at < %s
+                        RETURNING *
+                    )
+                    INSERT INTO {SCHEMA}.{nome} SELECT * FROM movidas
+                """, (de, ate))
+                cur.execute(f"ALTER TABLE {SCHEMA}.{tabela} ATTACH PARTITION {SCHEMA}.{nome} FOR VALUES FROM ('{de}') TO ('{ate}')")
+                log.warning("%s: %s linha(s) movidas da partição DEFAULT para %s", tabela, movidas, nome)
+            else:
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {SCHEMA}.{nome}
+                    PARTITION OF {SCHEMA}.{tabela}
+                    FOR VALUES FROM ('{de}') TO ('{ate}')
+                """)
+        m = _somar_meses(m, 1)
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {SCHEMA}.{tabela}_default PARTITION OF {SCHEMA}.{tabela} DEFAULT")
+
+
+def _converter_para_particionada(cur, tabela: str, fks: list, meses_a_frente: int):
+    # conversão única: tabela comum -> particionada por mês em created_at
+    if _eh_particionada(cur, tabela):
+        return
+
+    antiga = f"{tabela}_antiga"
+    seq = f"{tabela}_id_seq"
+    cur.execute(f"LOCK TABLE {tabela} IN ACCESS EXCLUSIVE MODE")
+    # chave de partição não aceita NULL
+    cur.execute(f"UPDATE {tabela} SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    cur.execute(f"SELECT MIN(created_at)::date FROM {tabela}")
+    desde = cur.fetchone()[0]
+
+    cur.execute(f"ALTER TABLE {tabela} RENAME TO {antiga}")
+    cur.execute(f"ALTER SEQUENCE {seq} OWNED BY NONE")
+    cur.execute(f"CREATE TABLE {tabela} (LIKE {antiga} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+    cur.execute(f"ALTER TABLE {tabela} ALTER COLUMN created_at SET NOT NULL")
+    garantir_particoes(cur, tabela, desde=desde, meses_a_frente=meses_a_frente)
+
+    cur.execute(f"INSERT INTO {tabela} SELECT * FROM {antiga}")
+    cur.execute(f"DROP TABLE {antiga}")
+
+    # nomes de PK/FK/índices ficam livres só depois do DROP da antiga
+    cur.execute(f"ALTER TABLE {tabela} ADD PRIMARY KEY (id, created_at)")
+    for fk in fks:
+        cur.execute(f"ALTER TABLE {tabela} ADD {fk}")
+    cur.execute(f"ALTER SEQUENCE {seq} OWNED BY {tabela}.id")
+
+
+def aplicar_retencao_eventos(cur, meses: int, acao: str = "arquivar") -> list:
+    """
+    Desanexa as partições de producao_eventos mais antigas que `meses` meses,
+    desde que não tenham evento pendente (descartado não conta). Arquiva (schema de arquivo) ou exclui.
+    O DETACH espera no máximo DETACH_LOCK_TIMEOUT pelo lock; partição que não saiu fica para a próxima vez.
+    """
+    if meses <= 0 or not _eh_particionada(cur, "producao_eventos"):
+        return []
+
+    limite = _somar_meses(agora_fortaleza().date().replace(day=1), -meses)
+    removidas = []
+    for mes, nome in sorted(_particoes(cur, "producao_eventos").items()):
+        if _somar_meses(mes, 1) > limite:
+            continue
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM {SCHEMA}.{nome} WHERE processado = FALSE AND descartado = FALSE)")
+        if cur.fetchone()[0]:
+            continue
+        cur.execute("SAVEPOINT sp_detach")
+        cur.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+        try:
+            cur.execute(f"ALTER TABLE {SCHEMA}.producao_eventos DETACH PARTITION {SCHEMA}.{nome}")
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT sp_detach")
+            log.error("retenção: não foi possível desanexar %s (%s); fica para a próxima manutenção", nome, str(e).strip())
+            # o lock é na tabela-mãe: as próximas partições esbarrariam nele também
+            break
+        finally:
+            cur.execute("SET LOCAL lock_timeout = DEFAULT")
+        cur.execute("RELEASE SAVEPOINT sp_detach")
+        if acao == "excluir":
+            cur.execute(f"DROP TABLE {SCHEMA}.{nome}")
+        else:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_ARQUIVO}")
+            cur.execute(f"ALTER TABLE {SCHEMA}.{nome} SET SCHEMA {SCHEMA_ARQUIVO}")
+        removidas.append(nome)
+    return removidas
+
+
+def manutencao_particoes():
+    """Cria as partições futuras e aplica a retenção. Chamado pelo init e pelo worker."""
+    cfg = get_particoes_config()
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            for tabela in TABELAS_PARTICIONADAS:
+                if _eh_particionada(cur, tabela):
+                    garantir_particoes(cur, tabela, meses_a_frente=cfg["meses_a_frente"])
+            removidas = aplicar_retencao_eventos(cur, cfg["retencao_eventos_meses"], cfg["retencao_acao"])
+            conn.commit()
+            return removidas
 
 
 def init_database():
@@ -130,6 +369,58 @@ def init_database():
                     )
                 """)
 
+                # controle de concorrência otimista: toda escrita incrementa
+                cur.execute("ALTER TABLE orcamentos ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+                cur.execute("ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+
+                # peça estruturada (plano de corte): medidas em mm e material da chapa
+                for tabela in ("orcamento_itens", "pedido_itens"):
+                    cur.execute(f"ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS largura_mm DECIMAL(8,1)")
+                    cur.execute(f"ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS altura_mm DECIMAL(8,1)")
+                    cur.execute(f"ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS espessura_mm DECIMAL(5,1)")
+                    cur.execute(f"ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS material VARCHAR(80) DEFAULT ''")
+                    # lados com fita de borda (0-4; os compridos primeiro)
+                    cur.execute(f"ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS fita_lados SMALLINT DEFAULT 0")
+
+                # composição de itens compostos (ex.: "Gaveta 50cm" -> corrediça, puxador);
+                # `componente` pode ser outro item composto (materiais.bom_expandida)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS composicoes (
+                        id SERIAL PRIMARY KEY,
+                        item VARCHAR(200) NOT NULL,
+                        componente VARCHAR(200) NOT NULL,
+                        unidade VARCHAR(20) DEFAULT 'Unid.',
+                        qtd DECIMAL(12,3) NOT NULL DEFAULT 1,
+                        updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+
+                # catálogo de produtos (marcenaria.catalogo): preço e medidas padrão por descrição
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS produtos (
+                        id SERIAL PRIMARY KEY,
+                        codigo VARCHAR(40),
+                        descricao VARCHAR(200) NOT NULL,
+                        unidade VARCHAR(20) DEFAULT 'Unid.',
+                        valor_unit DECIMAL(12,2) DEFAULT 0,
+                        material VARCHAR(80) DEFAULT '',
+                        largura_mm DECIMAL(8,1),
+                        altura_mm DECIMAL(8,1),
+                        espessura_mm DECIMAL(5,1),
+                        fita_lados SMALLINT DEFAULT 0,
+                        ativo BOOLEAN DEFAULT TRUE,
+                        created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+
+                # quantas etapas o funcionário toca em paralelo (agenda sugerida)
+                cur.execute("ALTER TABLE funcionarios ADD COLUMN IF NOT EXISTS capacidade SMALLINT NOT NULL DEFAULT 1")
+
+                # coordenadas do endereço do cliente (rota de transporte/montagem), digitadas ou importadas
+                cur.execute("ALTER TABLE clientes ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION")
+                cur.execute("ALTER TABLE clientes ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION")
+
                 # =========================
                 # Fila de automação (Make/WhatsApp)
                 # =========================
@@ -150,6 +441,76 @@ def init_database():
 
                 # MIGRAÇÃO segura: se já existia sem a coluna, adiciona
                 cur.execute("ALTER TABLE producao_eventos ADD COLUMN IF NOT EXISTS processado BOOLEAN DEFAULT FALSE")
+                # controle de entrega do worker (python -m marcenaria.worker)
+                cur.execute("ALTER TABLE producao_eventos ADD COLUMN IF NOT EXISTS tentativas INTEGER DEFAULT 0")
+                cur.execute("ALTER TABLE producao_eventos ADD COLUMN IF NOT EXISTS ultima_tentativa_em TIMESTAMPTZ")
+                cur.execute("ALTER TABLE producao_eventos ADD COLUMN IF NOT EXISTS processado_em TIMESTAMPTZ")
+                cur.execute("ALTER TABLE producao_eventos ADD COLUMN IF NOT EXISTS ultimo_erro TEXT DEFAULT ''")
+                # esgotou as tentativas: sai da fila (e do índice parcial) até ser reenfileirado
+                # (o worker marca os que já passaram do limite dele: ver worker.processar_lote)
+                cur.execute("ALTER TABLE producao_eventos ADD COLUMN IF NOT EXISTS descartado BOOLEAN NOT NULL DEFAULT FALSE")
+
+                # webhooks que já aceitaram um evento que falhou em outro (marcenaria.webhooks):
+                # na nova tentativa o evento só vai para os que faltam
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS webhook_entregas (
+                        evento_id INTEGER NOT NULL,
+                        url TEXT NOT NULL,
+                        entregue_em TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (evento_id, url)
+                    )
+                """)
+
+                # =========================
+                # Outbox de e-mails (marcenaria.notificacoes)
+                # =========================
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS notificacoes_outbox (
+                        id SERIAL PRIMARY KEY,
+                        destinatario VARCHAR(200) NOT NULL,
+                        tipo VARCHAR(40) NOT NULL,
+                        assunto TEXT DEFAULT '',
+                        corpo TEXT DEFAULT '',
+                        pedido_id INTEGER REFERENCES pedidos(id) ON DELETE SET NULL,
+                        enviado BOOLEAN DEFAULT FALSE,
+                        tentativas INTEGER DEFAULT 0,
+                        ultimo_erro TEXT DEFAULT '',
+                        created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+                        enviado_em TIMESTAMPTZ
+                    )
+                """)
+
+                # =========================
+                # PDFs dos orçamentos (marcenaria.pdf_orcamento)
+                # =========================
+                # tipo 'atual': um por orçamento, regravado quando o conteúdo muda
+                # tipo 'enviado': cópia fiel do que foi mandado ao cliente
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS orcamento_pdfs (
+                        id SERIAL PRIMARY KEY,
+                        orcamento_id INTEGER NOT NULL REFERENCES orcamentos(id) ON DELETE CASCADE,
+                        tipo VARCHAR(20) NOT NULL DEFAULT 'atual',
+                        hash_conteudo CHAR(64) NOT NULL,
+                        pdf BYTEA NOT NULL,
+                        tamanho INTEGER DEFAULT 0,
+                        created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+
+                # =========================
+                # Códigos ORC/PED (gerados no INSERT, sem colisão)
+                # =========================
+                cur.execute(_FN_PROXIMO_CODIGO)
+                garantir_sequencias_codigo(cur)
+
+                # =========================
+                # Particionamento mensal (conversão única das tabelas append-only)
+                # =========================
+                cfg_part = get_particoes_config()
+                for tabela, fks in TABELAS_PARTICIONADAS.items():
+                    _converter_para_particionada(cur, tabela, fks, cfg_part["meses_a_frente"])
+                    garantir_particoes(cur, tabela, meses_a_frente=cfg_part["meses_a_frente"])
+                aplicar_retencao_eventos(cur, cfg_part["retencao_eventos_meses"], cfg_part["retencao_acao"])
 
                 # =========================
                 # Índices (só depois de garantir as colunas)
@@ -158,8 +519,58 @@ def init_database():
                 cur.execute("CREATE INDEX IF NOT EXISTS idx_pedidos_status ON pedidos(status)")
                 cur.execute("CREATE INDEX IF NOT EXISTS idx_orcamentos_cliente ON orcamentos(cliente_id)")
                 cur.execute("CREATE INDEX IF NOT EXISTS idx_pedidos_cliente ON pedidos(cliente_id)")
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_eventos_processado ON producao_eventos(processado)")
+                # séries mensais do dashboard (data_access.serie_mensal)
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_pedidos_created ON pedidos(created_at)")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_orcamentos_created ON orcamentos(created_at)")
+                # fila: índice parcial só com os pendentes (o booleano puro não ajuda)
+                cur.execute("DROP INDEX IF EXISTS idx_eventos_processado")
+                cur.execute("DROP INDEX IF EXISTS idx_eventos_pendentes")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_eventos_fila ON producao_eventos(id) WHERE processado = FALSE AND descartado = FALSE")
                 cur.execute("CREATE INDEX IF NOT EXISTS idx_eventos_pedido ON producao_eventos(pedido_id)")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_etapas_pedido ON producao_etapas(pedido_id)")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_pedidos_responsavel ON pedidos(responsavel_id)")
+                # carga/capacidade por responsável (data_access.carga_por_responsavel, vazao_semanal)
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_pedido_itens_pedido ON pedido_itens(pedido_id)")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_etapas_abertas ON producao_etapas(pedido_id) WHERE fim_em IS NULL")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_etapas_fim ON producao_etapas(fim_em) WHERE fim_em IS NOT NULL")
+                # histórico antigo pode ter mais de um intervalo aberto por pedido: fecha cada um no início do seguinte
+                # (só mexe em pedidos com mais de um aberto, então depois da primeira vez não faz nada)
+                cur.execute("""
+                    UPDATE producao_etapas e
+                    SET fim_em = s.prox
+                    FROM (
+                        SELECT id, created_at, fim_em,
+                               LEAD(inicio_em) OVER (PARTITION BY pedido_id ORDER BY inicio_em, id) AS prox
+                        FROM producao_etapas
+                        WHERE pedido_id IN (
+                            SELECT pedido_id FROM producao_etapas WHERE fim_em IS NULL GROUP BY pedido_id HAVING COUNT(*) > 1
+                        )
+                    ) s
+                    WHERE e.id = s.id AND e.created_at = s.created_at
+                      AND e.fim_em IS NULL AND s.prox IS NOT NULL
+                """)
+                # necessidade de materiais por janela de entrega (materiais.necessidades)
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_pedidos_entrega ON pedidos(data_entrega_prevista)")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_composicoes_item ON composicoes(lower(item))")
+                # uma descrição por produto; text_pattern_ops atende também LIKE 'prefixo%'
+                cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_produtos_descricao ON produtos(lower(descricao) text_pattern_ops)")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_produtos_codigo ON produtos(codigo text_pattern_ops)")
+                cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_orcamento_pdfs_atual ON orcamento_pdfs(orcamento_id) WHERE tipo = 'atual'")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_orcamento_pdfs_orcamento ON orcamento_pdfs(orcamento_id, created_at)")
+                # fila da outbox: o que ainda vai ser enviado (descartado = esgotou as tentativas)
+                cur.execute("ALTER TABLE notificacoes_outbox ADD COLUMN IF NOT EXISTS descartado BOOLEAN NOT NULL DEFAULT FALSE")
+                cur.execute("DROP INDEX IF EXISTS idx_outbox_pendentes")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_fila ON notificacoes_outbox(destinatario, id) WHERE enviado = FALSE AND descartado = FALSE")
+
+                # Busca textual (ILIKE '%termo%'): trigram quando o pg_trgm estiver disponível
+                if _exec_opcional(cur, "CREATE EXTENSION IF NOT EXISTS pg_trgm"):
+                    for idx, tabela, coluna in [
+                        ("idx_pedidos_codigo_trgm", "pedidos", "codigo"),
+                        ("idx_clientes_nome_trgm", "clientes", "nome"),
+                        ("idx_funcionarios_nome_trgm", "funcionarios", "nome"),
+                        ("idx_produtos_descricao_trgm", "produtos", "descricao"),
+                    ]:
+                        _exec_opcional(cur, f"CREATE INDEX IF NOT EXISTS {idx} ON {tabela} USING gin ({coluna} gin_trgm_ops)")
 
                 # =========================
                 # Admin default
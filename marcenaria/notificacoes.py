@@ -0,0 +1,328 @@
+# Notificações por e-mail (SMTP ou Brevo) com outbox no banco.
+#
+# A UI só grava na tabela notificacoes_outbox (um INSERT) e agenda o envio
+# para daqui a MAIL_DEBOUNCE_S segundos numa thread; o rerun do Streamlit não
+# espera o SMTP. Notificações que chegam enquanto o envio está agendado pegam
+# carona nele: o envio junta os pendentes por destinatário num resumo e usa
+# uma conexão SMTP por lote. Linha que falha max_tentativas vezes é marcada
+# `descartado` e sai da fila.
+#
+#   python -m marcenaria.notificacoes                # envia os pendentes e sai
+#   python -m marcenaria.notificacoes --reenviar     (devolve à fila os descartados)
+import logging
+import smtplib
+import threading
+from email.message import EmailMessage
+
+import requests
+from psycopg2.extras import RealDictCursor
+
+from .db_connector import get_db_connection
+from .config import get_email_config, get_brevo_config
+
+log = logging.getLogger("marcenaria.notificacoes")
+
+TIPO_ETAPA = "mudanca_etapa"
+TIPO_NOVO_PEDIDO = "novo_pedido"
+
+_RESUMO_TITULO = {
+    TIPO_ETAPA: "{n} pedido(s) mudaram de etapa",
+    TIPO_NOVO_PEDIDO: "{n} novo(s) pedido(s)",
+}
+
+_agendado = None
+_agendado_lock = threading.Lock()
+
+
+# =========================
+# TRANSPORTES
+# =========================
+# Contrato: enviar_lote([(destinatario, assunto, corpo), ...]) -> [None | "erro", ...],
+# um resultado por mensagem mesmo quando o lote para no meio. Exceção só se
+# nada foi enviado (ex.: falha ao conectar).
+class SmtpTransporte:
+    def __init__(self, cfg=None):
+        self.cfg = cfg or get_email_config()
+
+    def enviar_lote(self, mensagens):
+        cfg = self.cfg
+        remetente = cfg["from"] or cfg["user"]
+        out = []
+        # uma conexão (e um login) para o lote inteiro
+        s = smtplib.SMTP(cfg["host"], cfg["port"], timeout=cfg["timeout"])
+        try:
+            if cfg["starttls"]:
+                s.starttls()
+            if cfg["user"]:
+                s.login(cfg["user"], cfg["password"])
+            for dest, assunto, corpo in mensagens:
+                msg = EmailMessage()
+                msg["From"] = remetente
+                msg["To"] = dest
+                msg["Subject"] = assunto
+                msg.set_content(corpo)
+                try:
+                    s.send_message(msg)
+                    out.append(None)
+                except OSError as e:
+                    # SMTPException é OSError; as outras (timeout, conexão caiu) derrubam a conexão
+                    out.append(f"{e.__class__.__name__}: {e}")
+                    if not isinstance(e, smtplib.SMTPException) or isinstance(e, smtplib.SMTPServerDisconnected):
+                        out += [f"não enviado: {out[-1]}"] * (len(mensagens) - len(out))
+                        break
+        finally:
+            try:
+                s.quit()
+            except OSError:
+                s.close()
+        return out
+
+
+class BrevoTransporte:
+    URL = "https://api.brevo.com/v3/smtp/email"
+
+    def __init__(self, cfg=None):
+        self.cfg = cfg or get_brevo_config()
+
+    def enviar_lote(self, mensagens):
+        cfg = self.cfg
+        out = []
+        with requests.Session() as sessao:
+            sessao.headers.update({"api-key": cfg["api_key"], "accept": "application/json"})
+            for dest, assunto, corpo in mensagens:
+                try:
+                    r = sessao.post(
+                        self.URL,
+                        json={
+                            "sender": {"email": cfg["sender_email"], "name": cfg["sender_name"]},
+                            "to": [{"email": dest}],
+                            "subject": assunto,
+                            "textContent": corpo,
+                        },
+                        timeout=cfg["timeout"],
+                    )
+                    out.append(None if r.status_code < 300 else f"HTTP {r.status_code}: {r.text[:200]}")
+                except requests.RequestException as e:
+                    out.append(f"{e.__class__.__name__}: {e}")
+        return out
+
+
+def transporte_padrao():
+    if get_email_config()["transport"] == "brevo":
+        return BrevoTransporte()
+    return SmtpTransporte()
+
+
+# =========================
+# ENFILEIRAR (chamado pela UI)
+# =========================
+def enfileirar(tipo: str, assunto: str, corpo: str, pedido_id=None, destinatarios=None) -> int:
+    return enfileirar_varios([(tipo, assunto, corpo, pedido_id)], destinatarios)
+
+
+def enfileirar_varios(mensagens: list, destinatarios=None) -> int:
+    """
+    Grava várias notificações (tipo, assunto, corpo, pedido_id) para cada destinatário
+    num INSERT só. Retorna quantas linhas entraram na outbox.
+    """
+    cfg = get_email_config()
+    if destinatarios is None:
+        destinatarios = cfg["to"] + cfg["cc"] + cfg["bcc"]
+    destinatarios = [d for d in dict.fromkeys(destinatarios or []) if d]
+    mensagens = list(mensagens or [])
+    if not destinatarios or not mensagens:
+        return 0
+
+    tipos, assuntos, corpos, pedidos = (list(c) for c in zip(*mensagens))
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO bd_marcenaria.notificacoes_outbox (destinatario, tipo, assunto, corpo, pedido_id)
+                SELECT d, m.tipo, m.assunto, m.corpo, m.pedido_id
+                FROM unnest(%s::text[], %s::text[], %s::text[], %s::int[]) AS m(tipo, assunto, corpo, pedido_id)
+                CROSS JOIN unnest(%s::text[]) AS d
+            """, (tipos, assuntos, corpos, pedidos, destinatarios))
+            n = cur.rowcount
+            conn.commit()
+    return n
+
+
+def disparar_envio(atraso_s=None):
+    """
+    Agenda o envio dos pendentes para daqui a `atraso_s` (padrão MAIL_DEBOUNCE_S)
+    e volta na hora. Se já houver um envio agendado, não agenda outro.
+    """
+    global _agendado
+    atraso = get_email_config()["debounce_s"] if atraso_s is None else atraso_s
+    with _agendado_lock:
+        if _agendado is not None and _agendado.is_alive():
+            return
+        _agendado = threading.Timer(max(0, atraso), _enviar_em_segundo_plano)
+        _agendado.daemon = True
+        _agendado.start()
+
+
+def _enviar_em_segundo_plano():
+    try:
+        # o que entrou durante o envio fica para o próximo agendamento
+        while enviar_pendentes():
+            pass
+    except Exception:
+        log.exception("falha ao enviar notificações")
+
+
+def notificar_mudanca_etapa(pedido_id: int, codigo: str, cliente: str, etapa: str, status: str):
+    return notificar_mudancas_etapa([(pedido_id, codigo, cliente)], etapa, status)
+
+
+def notificar_mudancas_etapa(pedidos: list, etapa: str, status: str):
+    """Mesma notificação de notificar_mudanca_etapa para vários (pedido_id, codigo, cliente) de uma vez."""
+    if not get_email_config()["enabled_etapa"]:
+        return 0
+    n = enfileirar_varios([
+        (TIPO_ETAPA, f"Pedido {codigo} em {etapa}", f"{codigo} • {cliente}: {etapa} ({status})", pedido_id)
+        for pedido_id, codigo, cliente in pedidos
+    ])
+    if n:
+        disparar_envio()
+    return n
+
+
+def notificar_novo_pedido(pedido_id: int, codigo: str, cliente: str):
+    if not get_email_config()["enabled_new"]:
+        return 0
+    n = enfileirar(
+        TIPO_NOVO_PEDIDO,
+        f"Novo pedido {codigo}",
+        f"{codigo} • {cliente}",
+        pedido_id=pedido_id,
+    )
+    if n:
+        disparar_envio()
+    return n
+
+
+# =========================
+# ENVIO (resumo por destinatário)
+# =========================
+def _resumo(linhas: list[dict]):
+    if len(linhas) == 1:
+        return linhas[0]["assunto"], linhas[0]["corpo"]
+
+    prefixo = get_email_config()["subject_prefix"]
+    por_tipo = {}
+    for r in linhas:
+        por_tipo.setdefault(r["tipo"], []).append(r)
+
+    titulos, blocos = [], []
+    for tipo, itens in por_tipo.items():
+        titulo = _RESUMO_TITULO.get(tipo, "{n} notificação(ões)").format(n=len(itens))
+        titulos.append(titulo)
+        blocos.append(titulo + ":\n" + "\n".join(f"- {r['corpo']}" for r in itens))
+
+    return f"{prefixo}: " + " • ".join(titulos), "\n\n".join(blocos)
+
+
+def enviar_pendentes(transporte=None, max_tentativas: int = 5, limite: int = 500) -> int:
+    """
+    Reserva os pendentes (SKIP LOCKED), manda um e-mail de resumo por destinatário
+    e marca o resultado: enviado, ou mais uma tentativa (descartado ao chegar em
+    `max_tentativas`). Retorna quantas linhas da outbox foram enviadas.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # linhas que já esgotaram as tentativas (de antes do descartado, ou com limite menor agora)
+            cur.execute("""
+                UPDATE bd_marcenaria.notificacoes_outbox
+                SET descartado=TRUE
+                WHERE enviado = FALSE AND descartado = FALSE AND COALESCE(tentativas, 0) >= %s
+            """, (max_tentativas,))
+            cur.execute("""
+                SELECT id, destinatario, tipo, assunto, corpo
+                FROM bd_marcenaria.notificacoes_outbox
+                WHERE enviado = FALSE AND descartado = FALSE
+                ORDER BY destinatario, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (limite,))
+            rows = cur.fetchall() or []
+            if not rows:
+                conn.commit()
+                return 0
+
+            por_dest = {}
+            for r in rows:
+                por_dest.setdefault(r["destinatario"], []).append(r)
+
+            mensagens, grupos = [], []
+            for dest, linhas in por_dest.items():
+                assunto, corpo = _resumo(linhas)
+                mensagens.append((dest, assunto, corpo))
+                grupos.append([r["id"] for r in linhas])
+
+            transporte = transporte or transporte_padrao()
+            try:
+                resultados = transporte.enviar_lote(mensagens)
+            except Exception as e:
+                resultados = [f"{e.__class__.__name__}: {e}"] * len(mensagens)
+            # transporte que devolve menos resultados que mensagens: o que faltou não foi enviado
+            resultados = list(resultados) + ["sem resultado do transporte"] * (len(mensagens) - len(resultados))
+
+            ok_ids, erro_ids, erro_msgs = [], [], []
+            for ids, erro in zip(grupos, resultados):
+                if erro is None:
+                    ok_ids += ids
+                else:
+                    erro_ids += ids
+                    erro_msgs += [str(erro)[:500]] * len(ids)
+
+            if ok_ids:
+                cur.execute("""
+                    UPDATE bd_marcenaria.notificacoes_outbox
+                    SET enviado=TRUE, tentativas=COALESCE(tentativas, 0) + 1, enviado_em=CURRENT_TIMESTAMP, ultimo_erro=''
+                    WHERE id = ANY(%s)
+                """, (ok_ids,))
+            if erro_ids:
+                cur.execute("""
+                    UPDATE bd_marcenaria.notificacoes_outbox o
+                    SET tentativas=COALESCE(o.tentativas, 0) + 1, ultimo_erro=v.erro,
+                        descartado=(COALESCE(o.tentativas, 0) + 1 >= %s)
+                    FROM unnest(%s::int[], %s::text[]) AS v(id, erro)
+                    WHERE o.id = v.id
+                    RETURNING o.id, o.descartado
+                """, (max_tentativas, erro_ids, erro_msgs))
+                descartados = [r["id"] for r in cur.fetchall() if r["descartado"]]
+                if descartados:
+                    log.warning("notificações descartadas após %s tentativas: %s", max_tentativas, descartados)
+            conn.commit()
+            log.info("notificações: %s enviadas em %s e-mail(s), %s com erro", len(ok_ids), len(mensagens), len(erro_ids))
+            return len(ok_ids)
+
+
+def reenviar_descartados(ids=None) -> int:
+    """Devolve à fila as notificações descartadas (todas ou só `ids`), com as tentativas zeradas."""
+    ids = None if ids is None else [int(i) for i in ids]
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE bd_marcenaria.notificacoes_outbox
+                SET descartado=FALSE, tentativas=0
+                WHERE descartado AND enviado = FALSE
+                  AND (%s::int[] IS NULL OR id = ANY(%s::int[]))
+            """, (ids, ids))
+            n = cur.rowcount
+            conn.commit()
+            return n
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Envia as notificações pendentes da outbox.")
+    ap.add_argument("--reenviar", action="store_true", help="devolve as notificações descartadas à fila e sai")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.reenviar:
+        log.info("%s notificação(ões) devolvidas à fila", reenviar_descartados())
+    else:
+        enviar_pendentes()
@@ -0,0 +1,355 @@
+# PDF do orçamento (reportlab).
+#
+# `renderizar_pdf` é uma função pura (dados -> bytes) no nível do módulo, então
+# pode rodar em outro processo. O modo em lote busca os orçamentos e itens em
+# duas consultas e renderiza em paralelo num ProcessPoolExecutor, gravando
+# cada PDF no ZIP assim que fica pronto.
+#
+# Os PDFs ficam guardados em orcamento_pdfs com o hash do conteúdo: o download
+# serve o arquivo salvo e só renderiza de novo quando o orçamento mudou. A
+# regravação roda em segundo plano depois de salvar itens ou status.
+#
+#   python -m marcenaria.pdf_orcamento      # mede PDFs/s com 1..N processos
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from urllib.request import urlopen
+
+from psycopg2.extras import RealDictCursor
+
+from .config import LOGO_URL
+from .db_connector import get_db_connection
+from .formatacao import brl, safe_float
+
+log = logging.getLogger("marcenaria.pdf_orcamento")
+
+TIPO_ATUAL = "atual"
+TIPO_ENVIADO = "enviado"
+
+# abaixo disso o custo de subir os processos não compensa
+MIN_POR_PROCESSO = 4
+
+_logo_cache = {}
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf_orcamento")
+
+
+def _try_fetch_bytes(url: str, timeout: int = 10):
+    try:
+        with urlopen(url, timeout=timeout) as r:
+            return r.read()
+    except Exception:
+        return None
+
+
+def carregar_logo():
+    # uma busca por processo (antes era uma por PDF)
+    if "logo" not in _logo_cache:
+        _logo_cache["logo"] = _try_fetch_bytes(LOGO_URL, timeout=10)
+    return _logo_cache["logo"]
+
+
+# =========================
+# RENDER
+# =========================
+def renderizar_pdf(orc: dict, itens: list, logo_bytes=None) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import mm
+    from reportlab.lib.utils import ImageReader
+
+    itens = itens or []
+    total = 0.0
+    for r in itens:
+        total += safe_float(r.get("qtd"), 0) * safe_float(r.get("valor_unit"), 0)
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    w, h = A4
+
+    c.setFillColorRGB(0.95, 0.95, 0.98)
+    c.rect(0, h - 42 * mm, w, 42 * mm, stroke=0, fill=1)
+
+    if logo_bytes:
+        try:
+            img = ImageReader(io.BytesIO(logo_bytes))
+            c.drawImage(img, 14 * mm, h - 34 * mm, width=28 * mm, height=28 * mm, mask="auto")
+        except Exception:
+            pass
+
+    c.setFillColorRGB(0.06, 0.09, 0.16)
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(46 * mm, h - 18 * mm, "ORÇAMENTO")
+    c.setFont("Helvetica", 10)
+    c.setFillColorRGB(0.25, 0.32, 0.42)
+    c.drawString(46 * mm, h - 26 * mm, f"Código: {orc.get('codigo', '-')}")
+    c.drawString(46 * mm, h - 32 * mm, f"Status: {orc.get('status', '-')}")
+    c.drawRightString(w - 14 * mm, h - 18 * mm, f"Cliente: {orc.get('cliente_nome','-')}")
+
+    y = h - 55 * mm
+    c.setFillColorRGB(0.08, 0.10, 0.14)
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(14 * mm, y, "Itens")
+    y -= 7 * mm
+
+    c.setFillColorRGB(0.95, 0.95, 0.96)
+    c.rect(14 * mm, y - 5 * mm, w - 28 * mm, 8 * mm, stroke=0, fill=1)
+    c.setFillColorRGB(0.08, 0.10, 0.14)
+    c.setFont("Helvetica-Bold", 9)
+    c.drawString(16 * mm, y, "Descrição")
+    c.drawRightString(w - 70 * mm, y, "Qtd")
+    c.drawRightString(w - 48 * mm, y, "Unid")
+    c.drawRightString(w - 14 * mm, y, "Vlr Unit")
+    y -= 8 * mm
+
+    c.setFont("Helvetica", 9)
+
+    if not itens:
+        c.drawString(16 * mm, y, "Sem itens cadastrados.")
+        y -= 6 * mm
+    else:
+        for r in itens:
+            if y < 25 * mm:
+                c.showPage()
+                y = h - 20 * mm
+                c.setFont("Helvetica", 9)
+            c.drawString(16 * mm, y, str(r.get("descricao") or "")[:70])
+            c.drawRightString(w - 70 * mm, y, str(r.get("qtd") or 0))
+            c.drawRightString(w - 48 * mm, y, str(r.get("unidade") or "")[:8])
+            c.drawRightString(w - 14 * mm, y, brl(r.get("valor_unit") or 0))
+            y -= 6 * mm
+
+    y -= 4 * mm
+    c.setFillColorRGB(0.91, 0.76, 0.31)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawRightString(w - 14 * mm, y, f"Total estimado: {brl(total)}")
+
+    c.setFillColorRGB(0.35, 0.42, 0.52)
+    c.setFont("Helvetica", 8)
+    c.drawString(14 * mm, 12 * mm, "Mamede Móveis Projetados. Orçamento gerado pelo sistema interno.")
+
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def gerar_pdf_orcamento_bytes(orcamento_id: int) -> bytes:
+    res = obter_pdf_orcamento(int(orcamento_id))
+    if not res:
+        raise ValueError("Orçamento não encontrado.")
+    return res[1]
+
+
+# =========================
+# ARTEFATOS (orcamento_pdfs)
+# =========================
+def hash_conteudo(orc: dict, itens: list) -> str:
+    # só o que aparece no PDF: mudou outra coisa, o arquivo salvo continua valendo
+    partes = [str(orc.get(k) or "") for k in ("codigo", "status", "cliente_nome")]
+    for r in itens or []:
+        partes += [str(r.get(k) or "") for k in ("descricao", "qtd", "unidade", "valor_unit")]
+    return hashlib.sha256("\x1f".join(partes).encode("utf-8")).hexdigest()
+
+
+def _atual_salvo(cur, orcamento_id: int, com_pdf: bool):
+    cur.execute(f"""
+        SELECT hash_conteudo{', pdf' if com_pdf else ''}
+        FROM bd_marcenaria.orcamento_pdfs
+        WHERE orcamento_id=%s AND tipo=%s
+    """, (orcamento_id, TIPO_ATUAL))
+    return cur.fetchone()
+
+
+def _gravar_atual(cur, orcamento_id: int, h: str, pdf: bytes):
+    cur.execute("""
+        INSERT INTO bd_marcenaria.orcamento_pdfs (orcamento_id, tipo, hash_conteudo, pdf, tamanho)
+        VALUES (%s,%s,%s,%s,%s)
+        ON CONFLICT (orcamento_id) WHERE tipo = 'atual'
+        DO UPDATE SET hash_conteudo=EXCLUDED.hash_conteudo, pdf=EXCLUDED.pdf,
+                      tamanho=EXCLUDED.tamanho, created_at=CURRENT_TIMESTAMP
+    """, (orcamento_id, TIPO_ATUAL, h, pdf, len(pdf)))
+
+
+def obter_pdf_orcamento(orcamento_id: int, com_pdf: bool = True):
+    """
+    (hash, pdf) do orçamento, sempre em dia com os dados: usa o salvo quando
+    o hash bate e, se não, renderiza e regrava. Com `com_pdf=False`, o pdf vem
+    como None quando o salvo já está em dia. None se o orçamento não existe.
+    """
+    from . import data_access as da
+
+    dados = da.carregar_orcamentos_com_itens([orcamento_id])
+    if not dados:
+        return None
+    orc, itens = dados[0]
+    h = hash_conteudo(orc, itens)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            salvo = _atual_salvo(cur, orc["id"], com_pdf)
+            if salvo and salvo[0] == h:
+                return h, (bytes(salvo[1]) if com_pdf else None)
+
+            pdf = renderizar_pdf(orc, itens, carregar_logo())
+            _gravar_atual(cur, orc["id"], h, pdf)
+            conn.commit()
+            return h, pdf
+
+
+def agendar_atualizacao(orcamento_id: int):
+    """Regrava o PDF salvo em segundo plano (volta na hora)."""
+    _executor.submit(_atualizar_em_segundo_plano, int(orcamento_id))
+
+
+def _atualizar_em_segundo_plano(orcamento_id: int):
+    try:
+        obter_pdf_orcamento(orcamento_id, com_pdf=False)
+    except Exception:
+        log.exception("falha ao atualizar o PDF do orçamento %s", orcamento_id)
+
+
+def registrar_envio(orcamento_id: int):
+    """
+    Guarda como 'enviado' uma cópia do PDF atual (sem renderizar se ele já
+    estiver em dia). Retorna (ok, msg).
+    """
+    res = obter_pdf_orcamento(orcamento_id, com_pdf=False)
+    if not res:
+        return False, "Orçamento não encontrado."
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO bd_marcenaria.orcamento_pdfs (orcamento_id, tipo, hash_conteudo, pdf, tamanho)
+                SELECT orcamento_id, %s, hash_conteudo, pdf, tamanho
+                FROM bd_marcenaria.orcamento_pdfs
+                WHERE orcamento_id=%s AND tipo=%s
+                RETURNING id
+            """, (TIPO_ENVIADO, orcamento_id, TIPO_ATUAL))
+            if not cur.fetchone():
+                conn.rollback()
+                return False, "PDF atual não encontrado."
+            conn.commit()
+    return True, "PDF enviado registrado."
+
+
+def listar_envios(orcamento_id: int):
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT id, hash_conteudo, tamanho, created_at
+                FROM bd_marcenaria.orcamento_pdfs
+                WHERE orcamento_id=%s AND tipo=%s
+                ORDER BY created_at DESC
+            """, (orcamento_id, TIPO_ENVIADO))
+            return cur.fetchall() or []
+
+
+def obter_pdf_salvo(artefato_id: int):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pdf FROM bd_marcenaria.orcamento_pdfs WHERE id=%s", (artefato_id,))
+            r = cur.fetchone()
+            return bytes(r[0]) if r else None
+
+
+# =========================
+# LOTE
+# =========================
+def _iniciar_processo(logo_bytes):
+    # cada processo recebe o logo uma vez, não a cada PDF
+    _logo_cache["logo"] = logo_bytes
+
+
+def _renderizar_tarefa(tarefa):
+    nome, orc, itens = tarefa
+    return nome, renderizar_pdf(orc, itens, _logo_cache.get("logo"))
+
+
+def _renderizar_lote(tarefas: list) -> list:
+    return [_renderizar_tarefa(t) for t in tarefas]
+
+
+def _nome_arquivo(orc: dict) -> str:
+    return f"orcamento_{orc.get('codigo') or orc.get('id')}.pdf"
+
+
+def _renderizar_varios(tarefas: list, logo_bytes, processos=None):
+    """Gera (nome, pdf) na ordem em que ficam prontos (ou em série, se não compensar)."""
+    processos = processos or os.cpu_count() or 1
+    processos = max(1, min(processos, len(tarefas) // MIN_POR_PROCESSO or 1))
+    if processos == 1:
+        _iniciar_processo(logo_bytes)
+        for t in tarefas:
+            yield _renderizar_tarefa(t)
+        return
+
+    # spawn: o Streamlit tem threads rodando, e fork com threads pode travar
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processos, mp_context=ctx, initializer=_iniciar_processo, initargs=(logo_bytes,)) as ex:
+        # lotes pequenos (4 por processo) para o IPC não pesar; cada lote sai assim que fica pronto
+        tamanho = max(1, len(tarefas) // (processos * 4))
+        futuros = [ex.submit(_renderizar_lote, tarefas[i:i + tamanho]) for i in range(0, len(tarefas), tamanho)]
+        for f in as_completed(futuros):
+            yield from f.result()
+
+
+def gerar_zip_orcamentos(orcamento_ids: list, destino, processos=None, progresso=None) -> int:
+    """
+    Grava em `destino` (caminho ou arquivo binário) um ZIP com o PDF de cada
+    orçamento. `progresso(feitos, total)` é chamado a cada PDF. Retorna quantos PDFs.
+    """
+    from . import data_access as da
+
+    dados = da.carregar_orcamentos_com_itens(orcamento_ids)
+    tarefas = [(_nome_arquivo(orc), orc, itens) for orc, itens in dados]
+    total = len(tarefas)
+
+    feitos = 0
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for nome, pdf in _renderizar_varios(tarefas, carregar_logo(), processos):
+            zf.writestr(nome, pdf)
+            feitos += 1
+            if progresso:
+                progresso(feitos, total)
+    return feitos
+
+
+# =========================
+# MEDIÇÃO (python -m marcenaria.pdf_orcamento)
+# =========================
+def _medir(n_orcamentos: int = 200, itens_por_orcamento: int = 25):
+    tarefas = [
+        (
+            f"orcamento_ORC26-{i:06d}.pdf",
+            {"id": i, "codigo": f"ORC26-{i:06d}", "status": "Aprovado", "cliente_nome": f"Cliente {i}"},
+            [
+                {"descricao": f"Módulo {j} em MDF 18mm", "qtd": 1 + j % 3, "unidade": "Unid.", "valor_unit": 150.0 + j}
+                for j in range(itens_por_orcamento)
+            ],
+        )
+        for i in range(n_orcamentos)
+    ]
+    logo = carregar_logo()
+
+    n = 1
+    cpus = os.cpu_count() or 1
+    while True:
+        t0 = time.perf_counter()
+        with zipfile.ZipFile(io.BytesIO(), "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for nome, pdf in _renderizar_varios(tarefas, logo, processos=n):
+                zf.writestr(nome, pdf)
+        dt = time.perf_counter() - t0
+        print(f"{n:>2} processo(s): {n_orcamentos / dt:7.1f} PDFs/s ({dt:.2f}s)")
+        if n >= cpus:
+            break
+        n = min(n * 2, cpus)
+
+
+if __name__ == "__main__":
+    _medir()
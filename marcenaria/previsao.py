@@ -0,0 +1,165 @@
+# Previsão de entrega dos pedidos em aberto (Monte Carlo sobre o histórico).
+#
+# Para cada pedido: o que falta da etapa atual (sorteado entre as durações
+# históricas maiores que o tempo já gasto nela, menos esse tempo) + uma duração
+# sorteada para cada etapa seguinte de ETAPAS_PRODUCAO que os pedidos de fato
+# percorrem (fora do Kanban ou sem histórico não entra). Tudo numa matriz
+# pedidos × simulações, um passo por etapa; não há laço por pedido.
+#
+#   python -m marcenaria.previsao        (lista os pedidos com maior risco)
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .config import ETAPAS_KANBAN_EXCLUIR, ETAPAS_PRODUCAO, FORTALEZA_TZ
+from .data_access import fetch_dataframe
+from . import analytics
+
+SIMULACOES = 2000
+
+COLUNAS = ["dias_p50", "dias_p90", "data_p50", "data_p90", "prob_atraso"]
+
+
+def pedidos_abertos(ids: list[int] | None = None) -> pd.DataFrame:
+    """
+    Pedidos ainda não entregues/cancelados, com a etapa atual e há quantos dias
+    estão nela (desde a primeira linha da visita atual, não da última troca de
+    status). `ids` restringe a esses pedidos (os que não estão mais em aberto somem).
+    """
+    return fetch_dataframe("""
+        SELECT
+            p.id,
+            p.codigo,
+            p.responsavel_id,
+            p.etapa_atual,
+            p.status_etapa,
+            p.data_entrega_prevista,
+            GREATEST(0, EXTRACT(EPOCH FROM (now() - e.inicio)) / 86400.0) AS dias_na_etapa
+        FROM bd_marcenaria.pedidos p
+        LEFT JOIN LATERAL (
+            -- linhas da etapa atual depois da última linha de outra etapa
+            SELECT MIN(COALESCE(e.inicio_em, e.created_at)) AS inicio
+            FROM bd_marcenaria.producao_etapas e
+            WHERE e.pedido_id = p.id
+              AND e.etapa = p.etapa_atual
+              AND COALESCE(e.inicio_em, e.created_at) > COALESCE((
+                  SELECT MAX(COALESCE(o.inicio_em, o.created_at))
+                  FROM bd_marcenaria.producao_etapas o
+                  WHERE o.pedido_id = p.id AND o.etapa <> p.etapa_atual
+              ), '-infinity')
+        ) e ON TRUE
+        WHERE COALESCE(p.status, '') NOT IN ('Entregue', 'Cancelado')
+          AND NOT (p.etapa_atual = %(ultima)s AND p.status_etapa = 'Concluído')
+          AND (%(ids)s::int[] IS NULL OR p.id = ANY(%(ids)s::int[]))
+        ORDER BY p.id
+    """, {"ultima": ETAPAS_PRODUCAO[-1], "ids": None if ids is None else [int(i) for i in ids]})
+
+
+def percorre(etapa: str, duracoes: dict) -> bool:
+    """
+    Se um pedido que ainda não chegou em `etapa` vai passar por ela: está no
+    Kanban (fora de ETAPAS_KANBAN_EXCLUIR) e tem histórico em `duracoes`
+    ({etapa: amostras ou mediana}).
+    """
+    return etapa not in ETAPAS_KANBAN_EXCLUIR and duracoes.get(etapa) is not None and np.size(duracoes[etapa]) > 0
+
+
+def etapas_restantes(etapa_atual, concluida: bool, duracoes: dict) -> list[str]:
+    """
+    Etapas que o pedido ainda percorre: a atual (se não concluída e no Kanban,
+    mesmo sem histórico) e as seguintes em que percorre() é verdadeiro. A mesma
+    regra vale para a previsão, a agenda e o Gantt.
+    """
+    k = ETAPAS_PRODUCAO.index(etapa_atual) if etapa_atual in ETAPAS_PRODUCAO else 0
+    atual = [] if concluida or ETAPAS_PRODUCAO[k] in ETAPAS_KANBAN_EXCLUIR else [ETAPAS_PRODUCAO[k]]
+    return atual + [e for e in ETAPAS_PRODUCAO[k + 1:] if percorre(e, duracoes)]
+
+
+def _residual(amostras: np.ndarray, gasto: np.ndarray, u: np.ndarray) -> np.ndarray:
+    """
+    Quanto ainda falta de uma etapa em que o pedido já está há `gasto` dias:
+    sorteia só entre as durações históricas maiores que `gasto`. Se já passou
+    de todas, o histórico não diz nada; assume até uma mediana a mais.
+    """
+    m = len(amostras)
+    ini = np.searchsorted(amostras, gasto, side="right")[:, None]
+    restam = m - ini
+    pos = np.minimum(ini + (u * restam).astype(np.int64), m - 1)
+    return np.where(restam > 0, amostras[pos] - gasto[:, None], np.median(amostras) * u)
+
+
+def simular(abertos: pd.DataFrame, duracoes: dict, agora: datetime | None = None,
+            simulacoes: int = SIMULACOES, seed: int | None = None) -> pd.DataFrame:
+    """
+    `abertos` como em pedidos_abertos(); `duracoes` como em analytics.duracoes_fechadas().
+    Retorna um DataFrame indexado pelo id do pedido com COLUNAS.
+    As etapas que somam são as de etapas_restantes(); só a etapa atual sem
+    histórico usa as durações de todas as etapas juntas.
+    """
+    if abertos is None or abertos.empty or not duracoes:
+        return pd.DataFrame(columns=COLUNAS, index=pd.Index([], name="id"))
+
+    agora = agora or datetime.now(FORTALEZA_TZ)
+    rng = np.random.default_rng(seed)
+    todas = np.sort(np.concatenate(list(duracoes.values())))
+
+    n = len(abertos)
+    etapa_idx = abertos["etapa_atual"].map({e: i for i, e in enumerate(ETAPAS_PRODUCAO)}).fillna(0).to_numpy(dtype=np.int64)
+    gasto = abertos["dias_na_etapa"].fillna(0).to_numpy(dtype=float)
+    concluida = (abertos["status_etapa"] == "Concluído").to_numpy()
+
+    total = np.zeros((n, simulacoes))
+    for k, etapa in enumerate(ETAPAS_PRODUCAO):
+        if etapa in ETAPAS_KANBAN_EXCLUIR:
+            continue
+        amostras = duracoes.get(etapa)
+        if amostras is None or not len(amostras):
+            amostras = todas
+
+        # sem histórico: não soma para quem ainda vai chegar (ver percorre)
+        depois = (etapa_idx < k) & percorre(etapa, duracoes)
+        if depois.any():
+            total[depois] += rng.choice(amostras, size=(int(depois.sum()), simulacoes))
+
+        # etapa atual já concluída: só falta o Kanban mover; não soma nada
+        atual = (etapa_idx == k) & ~concluida
+        if atual.any():
+            u = rng.random((int(atual.sum()), simulacoes))
+            total[atual] += _residual(amostras, gasto[atual], u)
+
+    p50, p90 = np.percentile(total, [50, 90], axis=1)
+
+    # prazo = fim do dia da entrega prevista, em dias a partir de agora
+    entrega = pd.to_datetime(abertos["data_entrega_prevista"], errors="coerce")
+    fim_do_dia = (entrega + pd.Timedelta(days=1)).dt.tz_localize(FORTALEZA_TZ)
+    base = pd.Timestamp(agora)
+    prazo = ((fim_do_dia - base).dt.total_seconds() / 86400.0).to_numpy(dtype=float)
+    prob = (total > prazo[:, None]).mean(axis=1)
+    prob[np.isnan(prazo)] = np.nan
+
+    return pd.DataFrame(
+        {
+            "dias_p50": p50,
+            "dias_p90": p90,
+            "data_p50": (base + pd.to_timedelta(p50, unit="D")).date,
+            "data_p90": (base + pd.to_timedelta(p90, unit="D")).date,
+            "prob_atraso": prob,
+        },
+        index=pd.Index(abertos["id"].to_numpy(), name="id"),
+    )
+
+
+def prever_entregas(meses: int = 12, simulacoes: int = SIMULACOES, seed: int | None = None) -> pd.DataFrame:
+    """Previsão para todos os pedidos em aberto, com o histórico dos últimos `meses`."""
+    return simular(pedidos_abertos(), analytics.duracoes_fechadas(meses), simulacoes=simulacoes, seed=seed)
+
+
+if __name__ == "__main__":
+    import time
+
+    t = time.perf_counter()
+    prev = prever_entregas()
+    dt = time.perf_counter() - t
+    print(f"{len(prev)} pedido(s) em aberto, {SIMULACOES} simulações cada, {dt:.2f}s")
+    print(prev.sort_values("prob_atraso", ascending=False).head(20).to_string())
@@ -0,0 +1,299 @@
+# Rota do caminhão nos dias de Transporte/Montagem.
+#
+# Paradas = pedidos do dia (entrega prevista) nas etapas escolhidas, nas
+# coordenadas do cliente (clientes.latitude/longitude; sem geocodificação
+# online). Distância = haversine entre todos os pares de uma vez (matriz
+# numpy) × fator de estrada. A rota sai do vizinho mais próximo e é melhorada
+# com 2-opt: a cada passo, o ganho de inverter cada trecho i..j é calculado
+# para todos os pares numa matriz só e a melhor inversão é aplicada, até
+# nenhuma ajudar.
+#
+# Sem origem configurada (ROTA_ORIGEM_LAT/LON) a rota é aberta: um nó fictício
+# a distância zero de todos faz o papel da garagem, e ele sai do resultado.
+#
+#   python -m marcenaria.rotas 2025-06-10
+#   python -m marcenaria.rotas --aleatorio 50     (mede com paradas sorteadas)
+import argparse
+import csv
+import io
+import time
+from dataclasses import dataclass, field
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from .config import get_rotas_config
+from .data_access import fetch_dataframe
+
+ETAPAS_ROTA = ("Transporte", "Montagem")
+
+RAIO_TERRA_KM = 6371.0
+
+COLUNAS = ["ordem", "pedido_id", "codigo", "cliente", "endereco", "etapa", "latitude", "longitude", "km_trecho", "km_acumulado"]
+
+
+@dataclass
+class Rota:
+    paradas: pd.DataFrame
+    distancia_km: float
+    distancia_inicial_km: float
+    origem: tuple | None
+    sem_coordenadas: pd.DataFrame = field(default_factory=pd.DataFrame)
+    trocas: int = 0
+
+    @property
+    def horas_estimadas(self) -> float:
+        return self.distancia_km / (get_rotas_config()["velocidade_kmh"] or 40.0)
+
+
+# =========================
+# PARADAS
+# =========================
+def paradas_do_dia(dia: date, etapas=ETAPAS_ROTA, atrasados: bool = False) -> pd.DataFrame:
+    """
+    Pedidos em aberto nas `etapas` com entrega prevista em `dia` (ou antes, com
+    `atrasados`). Um cliente com dois pedidos no dia vira duas linhas na mesma coordenada.
+    """
+    return fetch_dataframe("""
+        SELECT
+            p.id AS pedido_id,
+            p.codigo,
+            COALESCE(NULLIF(c.fantasia, ''), c.nome, '') AS cliente,
+            COALESCE(c.endereco, '') AS endereco,
+            p.etapa_atual AS etapa,
+            c.latitude,
+            c.longitude
+        FROM bd_marcenaria.pedidos p
+        LEFT JOIN bd_marcenaria.clientes c ON c.id = p.cliente_id
+        WHERE COALESCE(p.status, '') NOT IN ('Entregue', 'Cancelado')
+          AND p.etapa_atual = ANY(%(etapas)s::text[])
+          AND (p.data_entrega_prevista = %(dia)s::date
+               OR (%(atrasados)s AND p.data_entrega_prevista < %(dia)s::date))
+        ORDER BY p.id
+    """, {"etapas": list(etapas), "dia": dia, "atrasados": bool(atrasados)})
+
+
+def ler_coordenada(texto) -> tuple | None:
+    """'-3.7319, -38.5267' (como o Google Maps copia) -> (lat, lon); inválido -> None."""
+    partes = str(texto or "").replace(";", ",").split(",")
+    if len(partes) == 4:
+        # vírgula decimal: "-3,7319, -38,5267"
+        partes = [f"{partes[0]}.{partes[1]}", f"{partes[2]}.{partes[3]}"]
+    if len(partes) != 2:
+        return None
+    try:
+        lat, lon = (float(p.strip()) for p in partes)
+    except ValueError:
+        return None
+    return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
+
+
+def ler_csv_coordenadas(conteudo: bytes) -> list[dict]:
+    """
+    CSV (';' ou ',') com latitude e longitude e uma coluna que identifica o
+    cliente: id, cpf_cnpj ou nome. Aceita vírgula decimal. Linhas inválidas
+    (inclusive id que não é número) são ignoradas.
+    """
+    texto = conteudo.decode("utf-8-sig", errors="replace")
+    try:
+        delimitador = csv.Sniffer().sniff(texto.splitlines()[0], delimiters=";,").delimiter
+    except (csv.Error, IndexError):
+        # arquivo vazio ou de uma coluna só: o Sniffer não decide
+        delimitador = ";"
+    out = []
+    for r in csv.DictReader(io.StringIO(texto), delimiter=delimitador):
+        r = {(k or "").strip().lower(): (v or "").strip() for k, v in r.items()}
+        try:
+            lat = float(r.get("latitude", r.get("lat", "")).replace(",", "."))
+            lon = float(r.get("longitude", r.get("lon", r.get("lng", ""))).replace(",", "."))
+        except ValueError:
+            continue
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            continue
+        if r.get("id") and not r["id"].isdigit():
+            continue
+        if r.get("id") or r.get("cpf_cnpj") or r.get("nome"):
+            out.append({"id": r.get("id") or None, "cpf_cnpj": r.get("cpf_cnpj"), "nome": r.get("nome"),
+                        "latitude": lat, "longitude": lon})
+    return out
+
+
+# =========================
+# OTIMIZAÇÃO
+# =========================
+def matriz_distancias(coords: np.ndarray, fator: float = 1.0) -> np.ndarray:
+    """Haversine (km) entre todos os pares de `coords` (n×2, graus), × `fator`."""
+    rad = np.radians(np.asarray(coords, dtype=float))
+    lat, lon = rad[:, 0], rad[:, 1]
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))) * fator
+
+
+def vizinho_mais_proximo(D: np.ndarray, inicio: int = 0) -> np.ndarray:
+    n = len(D)
+    rota = [inicio]
+    livre = np.ones(n, dtype=bool)
+    livre[inicio] = False
+    for _ in range(n - 1):
+        dist = np.where(livre, D[rota[-1]], np.inf)
+        prox = int(np.argmin(dist))
+        rota.append(prox)
+        livre[prox] = False
+    return np.array(rota, dtype=np.int64)
+
+
+def comprimento(rota: np.ndarray, D: np.ndarray) -> float:
+    """Comprimento do ciclo (volta ao primeiro nó)."""
+    return float(D[rota, np.roll(rota, -1)].sum())
+
+
+def dois_opt(rota: np.ndarray, D: np.ndarray, max_passos: int = 10000) -> tuple:
+    """
+    2-opt no ciclo `rota` (o nó rota[0] fica parado). Retorna (rota, trocas).
+    Trocar as arestas (a,b) e (c,d) por (a,c) e (b,d) = inverter o trecho b..c.
+    """
+    rota = rota.copy()
+    n = len(rota)
+    if n < 4:
+        return rota, 0
+    i_idx, j_idx = np.triu_indices(n, k=2)
+    # com i = 0 e j = n-1 as duas arestas se tocam no nó 0
+    manter = ~((i_idx == 0) & (j_idx == n - 1))
+    i_idx, j_idx = i_idx[manter], j_idx[manter]
+
+    trocas = 0
+    for _ in range(max_passos):
+        a, b = rota, np.roll(rota, -1)
+        ab = D[a, b]
+        ganho = D[a[i_idx], a[j_idx]] + D[b[i_idx], b[j_idx]] - ab[i_idx] - ab[j_idx]
+        k = int(np.argmin(ganho))
+        if ganho[k] > -1e-9:
+            break
+        i, j = i_idx[k], j_idx[k]
+        rota[i + 1:j + 1] = rota[i + 1:j + 1][::-1]
+        trocas += 1
+    return rota, trocas
+
+
+def otimizar(coords: np.ndarray, origem: tuple | None = None, voltar: bool = True,
+             fator: float = 1.0) -> tuple:
+    """
+    Ordem de visita das `coords` (n×2). Com `origem`, sai dela (e volta, se
+    `voltar`); sem, a rota é aberta. Retorna (ordem, km, km_inicial, trocas, D),
+    com ordem = índices de `coords` e D a matriz usada (origem no índice 0, se houver).
+    """
+    n = len(coords)
+    if n == 0:
+        return np.array([], dtype=np.int64), 0.0, 0.0, 0, np.zeros((0, 0))
+    pontos = np.asarray(coords, dtype=float)
+    if origem is not None:
+        pontos = np.vstack([np.asarray(origem, dtype=float)[None, :], pontos])
+    D = matriz_distancias(pontos, fator)
+
+    # nó 0 = garagem; sem volta (ou sem origem) chegar nela é de graça
+    aberta = origem is None or not voltar
+    G = D
+    if origem is None:
+        G = np.zeros((n + 1, n + 1))
+        G[1:, 1:] = D
+    elif aberta:
+        G = D.copy()
+        G[1:, 0] = 0.0
+
+    inicial = vizinho_mais_proximo(G, 0)
+    km_inicial = comprimento(inicial, G)
+    ciclo, trocas = dois_opt(inicial, G)
+    km = comprimento(ciclo, G)
+
+    # nó 0 fica parado no 2-opt, então o ciclo ainda começa nele
+    return ciclo[1:] - 1, km, km_inicial, trocas, D
+
+
+def rota_das_paradas(paradas: pd.DataFrame, origem=None, voltar=None, fator=None) -> Rota:
+    """Paradas sem coordenada ficam de fora (em `sem_coordenadas`). Parâmetros vazios vêm de get_rotas_config()."""
+    cfg = get_rotas_config()
+    origem = cfg["origem"] if origem is None else origem
+    voltar = cfg["voltar"] if voltar is None else voltar
+    fator = cfg["fator_estrada"] if fator is None else fator
+
+    tem = paradas["latitude"].notna() & paradas["longitude"].notna()
+    com, sem = paradas[tem].reset_index(drop=True), paradas[~tem].reset_index(drop=True)
+    coords = com[["latitude", "longitude"]].to_numpy(dtype=float)
+
+    ordem, km, km_inicial, trocas, D = otimizar(coords, origem, voltar, fator)
+
+    df = com.iloc[ordem].reset_index(drop=True)
+    desloc = 1 if origem is not None else 0
+    nos = ordem + desloc
+    if len(nos):
+        anterior = np.concatenate([[0], nos[:-1]]) if origem is not None else np.concatenate([[nos[0]], nos[:-1]])
+        trecho = D[anterior, nos]
+    else:
+        trecho = np.array([], dtype=float)
+    df.insert(0, "ordem", np.arange(1, len(df) + 1))
+    df["km_trecho"] = trecho
+    df["km_acumulado"] = np.cumsum(trecho)
+    return Rota(df[COLUNAS], km, km_inicial, origem, sem, trocas)
+
+
+def rota_do_dia(dia: date, etapas=ETAPAS_ROTA, atrasados: bool = False, **kw) -> Rota:
+    return rota_das_paradas(paradas_do_dia(dia, etapas, atrasados), **kw)
+
+
+def link_mapa(rota: Rota, max_paradas: int = 10) -> str | None:
+    """Link do Google Maps com as primeiras paradas na ordem (o site aceita poucas por link)."""
+    pts = [f"{lat:.6f},{lon:.6f}" for lat, lon in rota.paradas[["latitude", "longitude"]].to_numpy()[:max_paradas]]
+    if rota.origem is not None:
+        pts.insert(0, f"{rota.origem[0]:.6f},{rota.origem[1]:.6f}")
+    return "https://www.google.com/maps/dir/" + "/".join(pts) if len(pts) > 1 else None
+
+
+def imprimir(rota: Rota):
+    if rota.origem is not None:
+        print(f"  0. origem ({rota.origem[0]:.5f}, {rota.origem[1]:.5f})")
+    for r in rota.paradas.itertuples(index=False):
+        print(f"{r.ordem:>3}. {r.codigo or '-':<12} {str(r.cliente)[:30]:<30} {r.etapa or '':<10} "
+              f"+{r.km_trecho:6.1f} km  ({r.km_acumulado:6.1f} km)  {str(r.endereco)[:50]}")
+    volta = " com volta" if rota.origem is not None and get_rotas_config()["voltar"] else ""
+    print(f"total{volta}: {rota.distancia_km:.1f} km (vizinho mais próximo: {rota.distancia_inicial_km:.1f} km, "
+          f"{rota.trocas} troca(s) 2-opt) ≈ {rota.horas_estimadas:.1f} h rodando")
+    if len(rota.sem_coordenadas):
+        print(f"sem coordenadas ({len(rota.sem_coordenadas)}): " + ", ".join(str(c) for c in rota.sem_coordenadas["codigo"]))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m marcenaria.rotas", description="Rota de transporte/montagem do dia.")
+    ap.add_argument("dia", nargs="?", type=date.fromisoformat, default=date.today())
+    ap.add_argument("--etapas", default=",".join(ETAPAS_ROTA), help="separadas por vírgula")
+    ap.add_argument("--atrasados", action="store_true", help="inclui pedidos com entrega anterior ao dia")
+    ap.add_argument("--aleatorio", type=int, metavar="N", help="não usa o banco: N paradas sorteadas perto de Fortaleza")
+    args = ap.parse_args(argv)
+
+    if args.aleatorio:
+        rng = np.random.default_rng(1)
+        n = args.aleatorio
+        paradas = pd.DataFrame({
+            "pedido_id": np.arange(1, n + 1),
+            "codigo": [f"T{i:03d}" for i in range(1, n + 1)],
+            "cliente": [f"Cliente {i}" for i in range(1, n + 1)],
+            "endereco": "",
+            "etapa": "Montagem",
+            "latitude": -3.75 + rng.normal(0, 0.08, n),
+            "longitude": -38.53 + rng.normal(0, 0.08, n),
+        })
+    else:
+        etapas = [e.strip() for e in args.etapas.split(",") if e.strip()]
+        paradas = paradas_do_dia(args.dia, etapas, args.atrasados)
+
+    t = time.perf_counter()
+    rota = rota_das_paradas(paradas)
+    dt = time.perf_counter() - t
+    imprimir(rota)
+    print(f"{len(rota.paradas)} parada(s) em {dt * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
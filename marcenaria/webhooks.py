@@ -0,0 +1,248 @@
+# Entrega dos eventos de produção (producao_eventos) para webhooks (Make/WhatsApp).
+#
+# Uma Session com pool keep-alive, um pool de threads por endpoint (limita a
+# concorrência de cada um e impede que um endpoint lento segure os outros) e
+# retry com backoff exponencial + jitter. O lote inteiro tem um prazo
+# (WEBHOOK_PRAZO_LOTE_S): retry que não cabe nele fica para o próximo lote, em
+# vez de segurar os eventos travados no worker. A entrega é registrada por
+# endpoint (webhook_entregas): quando um falha, os que já aceitaram não recebem
+# o evento de novo. Serve de sink para o worker:
+#
+#   WEBHOOK_URLS=https://hook.make.com/xxx python -m marcenaria.worker --sink webhook
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import get_webhook_config
+from .data_access import dumps_safe
+from .db_connector import get_db_connection
+
+log = logging.getLogger("marcenaria.webhooks")
+
+# latências guardadas por endpoint para p50/p95 (as mais recentes)
+JANELA_LATENCIAS = 1000
+
+CAMPOS_PAYLOAD = [
+    "pedido_id",
+    "pedido_codigo",
+    "cliente_id",
+    "cliente_nome",
+    "cliente_whatsapp",
+    "etapa",
+    "status",
+    "responsavel_id",
+    "observacoes",
+    "created_at",
+]
+
+
+def montar_payload(ev: dict) -> str:
+    d = {"evento_id": ev.get("id")}
+    d.update({k: ev.get(k) for k in CAMPOS_PAYLOAD})
+    return dumps_safe(d)
+
+
+# =========================
+# MÉTRICAS
+# =========================
+class Metricas:
+    """Latência (últimas JANELA_LATENCIAS) e contadores por endpoint (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = {}
+        self.enviados = {}
+        self.falhas = {}
+        self.tentativas = {}
+
+    def registrar(self, url: str, latencia_s: float, ok: bool):
+        with self._lock:
+            self.latencias.setdefault(url, deque(maxlen=JANELA_LATENCIAS)).append(latencia_s)
+            self.tentativas[url] = self.tentativas.get(url, 0) + 1
+            if ok:
+                self.enviados[url] = self.enviados.get(url, 0) + 1
+
+    def falhou(self, url: str):
+        with self._lock:
+            self.falhas[url] = self.falhas.get(url, 0) + 1
+
+    def resumo(self) -> dict:
+        with self._lock:
+            out = {}
+            for url, lat in self.latencias.items():
+                ordenadas = sorted(lat)
+                out[url] = {
+                    "enviados": self.enviados.get(url, 0),
+                    "falhas": self.falhas.get(url, 0),
+                    "tentativas": self.tentativas.get(url, 0),
+                    "p50_ms": round(ordenadas[len(ordenadas) // 2] * 1000, 1),
+                    "p95_ms": round(ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))] * 1000, 1),
+                }
+            return out
+
+
+# =========================
+# SINK
+# =========================
+class WebhookSink:
+    def __init__(
+        self,
+        urls=None,
+        timeout=None,
+        max_tentativas=None,
+        backoff_ms=None,
+        backoff_max_ms=None,
+        concorrencia=None,
+        token=None,
+        prazo_lote_s=None,
+    ):
+        cfg = get_webhook_config()
+        self.urls = list(urls if urls is not None else cfg["urls"])
+        if not self.urls:
+            raise ValueError("Nenhum webhook configurado (WEBHOOK_URLS).")
+        self.timeout = timeout if timeout is not None else cfg["timeout"]
+        self.max_tentativas = max(1, max_tentativas if max_tentativas is not None else cfg["max_tentativas"])
+        self.backoff_s = (backoff_ms if backoff_ms is not None else cfg["backoff_ms"]) / 1000.0
+        self.backoff_max_s = (backoff_max_ms if backoff_max_ms is not None else cfg["backoff_max_ms"]) / 1000.0
+        self.concorrencia = max(1, concorrencia if concorrencia is not None else cfg["concorrencia"])
+        self.prazo_lote_s = float(prazo_lote_s if prazo_lote_s is not None else cfg["prazo_lote_s"])
+        token = token if token is not None else cfg["token"]
+
+        # conexões keep-alive reaproveitadas entre lotes
+        self.sessao = requests.Session()
+        # urls no mesmo host dividem o pool do urllib3: dimensiona para o total de threads
+        adapter = HTTPAdapter(pool_connections=len(self.urls), pool_maxsize=self.concorrencia * len(self.urls))
+        self.sessao.mount("http://", adapter)
+        self.sessao.mount("https://", adapter)
+        self.sessao.headers.update({"Content-Type": "application/json; charset=utf-8"})
+        if token:
+            self.sessao.headers["Authorization"] = f"Bearer {token}"
+
+        self._pools = {
+            url: ThreadPoolExecutor(max_workers=self.concorrencia, thread_name_prefix=f"webhook{i}")
+            for i, url in enumerate(self.urls)
+        }
+        self.metricas = Metricas()
+
+    def _espera(self, tentativa: int, retry_after=None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max_s)
+            except ValueError:
+                pass
+        # full jitter: uniforme entre 0 e base * 2^tentativa
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_s * (2 ** tentativa)))
+
+    def _postar(self, url: str, evento_id, corpo: bytes, limite: float):
+        erro = "prazo do lote esgotado antes do envio"
+        for tentativa in range(self.max_tentativas):
+            if time.monotonic() >= limite:
+                break
+            t0 = time.perf_counter()
+            retry_after = None
+            try:
+                r = self.sessao.post(
+                    url,
+                    data=corpo,
+                    timeout=self.timeout,
+                    headers={"Idempotency-Key": f"evento-{evento_id}"},
+                )
+                ok = r.status_code < 300
+                self.metricas.registrar(url, time.perf_counter() - t0, ok)
+                if ok:
+                    return None
+                erro = f"HTTP {r.status_code}"
+                # 4xx (exceto 408/429) não melhora com retry
+                if r.status_code < 500 and r.status_code not in (408, 429):
+                    break
+                retry_after = r.headers.get("Retry-After")
+            except requests.RequestException as e:
+                self.metricas.registrar(url, time.perf_counter() - t0, False)
+                erro = f"{e.__class__.__name__}: {e}"
+            if tentativa + 1 < self.max_tentativas:
+                espera = self._espera(tentativa, retry_after)
+                # a próxima tentativa não cabe no lote: fica para o próximo
+                if time.monotonic() + espera + self.timeout > limite:
+                    break
+                time.sleep(espera)
+
+        self.metricas.falhou(url)
+        return f"{url}: {erro}"
+
+    # -------------------------
+    # entregas por endpoint
+    # -------------------------
+    def _ja_entregues(self, ids) -> set:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT evento_id, url FROM bd_marcenaria.webhook_entregas WHERE evento_id = ANY(%s)",
+                    ([int(i) for i in ids],),
+                )
+                return {(int(e), u) for e, u in cur.fetchall() or []}
+
+    @staticmethod
+    def _registrar_entregas(parciais: list, completos: list):
+        """Grava os (evento, url) aceitos dos eventos que falharam em algum endpoint; limpa os que completaram."""
+        if not parciais and not completos:
+            return
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                if parciais:
+                    cur.execute("""
+                        INSERT INTO bd_marcenaria.webhook_entregas (evento_id, url)
+                        SELECT * FROM unnest(%s::int[], %s::text[])
+                        ON CONFLICT DO NOTHING
+                    """, ([e for e, _ in parciais], [u for _, u in parciais]))
+                if completos:
+                    cur.execute("DELETE FROM bd_marcenaria.webhook_entregas WHERE evento_id = ANY(%s)", (completos,))
+                conn.commit()
+
+    def enviar(self, eventos):
+        # cada evento vai para todos os endpoints que ainda não o aceitaram;
+        # só conta como entregue quando todos aceitaram
+        limite = time.monotonic() + self.prazo_lote_s
+        ja = self._ja_entregues([ev["id"] for ev in eventos])
+        futuros = []
+        for ev in eventos:
+            corpo = montar_payload(ev).encode("utf-8")
+            for url in self.urls:
+                if (int(ev["id"]), url) in ja:
+                    continue
+                futuros.append((ev["id"], url, self._pools[url].submit(self._postar, url, ev["id"], corpo, limite)))
+
+        # cada post para sozinho no prazo; a folga cobre o request em andamento
+        wait([f for _, _, f in futuros], timeout=self.prazo_lote_s + self.timeout + 1)
+
+        out = {ev["id"]: None for ev in eventos}
+        aceitos = []
+        for eid, url, fut in futuros:
+            erro = fut.result() if fut.done() else f"{url}: sem resposta no prazo do lote"
+            if erro:
+                out[eid] = erro if not out[eid] else f"{out[eid]} | {erro}"
+            else:
+                aceitos.append((int(eid), url))
+
+        com_falha = {int(eid) for eid, erro in out.items() if erro}
+        # completou agora um evento que tinha entrega parcial: o registro não serve mais
+        com_registro = {e for e, _ in ja}
+        completos = [int(ev["id"]) for ev in eventos if int(ev["id"]) not in com_falha and int(ev["id"]) in com_registro]
+        try:
+            self._registrar_entregas([a for a in aceitos if a[0] in com_falha], completos)
+        except Exception:
+            # sem o registro, o pior caso é reenviar (o Idempotency-Key cobre)
+            log.exception("falha ao registrar entregas por endpoint")
+
+        log.info("webhooks: %s", self.metricas.resumo())
+        return out
+
+    def fechar(self):
+        for pool in self._pools.values():
+            pool.shutdown(wait=True)
+        self.sessao.close()
@@ -0,0 +1,213 @@
+# Worker da fila de automação (producao_eventos).
+#
+#   python -m marcenaria.worker [--sink log|memoria|webhook|modulo:Classe] [--lote 50] [--uma-vez]
+#   python -m marcenaria.worker --reenfileirar     (devolve à fila os descartados)
+#
+# Vários workers podem rodar ao mesmo tempo: cada lote é reservado com
+# FOR UPDATE SKIP LOCKED, então um evento nunca é entregue por dois workers.
+# Evento que falha max_tentativas vezes é marcado `descartado` e sai da fila.
+import argparse
+import importlib
+import logging
+import time
+
+from psycopg2.extras import RealDictCursor
+
+from .db_connector import get_db_connection
+from .data_access import dumps_safe
+from .config import get_worker_config
+from .migrations import manutencao_particoes
+
+log = logging.getLogger("marcenaria.worker")
+
+# partições futuras + retenção de producao_eventos (ver migrations.manutencao_particoes)
+MANUTENCAO_A_CADA_S = 3600
+
+
+# =========================
+# SINKS
+# =========================
+# Contrato: enviar(eventos: list[dict]) -> {evento_id: None (ok) | "mensagem de erro"}
+# Evento que não aparecer no retorno conta como falha.
+class LogSink:
+    """Só escreve os eventos no log. Padrão quando nada é configurado."""
+
+    def enviar(self, eventos):
+        for ev in eventos:
+            log.info("evento %s", dumps_safe(ev))
+        return {ev["id"]: None for ev in eventos}
+
+
+class MemoriaSink:
+    """Guarda os eventos em memória. Para testes locais; `falhar` = ids que devem dar erro."""
+
+    def __init__(self, falhar=None):
+        self.recebidos = []
+        self.falhar = set(falhar or [])
+
+    def enviar(self, eventos):
+        out = {}
+        for ev in eventos:
+            if ev["id"] in self.falhar:
+                out[ev["id"]] = "falha simulada"
+                continue
+            self.recebidos.append(ev)
+            out[ev["id"]] = None
+        return out
+
+
+SINKS = {
+    "log": LogSink,
+    "memoria": MemoriaSink,
+}
+
+
+def carregar_sink(nome: str):
+    """`log`, `memoria`, `webhook` ou `pacote.modulo:Atributo` (classe é instanciada sem argumentos)."""
+    nome = (nome or "log").strip()
+    if nome in SINKS:
+        return SINKS[nome]()
+    if nome == "webhook":
+        from .webhooks import WebhookSink
+        return WebhookSink()
+    if ":" not in nome:
+        raise ValueError(f"Sink inválido: {nome}")
+    mod, attr = nome.split(":", 1)
+    obj = getattr(importlib.import_module(mod), attr)
+    return obj() if isinstance(obj, type) else obj
+
+
+# =========================
+# LOTE
+# =========================
+def processar_lote(sink, lote: int = 50, max_tentativas: int = 5) -> int:
+    """
+    Reserva até `lote` eventos pendentes, entrega ao sink e registra o resultado
+    na mesma transação. Retorna quantos eventos foram reservados.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # eventos que já esgotaram as tentativas (de antes do descartado, ou com limite menor agora)
+            cur.execute("""
+                UPDATE bd_marcenaria.producao_eventos
+                SET descartado=TRUE
+                WHERE processado = FALSE AND descartado = FALSE AND COALESCE(tentativas, 0) >= %s
+            """, (max_tentativas,))
+            cur.execute("""
+                SELECT e.*, p.codigo AS pedido_codigo
+                FROM bd_marcenaria.producao_eventos e
+                LEFT JOIN bd_marcenaria.pedidos p ON p.id = e.pedido_id
+                WHERE e.processado = FALSE
+                  AND e.descartado = FALSE
+                ORDER BY e.id
+                LIMIT %s
+                FOR UPDATE OF e SKIP LOCKED
+            """, (lote,))
+            eventos = [dict(r) for r in (cur.fetchall() or [])]
+            if not eventos:
+                conn.commit()
+                return 0
+
+            try:
+                resultado = sink.enviar(eventos) or {}
+            except Exception as e:
+                resultado = {ev["id"]: f"{e.__class__.__name__}: {e}" for ev in eventos}
+
+            ok_ids, erro_ids, erro_msgs = [], [], []
+            for ev in eventos:
+                if ev["id"] in resultado and resultado[ev["id"]] is None:
+                    ok_ids.append(ev["id"])
+                else:
+                    erro_ids.append(ev["id"])
+                    erro_msgs.append(str(resultado.get(ev["id"]) or "sem retorno do sink")[:500])
+
+            if ok_ids:
+                cur.execute("""
+                    UPDATE bd_marcenaria.producao_eventos
+                    SET processado=TRUE,
+                        tentativas=COALESCE(tentativas, 0) + 1,
+                        ultima_tentativa_em=CURRENT_TIMESTAMP,
+                        processado_em=CURRENT_TIMESTAMP,
+                        ultimo_erro=''
+                    WHERE id = ANY(%s)
+                """, (ok_ids,))
+
+            if erro_ids:
+                cur.execute("""
+                    UPDATE bd_marcenaria.producao_eventos e
+                    SET tentativas=COALESCE(e.tentativas, 0) + 1,
+                        ultima_tentativa_em=CURRENT_TIMESTAMP,
+                        ultimo_erro=v.erro,
+                        descartado=(COALESCE(e.tentativas, 0) + 1 >= %s)
+                    FROM unnest(%s::int[], %s::text[]) AS v(id, erro)
+                    WHERE e.id = v.id
+                    RETURNING e.id, e.descartado
+                """, (max_tentativas, erro_ids, erro_msgs))
+                descartados = [r["id"] for r in cur.fetchall() if r["descartado"]]
+                if descartados:
+                    log.warning("eventos descartados após %s tentativas: %s", max_tentativas, descartados)
+
+            conn.commit()
+            log.info("lote: %s entregues, %s com erro", len(ok_ids), len(erro_ids))
+            return len(eventos)
+
+
+def reenfileirar_descartados(ids=None) -> int:
+    """Devolve à fila os eventos descartados (todos ou só `ids`), com as tentativas zeradas."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE bd_marcenaria.producao_eventos
+                SET descartado=FALSE, tentativas=0
+                WHERE descartado AND processado = FALSE
+                  AND (%s::int[] IS NULL OR id = ANY(%s::int[]))
+            """, (ids, ids))
+            n = cur.rowcount
+            conn.commit()
+            return n
+
+
+def rodar(sink, lote: int = 50, intervalo: int = 5, max_tentativas: int = 5, uma_vez: bool = False):
+    # lote cheio: busca de novo na hora; lote parcial ou vazio: espera o intervalo
+    ultima_manutencao = None
+    while True:
+        if not uma_vez and (ultima_manutencao is None or time.monotonic() - ultima_manutencao > MANUTENCAO_A_CADA_S):
+            try:
+                removidas = manutencao_particoes()
+                if removidas:
+                    log.info("retenção: partições removidas %s", removidas)
+            except Exception:
+                log.exception("falha na manutenção das partições")
+            ultima_manutencao = time.monotonic()
+
+        n = processar_lote(sink, lote=lote, max_tentativas=max_tentativas)
+        if uma_vez:
+            return
+        if n < lote:
+            time.sleep(intervalo)
+
+
+def main(argv=None):
+    cfg = get_worker_config()
+    ap = argparse.ArgumentParser(prog="python -m marcenaria.worker", description="Worker da fila producao_eventos.")
+    ap.add_argument("--sink", default=cfg["sink"], help="log, memoria, webhook ou pacote.modulo:Classe")
+    ap.add_argument("--lote", type=int, default=cfg["lote"])
+    ap.add_argument("--intervalo", type=int, default=cfg["intervalo"], help="segundos de espera com a fila vazia")
+    ap.add_argument("--max-tentativas", type=int, default=cfg["max_tentativas"])
+    ap.add_argument("--uma-vez", action="store_true", help="processa um lote e sai")
+    ap.add_argument("--reenfileirar", action="store_true", help="devolve os eventos descartados à fila e sai")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.reenfileirar:
+        log.info("%s evento(s) devolvidos à fila", reenfileirar_descartados())
+        return
+    sink = carregar_sink(args.sink)
+    try:
+        rodar(sink, lote=args.lote, intervalo=args.intervalo, max_tentativas=args.max_tentativas, uma_vez=args.uma_vez)
+    except KeyboardInterrupt:
+        log.info("worker encerrado.")
+
+
+if __name__ == "__main__":
+    main()
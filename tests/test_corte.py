@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from marcenaria import corte
+from marcenaria.corte import SERRA_MM, Chapa, Peca, encaixar, sobreposicoes
+
+
+def _itens(seed: int, n: int = 40) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    return [
+        {"descricao": f"Peça {i}", "qtd": int(rng.integers(1, 4)), "largura_mm": float(rng.integers(150, 1200)),
+         "altura_mm": float(rng.integers(100, 800)), "espessura_mm": 15, "material": "MDF"}
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_plano_respeita_a_serra(seed):
+    for plano in corte.plano_de_corte(_itens(seed), orcamento_s=0.05):
+        for chapa in plano.chapas:
+            assert sobreposicoes(chapa, SERRA_MM) == 0
+            for x, y, w, h, _, _ in chapa.pecas:
+                assert x >= 0 and y >= 0 and x + w <= chapa.largura + 1e-6 and y + h <= chapa.altura + 1e-6
+
+
+def test_faixa_ao_lado_nao_inclui_o_corte_horizontal():
+    # depois de 300×200 com corte horizontal, a faixa da direita tem 200 de altura, não 204
+    dims = np.array([[300.0, 200.0], [100.0, 204.0]])
+    colocadas, _, _ = corte._passada(dims, 2750.0, 1840.0, SERRA_MM, False, "eixo_maior")
+    _, _, x, y, _, _, _ = colocadas[1]
+    assert (x, y) != (300.0 + SERRA_MM, 0.0)
+
+
+def test_faixa_acima_nao_inclui_o_corte_vertical():
+    # depois de 300×200 com corte vertical, a faixa de cima tem 300 de largura, não 304
+    dims = np.array([[300.0, 200.0], [304.0, 100.0]])
+    colocadas, _, _ = corte._passada(dims, 2750.0, 1840.0, SERRA_MM, False, "eixo_menor")
+    _, _, x, y, _, _, _ = colocadas[1]
+    assert (x, y) != (0.0, 200.0 + SERRA_MM)
+
+
+def test_sobreposicoes_conta_pecas_mais_perto_que_a_serra():
+    chapa = Chapa(1000.0, 1000.0, [(0.0, 0.0, 100.0, 100.0, "a", False), (102.0, 0.0, 100.0, 100.0, "b", False)])
+    assert sobreposicoes(chapa) == 0
+    assert sobreposicoes(chapa, 4.0) == 1
+    chapa.pecas[1] = (104.0, 0.0, 100.0, 100.0, "b", False)
+    assert sobreposicoes(chapa, 4.0) == 0
+
+
+def test_pecas_que_so_cabem_sem_serra_vao_para_chapas_diferentes():
+    plano = encaixar([Peca("a", 500.0, 1000.0), Peca("b", 500.0, 1000.0)], chapa=(1000.0, 1000.0), girar=False)
+    assert len(plano.chapas) == 2
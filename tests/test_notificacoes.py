@@ -0,0 +1,151 @@
+import socketserver
+import threading
+
+import pytest
+
+from marcenaria import notificacoes
+from marcenaria.notificacoes import SmtpTransporte
+
+
+class _Smtp(socketserver.StreamRequestHandler):
+    # SMTP mínimo: aceita `aceitar` mensagens por conexão e depois cai ("cai") ou para de responder ("trava")
+    def handle(self):
+        srv = self.server
+        self.wfile.write(b"220 teste\r\n")
+        aceitas = 0
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            cmd = linha.decode().strip().upper()
+            if cmd.startswith("DATA"):
+                self.wfile.write(b"354 manda\r\n")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                if aceitas >= srv.aceitar:
+                    if srv.modo == "trava":
+                        srv.liberar.wait(5)
+                    return
+                aceitas += 1
+                srv.recebidas += 1
+                self.wfile.write(b"250 ok\r\n")
+            elif cmd.startswith("RCPT") and any(r in cmd for r in srv.recusar):
+                self.wfile.write(b"550 nao existe\r\n")
+            elif cmd.startswith("QUIT"):
+                self.wfile.write(b"221 tchau\r\n")
+                return
+            else:
+                self.wfile.write(b"250 ok\r\n")
+
+
+class _Servidor(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@pytest.fixture
+def smtp():
+    srv = _Servidor(("127.0.0.1", 0), _Smtp)
+    srv.aceitar, srv.modo, srv.recusar, srv.recebidas = 99, "cai", (), 0
+    srv.liberar = threading.Event()
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.liberar.set()
+    srv.shutdown()
+    srv.server_close()
+
+
+def _transporte(srv, timeout=5):
+    host, port = srv.server_address
+    return SmtpTransporte({"host": host, "port": port, "timeout": timeout, "starttls": False,
+                           "user": "", "password": "", "from": "marcenaria@teste"})
+
+
+def _mensagens(n):
+    return [(f"d{i}@teste", f"assunto {i}", "corpo") for i in range(n)]
+
+
+def test_lote_inteiro(smtp):
+    assert _transporte(smtp).enviar_lote(_mensagens(3)) == [None, None, None]
+    assert smtp.recebidas == 3
+
+
+def test_conexao_cai_no_meio_do_lote(smtp):
+    smtp.aceitar = 1
+    out = _transporte(smtp).enviar_lote(_mensagens(3))
+    assert out[0] is None
+    assert all(out[1:]) and len(out) == 3
+    assert smtp.recebidas == 1
+
+
+def test_timeout_no_meio_do_lote(smtp):
+    smtp.aceitar, smtp.modo = 1, "trava"
+    out = _transporte(smtp, timeout=1).enviar_lote(_mensagens(3))
+    assert out[0] is None
+    assert all(out[1:]) and len(out) == 3
+
+
+def test_destinatario_recusado_nao_para_o_lote(smtp):
+    smtp.recusar = ("D1@TESTE",)
+    out = _transporte(smtp).enviar_lote(_mensagens(3))
+    assert out[0] is None and out[1] and out[2] is None
+
+
+@pytest.fixture
+def outbox():
+    try:
+        from marcenaria.db_connector import get_db_connection
+
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM bd_marcenaria.notificacoes_outbox LIMIT 1")
+    except Exception as e:
+        pytest.skip(f"sem banco: {e}")
+    # destinatários que ordenam antes de qualquer e-mail real: o lote pega só estes
+    dests = ["0-teste-a@teste", "0-teste-b@teste", "0-teste-c@teste"]
+    yield dests
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM bd_marcenaria.notificacoes_outbox WHERE destinatario = ANY(%s)", (dests,))
+            conn.commit()
+
+
+def _estado(dests):
+    from marcenaria.db_connector import get_db_connection
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT destinatario, enviado, descartado, tentativas
+                FROM bd_marcenaria.notificacoes_outbox
+                WHERE destinatario = ANY(%s)
+                ORDER BY destinatario
+            """, (dests,))
+            return cur.fetchall()
+
+
+def test_enviar_pendentes_marca_o_que_saiu_antes_da_falha(smtp, outbox):
+    from marcenaria.db_connector import get_db_connection
+
+    for d in outbox:
+        notificacoes.enfileirar("teste", "assunto", "corpo", destinatarios=[d])
+    smtp.aceitar = 1
+
+    assert notificacoes.enviar_pendentes(_transporte(smtp), max_tentativas=1, limite=3) == 1
+    assert _estado(outbox) == [
+        ("0-teste-a@teste", True, False, 1),
+        ("0-teste-b@teste", False, True, 1),
+        ("0-teste-c@teste", False, True, 1),
+    ]
+
+    # descartado sai da fila até ser devolvido
+    assert notificacoes.enviar_pendentes(_transporte(smtp), max_tentativas=1, limite=3) == 0
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM bd_marcenaria.notificacoes_outbox WHERE destinatario = ANY(%s) AND descartado",
+                        (outbox,))
+            ids = [r[0] for r in cur.fetchall()]
+    assert notificacoes.reenviar_descartados(ids) == 2
+    smtp.aceitar = 99
+    assert notificacoes.enviar_pendentes(_transporte(smtp), max_tentativas=1, limite=3) == 2
+    assert all(enviado for _, enviado, _, _ in _estado(outbox))